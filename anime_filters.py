@@ -1,31 +1,74 @@
+import os
+import time
 import cv2
 import numpy as np
+import smoothing
+import tiling
+from buffers import get_buffer, output_buffer
+from profiler import PROFILER
 from abc import ABC, abstractmethod
 
-def get_filter(config):
-    if config.anime_style == 1:
-        return KawaiiAnimeFilter()
-    if config.anime_style == 2:
-        return CartoonAnimeFilter()
+FACE_CASCADE_FILE = 'haarcascade_frontalface_default.xml'
+
+_face_cascade = None
+_face_cascade_loaded = False
+
+def load_face_cascade():
+    """Загружает каскад Хаара один раз и переиспользует его во всех фильтрах"""
+    global _face_cascade, _face_cascade_loaded
+    if not _face_cascade_loaded:
+        _face_cascade_loaded = True
+        try:
+            _face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + FACE_CASCADE_FILE)
+        except:
+            _face_cascade = None
+            print("Предупреждение: Не удалось загрузить детектор лиц")
+    return _face_cascade
+
 
 class BaseAnimeFilter(ABC):
     """Абстрактный базовый класс для аниме-фильтров"""
 
     @abstractmethod
-    def apply(self, frame):
-        """Применяет фильтр к кадру"""
+    def apply(self, frame, dst=None):
+        """
+        Применяет фильтр к кадру
+
+        Args:
+            frame: Кадр BGR
+            dst: Массив для результата той же формы (None - создать новый)
+        """
         pass
 
     def process_frame(self, frame):
         """Основной метод обработки кадра"""
         return self.apply(frame)
 
+    def reset(self, frame_number=0):
+        """Сбрасывает состояние, накопленное между кадрами (номер следующего кадра)"""
+        pass
+
+    def halo(self):
+        """
+        Сколько соседних строк нужно фильтру для расчета одной строки
+
+        None - фильтр нельзя применять к полосам кадра независимо.
+        """
+        return None
+
+    def apply_tiled(self, frame, workers, dst=None):
+        """Применяет фильтр по горизонтальным полосам в нескольких потоках"""
+        halo = self.halo()
+        if halo is None or workers <= 1:
+            return self.apply(frame, dst=dst)
+        return tiling.run_striped(self.apply, frame, halo, workers, dst)
+
 
 class SimpleAnimeFilter(BaseAnimeFilter):
     """Простой аниме-фильтр с настройками"""
 
     def __init__(self, saturation=1.5, brightness=1.1, posterize_levels=8,
-                 edge_strength=0.3, blur_radius=3):
+                 edge_strength=0.3, blur_radius=3, smoothing_mode="bilateral"):
         """
         Инициализация фильтра
 
@@ -35,118 +78,353 @@ class SimpleAnimeFilter(BaseAnimeFilter):
             posterize_levels: Уровни постеризации
             edge_strength: Сила выделения краев (0-1)
             blur_radius: Радиус размытия для сглаживания
+            smoothing_mode: Способ сглаживания (см. smoothing.SMOOTHERS):
+                            bilateral, guided, domain или proxy
         """
         self.saturation = saturation
         self.brightness = brightness
         self.posterize_levels = max(2, posterize_levels)
         self.edge_strength = edge_strength
         self.blur_radius = blur_radius
+        self.smoothing_mode = smoothing_mode
 
-    def apply(self, frame):
-        # Копируем кадр
-        result = frame.copy()
-
-        # 1. Настройка насыщенности и яркости
-        if self.saturation != 1.0 or self.brightness != 1.0:
-            hsv = cv2.cvtColor(result, cv2.COLOR_BGR2HSV)
-            hsv = hsv.astype(np.float32)
-            hsv[:, :, 1] = np.clip(hsv[:, :, 1] * self.saturation, 0, 255)
-            hsv[:, :, 2] = np.clip(hsv[:, :, 2] * self.brightness, 0, 255)
-            hsv = np.clip(hsv, 0, 255).astype(np.uint8)
-            result = cv2.cvtColor(hsv, cv2.COLOR_HSV2BGR)
-
-        # 2. Постеризация (упрощение цветов)
-        if self.posterize_levels < 256:
-            div = 256 // self.posterize_levels
-            posterized = (result // div) * div + div // 2
-            # Смешиваем с оригиналом для плавности
-            alpha = 0.7
-            # Явно конвертируем в float32 для умножения
-            posterized_f = posterized.astype(np.float32)
-            result_f = result.astype(np.float32)
-            blended = cv2.addWeighted(posterized_f, alpha, result_f, 1 - alpha, 0)
-            result = np.clip(blended, 0, 255).astype(np.uint8)
+        # Таблицы поиска и параметры, для которых они построены
+        self._tables = None
+        self._tables_key = None
 
-        # 3. Выделение краев (аниме-контуры)
-        if self.edge_strength > 0:
-            gray = cv2.cvtColor(result, cv2.COLOR_BGR2GRAY)
+    def apply(self, frame, dst=None):
+        hsv_lut, posterize_lut, edge_lut, edge_limit = self.get_tables()
+        h, w = frame.shape[:2]
 
-            # Разные методы выделения краев
-            edges1 = cv2.Sobel(gray, cv2.CV_64F, 1, 0, ksize=3)
-            edges2 = cv2.Sobel(gray, cv2.CV_64F, 0, 1, ksize=3)
-            edges = np.sqrt(edges1 ** 2 + edges2 ** 2)
-            edges = np.uint8(np.clip(edges * self.edge_strength * 10, 0, 255))
+        # Промежуточные кадры - из пула буферов, цвет меняется на месте
+        color = get_buffer("anime_color", frame.shape)
 
-            # Инвертируем и делаем белые контуры на черном фоне
-            edges = 255 - edges
-            edges_color = cv2.cvtColor(edges, cv2.COLOR_GRAY2BGR)
+        # 1. Настройка насыщенности и яркости (по таблице для каналов S и V)
+        result = frame
+        if hsv_lut is not None:
+            hsv = cv2.cvtColor(result, cv2.COLOR_BGR2HSV, dst=get_buffer("anime_hsv", frame.shape))
+            cv2.LUT(hsv, hsv_lut, dst=hsv)
+            result = cv2.cvtColor(hsv, cv2.COLOR_HSV2BGR, dst=color)
 
-            # Наложение контуров (темный режим - умножение)
-            # Явно указываем тип выходного массива
-            result_f = result.astype(np.float32)
-            edges_f = edges_color.astype(np.float32) / 255.0
+        # 2. Постеризация (упрощение цветов), смешанная с оригиналом
+        if posterize_lut is not None:
+            result = cv2.LUT(result, posterize_lut, dst=color)
+
+        # 3. Выделение краев (аниме-контуры)
+        if edge_lut is not None:
+            gray = cv2.cvtColor(result, cv2.COLOR_BGR2GRAY, dst=get_buffer("anime_gray", (h, w)))
+
+            # Целочисленные градиенты; модуль берется из таблицы по (|gx|, |gy|)
+            gx = cv2.Sobel(gray, cv2.CV_16S, 1, 0, dst=get_buffer("anime_gx", (h, w), np.int16), ksize=3)
+            gy = cv2.Sobel(gray, cv2.CV_16S, 0, 1, dst=get_buffer("anime_gy", (h, w), np.int16), ksize=3)
+            np.minimum(np.abs(gx, out=gx), edge_limit, out=gx)
+            np.minimum(np.abs(gy, out=gy), edge_limit, out=gy)
+            # Смешанные типы в ufunc дают временный буфер приведения, поэтому
+            # int16 -> intp переводится отдельным копированием
+            index = get_buffer("anime_edge_index", (h, w), np.intp)
+            np.copyto(index, gx)
+            index *= edge_limit + 1
+            gy_index = get_buffer("anime_edge_gy", (h, w), np.intp)
+            np.copyto(gy_index, gy)
+            index += gy_index
+
+            # Белый фон с темными контурами (mode="clip" - без временной копии)
+            edges = np.take(edge_lut, index, out=get_buffer("anime_edges", (h, w)), mode="clip")
+            edges_color = cv2.cvtColor(edges, cv2.COLOR_GRAY2BGR,
+                                       dst=get_buffer("anime_edges_color", frame.shape))
 
-            # Умножение с явным указанием типа
-            multiplied = cv2.multiply(result_f, edges_f)
-            result = np.clip(multiplied, 0, 255).astype(np.uint8)
+            # Наложение контуров (темный режим - умножение)
+            result = cv2.multiply(result, edges_color, dst=color, scale=1 / 255)
 
         # 4. Сглаживание (опционально)
+        output = output_buffer(dst, frame.shape, frame.dtype)
         if self.blur_radius > 0:
-            result = cv2.bilateralFilter(result,
-                                         d=self.blur_radius * 2 + 1,
-                                         sigmaColor=75,
-                                         sigmaSpace=75)
+            result = smoothing.smooth(result, self.smoothing_mode, self.blur_radius, dst=output)
+        else:
+            np.copyto(output, result)
+            result = output
 
         return result
 
+    def halo(self):
+        # Собель 3x3 + окно сглаживания
+        footprint = smoothing.footprint(self.smoothing_mode, self.blur_radius) if self.blur_radius > 0 else 0
+        return 1 + footprint
+
+    def get_tables(self):
+        """
+        Таблицы поиска для попиксельных преобразований
+
+        Пересчитываются только при изменении параметров фильтра.
+
+        Returns:
+            (hsv_lut, posterize_lut, edge_lut, edge_limit); None вместо
+            таблицы означает, что шаг отключен
+        """
+        key = (self.saturation, self.brightness, self.posterize_levels, self.edge_strength)
+        if key != self._tables_key:
+            self._tables = (
+                build_hsv_lut(self.saturation, self.brightness),
+                build_posterize_lut(self.posterize_levels),
+                *build_edge_lut(self.edge_strength),
+            )
+            self._tables_key = key
+        return self._tables
+
+
+def build_hsv_lut(saturation, brightness):
+    """Таблица HSV -> HSV с умножением S и V (как в расчете во float32)"""
+    if saturation == 1.0 and brightness == 1.0:
+        return None
+
+    values = np.arange(256, dtype=np.float32)
+    lut = np.empty((1, 256, 3), dtype=np.uint8)
+    lut[0, :, 0] = np.arange(256)
+    lut[0, :, 1] = np.clip(values * saturation, 0, 255).astype(np.uint8)
+    lut[0, :, 2] = np.clip(values * brightness, 0, 255).astype(np.uint8)
+    return lut
+
+
+def build_posterize_lut(posterize_levels, alpha=0.7):
+    """Таблица постеризации, смешанной с исходным значением с весом alpha"""
+    if posterize_levels >= 256:
+        return None
+
+    values = np.arange(256, dtype=np.uint8)
+    div = 256 // posterize_levels
+    posterized = (values // div) * div + div // 2
+    # Те же операции, что и над кадром, но над 256 возможными значениями
+    blended = cv2.addWeighted(posterized.astype(np.float32), alpha,
+                              values.astype(np.float32), 1 - alpha, 0)
+    return np.clip(blended, 0, 255).astype(np.uint8)
+
+
+def build_edge_lut(edge_strength):
+    """
+    Таблица "модули градиентов (|gx|, |gy|) -> яркость контура"
+
+    Модули ограничиваются порогом edge_limit: дальше контур все равно
+    насыщен, а максимум оператора Собеля 3x3 равен 4 * 255.
+
+    Returns:
+        (таблица размера (edge_limit + 1) ** 2, edge_limit)
+    """
+    if edge_strength <= 0:
+        return None, 0
+
+    gain = edge_strength * 10
+    edge_limit = min(4 * 255, int(np.ceil(255 / gain)))
+
+    values = np.arange(edge_limit + 1, dtype=np.float64)
+    magnitude = np.sqrt(values[:, None] ** 2 + values[None, :] ** 2)
+    edges = np.uint8(np.clip(magnitude * gain, 0, 255))
+    return (255 - edges).ravel(), edge_limit
+
+
+class FaceTracker:
+    """
+    Детекция лиц раз в несколько кадров и сопровождение между детекциями
+
+    Каскад запускается на уменьшенном кадре каждые detect_interval кадров
+    или сразу, как только уверенность сопровождения падает. Между
+    детекциями рамки сдвигаются поиском шаблона лица в окрестности
+    прошлой позиции и сглаживаются экспоненциальным средним.
+    """
+
+    def __init__(self, face_cascade, detect_interval=5, detect_scale=0.5,
+                 smoothing=0.5, min_confidence=0.6, reset_interval=0):
+        """
+        Args:
+            face_cascade: Каскад Хаара для детекции
+            detect_interval: Детекция каждые N кадров (1 - на каждом кадре)
+            detect_scale: Масштаб кадра для детекции и сопровождения (0-1]
+            smoothing: Вес нового положения рамки (1.0 - без сглаживания)
+            min_confidence: Порог корреляции шаблона, ниже которого
+                            запускается повторная детекция
+            reset_interval: Каждые N кадров (по номеру кадра) лица
+                            забываются и сглаживание начинается заново
+                            (0 - никогда); округляется до кратного
+                            detect_interval, чтобы сброс совпадал с детекцией
+        """
+        self.face_cascade = face_cascade
+        self.detect_interval = max(1, int(detect_interval))
+        self.detect_scale = min(1.0, max(0.1, detect_scale))
+        self.smoothing = smoothing
+        self.min_confidence = min_confidence
+        self.reset_interval = -(-max(0, int(reset_interval)) // self.detect_interval) * self.detect_interval
+
+        self.frame_number = 0
+        # Каждое лицо: [рамка в масштабе детекции (float), шаблон]
+        self.tracks = []
+
+    def reset(self, frame_number=0):
+        """Забывает лица; frame_number задает фазу расписания детекций"""
+        self.frame_number = frame_number
+        self.tracks = []
+
+    def update(self, gray):
+        """Возвращает рамки лиц (x, y, w, h) в координатах полного кадра"""
+        small = gray
+        if self.detect_scale < 1.0:
+            h, w = gray.shape[:2]
+            small_shape = (max(1, int(round(h * self.detect_scale))), max(1, int(round(w * self.detect_scale))))
+            small = cv2.resize(gray, small_shape[::-1], dst=get_buffer("faces_small", small_shape),
+                               interpolation=cv2.INTER_AREA)
+
+        need_detect = self.frame_number % self.detect_interval == 0
+        if self.reset_interval and self.frame_number % self.reset_interval == 0:
+            # После сброса состояние зависит только от кадров начиная с этого
+            self.tracks = []
+        self.frame_number += 1
+
+        if not need_detect:
+            need_detect = not self._track(small)
+        if need_detect:
+            self._detect(small)
+
+        scale = 1.0 / self.detect_scale
+        return [tuple(int(round(v * scale)) for v in box) for box, _ in self.tracks]
+
+    def _detect(self, small):
+        min_size = max(8, int(round(30 * self.detect_scale)))
+        faces = self.face_cascade.detectMultiScale(
+            small, scaleFactor=1.1, minNeighbors=5,
+            minSize=(min_size, min_size)
+        )
+
+        tracks = []
+        for face in faces:
+            box = np.asarray(face, dtype=np.float32)
+            # Продолжаем сглаживание для уже известного лица
+            previous = max(self.tracks, key=lambda track: box_iou(track[0], box), default=None)
+            if previous is not None and box_iou(previous[0], box) > 0.3:
+                box = previous[0] + self.smoothing * (box - previous[0])
+            tracks.append([box, self._template(small, box)])
+        self.tracks = tracks
+
+    def _track(self, small):
+        """Сдвигает рамки по шаблонам; False, если какое-то лицо потеряно"""
+        h, w = small.shape[:2]
+        for track in self.tracks:
+            box, template = track
+            th, tw = template.shape[:2]
+            if th == 0 or tw == 0:
+                return False
+
+            # Окно поиска - рамка, расширенная на половину размера
+            x0 = max(0, int(box[0] - tw / 2))
+            y0 = max(0, int(box[1] - th / 2))
+            x1 = min(w, int(box[0] + box[2] + tw / 2))
+            y1 = min(h, int(box[1] + box[3] + th / 2))
+            if x1 - x0 < tw or y1 - y0 < th:
+                return False
+
+            scores = cv2.matchTemplate(small[y0:y1, x0:x1], template, cv2.TM_CCOEFF_NORMED)
+            _, confidence, _, (dx, dy) = cv2.minMaxLoc(scores)
+            if confidence < self.min_confidence:
+                return False
+
+            target = np.array([x0 + dx, y0 + dy, box[2], box[3]], dtype=np.float32)
+            track[0] = box + self.smoothing * (target - box)
+        return True
+
+    @staticmethod
+    def _template(small, box):
+        x, y, w, h = (int(round(v)) for v in box)
+        return small[max(0, y):y + h, max(0, x):x + w].copy()
+
+
+def box_iou(a, b):
+    """Отношение площади пересечения рамок (x, y, w, h) к площади объединения"""
+    x0, y0 = max(a[0], b[0]), max(a[1], b[1])
+    x1, y1 = min(a[0] + a[2], b[0] + b[2]), min(a[1] + a[3], b[1] + b[3])
+    inter = max(0.0, x1 - x0) * max(0.0, y1 - y0)
+    union = a[2] * a[3] + b[2] * b[3] - inter
+    return inter / union if union > 0 else 0.0
+
 
 class KawaiiAnimeFilter(SimpleAnimeFilter):
     """Кавайный аниме-фильтр с эффектами для лиц"""
 
-    def __init__(self, **kwargs):
+    def __init__(self, face_detect_interval=1, face_detect_scale=1.0, face_track_reset_interval=0, **kwargs):
+        """
+        Args:
+            face_detect_interval: Детекция лиц каждые N кадров, между ними -
+                                  сопровождение (1 - детекция на каждом кадре)
+            face_detect_scale: Масштаб кадра для детекции лиц
+            face_track_reset_interval: Сброс сопровождения лиц каждые N кадров
+                                       (0 - никогда, см. FaceTracker)
+            **kwargs: Параметры SimpleAnimeFilter
+        """
         super().__init__(**kwargs)
         # Инициализация детектора лиц
-        try:
-            self.face_cascade = cv2.CascadeClassifier(
-                cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
-            )
-        except:
-            self.face_cascade = None
-            print("Предупреждение: Не удалось загрузить детектор лиц")
+        self.face_cascade = load_face_cascade()
+        self.face_tracker = None
+        if self.face_cascade is not None:
+            self.face_tracker = FaceTracker(self.face_cascade,
+                                            detect_interval=face_detect_interval,
+                                            detect_scale=face_detect_scale,
+                                            reset_interval=face_track_reset_interval)
 
         # Параметры эффектов
         self.blush_color = (180, 105, 255)  # Розовый (BGR)
         self.eye_scale = 1.2  # Увеличение глаз
 
-    def apply_face_effects(self, frame, faces):
-        """Добавляет аниме-эффекты к лицам"""
-        result = frame.copy()
+        # Временный буфер румянца и статистика стоимости эффектов
+        self._blush_buffer = np.zeros((0, 0, 3), dtype=np.uint8)
+        self.face_effect_faces = 0
+        self.face_effect_time = 0.0
+
+    def apply_face_effects(self, frame, faces, inplace=False, dst=None):
+        """
+        Добавляет аниме-эффекты к лицам
+
+        Румянец рисуется и смешивается только в пределах своей рамки
+        во временном буфере, который переиспользуется между лицами и кадрами.
+
+        Args:
+            frame: Кадр BGR
+            faces: Рамки лиц (x, y, w, h)
+            inplace: Рисовать прямо в frame, не копируя его
+            dst: Куда скопировать кадр, если inplace=False (None - новый массив)
+        """
+        if inplace:
+            result = frame
+        else:
+            result = output_buffer(dst, frame.shape, frame.dtype)
+            np.copyto(result, frame)
         h, w = frame.shape[:2]
+        start = time.perf_counter()
 
         for (x, y, width, height) in faces:
             # 1. Румянец (делаем более прозрачным)
             cheek_w = width // 4
             cheek_h = height // 8
             cheek_y = y + height // 2
-
-            # Создаем маску для румянца
-            blush_mask = np.zeros((h, w, 3), dtype=np.uint8)
-
-            # Левый румянец
-            cv2.ellipse(blush_mask,
-                        (x + width // 4, cheek_y),
-                        (cheek_w, cheek_h), 0, 0, 360,
-                        self.blush_color, -1, cv2.LINE_AA)
-
-            # Правый румянец
-            cv2.ellipse(blush_mask,
-                        (x + width * 3 // 4, cheek_y),
-                        (cheek_w, cheek_h), 0, 0, 360,
-                        self.blush_color, -1, cv2.LINE_AA)
-
-            # Смешиваем с оригиналом
-            alpha = 0.3  # Прозрачность румянца
-            result = cv2.addWeighted(result, 1.0, blush_mask, alpha, 0)
+            cheeks = ((x + width // 4, cheek_y), (x + width * 3 // 4, cheek_y))
+
+            # Рамка обоих эллипсов с запасом на сглаживание, обрезанная кадром
+            x0 = max(0, cheeks[0][0] - cheek_w - 2)
+            x1 = min(w, cheeks[1][0] + cheek_w + 3)
+            y0 = max(0, cheek_y - cheek_h - 2)
+            y1 = min(h, cheek_y + cheek_h + 3)
+
+            if x0 < x1 and y0 < y1:
+                # Маска румянца только для рамки
+                blush_mask = self._get_blush_buffer(y1 - y0, x1 - x0)
+
+                # Левый и правый румянец
+                for center_x, center_y in cheeks:
+                    cv2.ellipse(blush_mask,
+                                (center_x - x0, center_y - y0),
+                                (cheek_w, cheek_h), 0, 0, 360,
+                                self.blush_color, -1, cv2.LINE_AA)
+
+                # Смешиваем с оригиналом (вне эллипсов маска нулевая,
+                # поэтому результат совпадает со смешиванием всего кадра)
+                alpha = 0.3  # Прозрачность румянца
+                roi = result[y0:y1, x0:x1]
+                cv2.addWeighted(roi, 1.0, blush_mask, alpha, 0, dst=roi)
 
             # 2. Блеск в глазах
             eye_y = y + height // 3
@@ -168,22 +446,57 @@ class KawaiiAnimeFilter(SimpleAnimeFilter):
                        (x + width * 2 // 3, eye_y),
                        eye_radius, (0, 0, 0), 1, cv2.LINE_AA)  # Обводка
 
+        if len(faces) > 0:
+            self.face_effect_faces += len(faces)
+            self.face_effect_time += time.perf_counter() - start
+
         return result
 
-    def apply(self, frame):
+    def _get_blush_buffer(self, height, width):
+        """Обнуленный временный буфер для маски румянца (растет по мере надобности)"""
+        buffer_h, buffer_w = self._blush_buffer.shape[:2]
+        if buffer_h < height or buffer_w < width:
+            self._blush_buffer = np.zeros((max(buffer_h, height), max(buffer_w, width), 3),
+                                          dtype=np.uint8)
+        blush_mask = self._blush_buffer[:height, :width]
+        blush_mask[:] = 0
+        return blush_mask
+
+    def face_effect_stats(self):
+        """Средняя стоимость эффектов на одно лицо"""
+        faces = self.face_effect_faces
+        return {
+            "faces": faces,
+            "ms_per_face": self.face_effect_time / faces * 1000 if faces else 0.0,
+        }
+
+    def apply(self, frame, dst=None):
         # Сначала применяем базовый фильтр
-        result = super().apply(frame)
+        result = super().apply(frame, dst=dst)
 
         # Затем добавляем эффекты для лиц
-        if self.face_cascade is not None:
-            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-            faces = self.face_cascade.detectMultiScale(
-                gray, scaleFactor=1.1, minNeighbors=5,
-                minSize=(30, 30)
-            )
+        return self.add_faces(frame, result)
+
+    def reset(self, frame_number=0):
+        if self.face_tracker is not None:
+            self.face_tracker.reset(frame_number)
+
+    def apply_tiled(self, frame, workers, dst=None):
+        # Базовый фильтр делится на полосы, а лица ищутся по всему кадру
+        result = tiling.run_striped(super().apply, frame, self.halo(), workers, dst)
+        return self.add_faces(frame, result)
+
+    def add_faces(self, frame, result):
+        """Находит лица на исходном кадре и рисует эффекты на результате"""
+        if self.face_tracker is not None:
+            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY,
+                                dst=get_buffer("faces_gray", frame.shape[:2]))
+            faces = self.face_tracker.update(gray)
 
             if len(faces) > 0:
-                result = self.apply_face_effects(result, faces)
+                result = self.apply_face_effects(result, faces, inplace=True)
+                if PROFILER.enabled:
+                    PROFILER.set_gauge("face_ms", f"{self.face_effect_stats()['ms_per_face']:.2f} мс/лицо")
 
         return result
 
@@ -195,97 +508,258 @@ class CartoonAnimeFilter(BaseAnimeFilter):
         self.num_color_levels = num_color_levels
         self.edge_threshold = edge_threshold
 
-    def apply(self, frame):
-        # 1. Упрощение цветов
-        div = 256 // self.num_color_levels
-        quantized = (frame // div) * div
+        # Таблица квантования и число уровней, для которого она построена
+        self._table = None
+        self._table_key = None
+
+    def apply(self, frame, dst=None):
+        h, w = frame.shape[:2]
+
+        # 1. Упрощение цветов (таблица уже учитывает итоговое умножение на 255)
+        quantized = cv2.LUT(frame, self.get_table(), dst=get_buffer("cartoon_quantized", frame.shape))
 
         # 2. Выделение краев
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        gray = cv2.medianBlur(gray, 7)
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=get_buffer("cartoon_gray", (h, w)))
+        gray = cv2.medianBlur(gray, 7, dst=get_buffer("cartoon_blur", (h, w)))
         edges = cv2.adaptiveThreshold(
             gray, 255, cv2.ADAPTIVE_THRESH_MEAN_C,
-            cv2.THRESH_BINARY, 9, self.edge_threshold
+            cv2.THRESH_BINARY, 9, self.edge_threshold,
+            dst=get_buffer("cartoon_edges", (h, w))
         )
 
-        # 3. Преобразуем края в цветное изображение
-        edges_color = cv2.cvtColor(edges, cv2.COLOR_GRAY2BGR)
+        # 3. Края бинарные (0 или 255), поэтому умножение на них -
+        # это просто маска; вне маски bitwise_and не пишет в dst
+        cartoon = output_buffer(dst, frame.shape, frame.dtype)
+        cartoon.fill(0)
+        cv2.bitwise_and(quantized, quantized, dst=cartoon, mask=edges)
 
-        # 4. Объединяем с квантованным изображением (умножение)
-        # Явно конвертируем в float32
-        quantized_f = quantized.astype(np.float32) / 255.0
-        edges_f = edges_color.astype(np.float32) / 255.0
+        return cartoon
 
-        cartoon = cv2.multiply(quantized_f, edges_f)
-        cartoon = np.clip(cartoon * 255, 0, 255).astype(np.uint8)
+    def halo(self):
+        # Медианный фильтр 7x7 + адаптивный порог с окном 9x9
+        return 3 + 4
 
-        return cartoon
+    def get_table(self):
+        """Таблица квантования (пересчитывается при смене числа уровней)"""
+        if self.num_color_levels != self._table_key:
+            values = np.arange(256, dtype=np.uint8)
+            div = 256 // self.num_color_levels
+            quantized = (values // div) * div
+            # Повторяем исходный расчет во float32, включая округление
+            quantized_f = quantized.astype(np.float32) / 255.0
+            self._table = np.clip(quantized_f * 255, 0, 255).astype(np.uint8)
+            self._table_key = self.num_color_levels
+        return self._table
 
 
 class MaskAnimeFilter(BaseAnimeFilter):
-    """Фильтр с применением внешней PNG-маски"""
+    """
+    Фильтр с применением внешней маски
+
+    Маска - PNG с альфа-каналом или .npy: кадр (H, W, C) либо
+    анимация (N, H, W, C), открываемая через отображение в память.
+    Несколько масок накладываются друг на друга. Альфа маски под размер
+    кадра и ее рамка кэшируются, а фильтр и смешивание считаются только
+    внутри рамки ненулевой альфы.
+    """
+
+    # Сколько кадров анимации держать в кэше альфы
+    MAX_CACHED_ALPHAS = 256
 
     def __init__(self, mask_path, filter_strength=1.0):
         """
         Инициализация фильтра с маской
 
         Args:
-            mask_path: Путь к PNG-маске (с альфа-каналом)
+            mask_path: Путь к маске (PNG или .npy) или список путей
+                       (маски в порядке наложения)
             filter_strength: Сила применения фильтра (0-1)
         """
-        self.mask = self.load_mask(mask_path)
+        paths = [mask_path] if isinstance(mask_path, (str, os.PathLike)) else list(mask_path)
+        self.masks = [self.load_mask(path) for path in paths]
+        self.mask = self.masks[0][0]
         self.filter_strength = max(0.0, min(1.0, filter_strength))
         self.base_filter = SimpleAnimeFilter()
+        self.frame_number = 0
+
+        # Альфа по кадрам анимации для текущих размера кадра и силы фильтра
+        self._alphas = {}
+        self._alphas_key = None
 
     def load_mask(self, mask_path):
-        """Загружает PNG-маску с альфа-каналом"""
-        mask = cv2.imread(mask_path, cv2.IMREAD_UNCHANGED)
+        """
+        Загружает маску один раз
+
+        Returns:
+            Массив (кадры, H, W, C); .npy не читается целиком, а
+            отображается в память
+        """
+        if str(mask_path).endswith(".npy"):
+            try:
+                mask = np.load(mask_path, mmap_mode="r")
+            except FileNotFoundError:
+                raise FileNotFoundError(f"Маска не найдена: {mask_path}")
+            if mask.ndim == 2:
+                mask = mask[:, :, None]
+            if mask.ndim == 3:
+                mask = mask[None]
+            return mask
+
+        mask = cv2.imread(str(mask_path), cv2.IMREAD_UNCHANGED)
 
         if mask is None:
             raise FileNotFoundError(f"Маска не найдена: {mask_path}")
+        if mask.ndim == 2:
+            mask = mask[:, :, None]
+        return mask[None]
 
-        # Если маска без альфа-канала, создаем его
-        if mask.shape[2] == 3:
-            # Создаем альфа-канал из яркости
-            gray = cv2.cvtColor(mask, cv2.COLOR_BGR2GRAY)
-            mask = cv2.cvtColor(gray, cv2.COLOR_GRAY2BGRA)
-            mask[:, :, 3] = gray  # Альфа-канал = яркость
-
-        return mask
+    def reset(self, frame_number=0):
+        self.frame_number = frame_number
 
-    def apply(self, frame):
-        # Применяем базовый фильтр
-        filtered = self.base_filter.apply(frame)
+    def get_alpha(self, height, width):
+        """
+        Альфа текущего кадра анимации в фиксированной точке
 
-        # Изменяем размер маски под кадр
+        Returns:
+            (рамка (x, y, w, h), alpha, 256 - alpha) - массивы uint16
+            размера рамки со значениями 0..256, уже умноженные на силу
+            фильтра; (None, None, None), если маска пуста
+        """
+        key = (height, width, self.filter_strength)
+        if key != self._alphas_key or len(self._alphas) >= self.MAX_CACHED_ALPHAS:
+            self._alphas = {}
+            self._alphas_key = key
+
+        indices = tuple(self.frame_number % len(mask) for mask in self.masks)
+        cached = self._alphas.get(indices)
+        if cached is None:
+            # Наложение масок: прозрачность итога - произведение прозрачностей
+            transparency = np.ones((height, width), dtype=np.float32)
+            for mask, index in zip(self.masks, indices):
+                alpha = cv2.resize(mask_alpha(mask[index]), (width, height))
+                transparency *= 1 - alpha.astype(np.float32) / 255
+
+            fixed = np.rint((1 - transparency) * self.filter_strength * 256).astype(np.uint16)
+            x, y, w, h = cv2.boundingRect((fixed > 0).view(np.uint8))
+            if w == 0 or h == 0:
+                cached = (None, None, None)
+            else:
+                alpha = fixed[y:y + h, x:x + w, None].copy()
+                cached = ((x, y, w, h), alpha, 256 - alpha)
+            self._alphas[indices] = cached
+        return cached
+
+    def apply(self, frame, dst=None):
+        return self._apply(frame, dst, self.base_filter.apply)
+
+    def apply_tiled(self, frame, workers, dst=None):
+        # Маска растягивается на весь кадр, поэтому на полосы делится
+        # только базовый фильтр
+        return self._apply(frame, dst, lambda region, dst=None:
+                           self.base_filter.apply_tiled(region, workers, dst=dst))
+
+    def _apply(self, frame, dst, base_apply):
         h, w = frame.shape[:2]
-        mask_resized = cv2.resize(self.mask, (w, h))
-
-        # Если маска с альфа-каналом, разделяем
-        if mask_resized.shape[2] == 4:
-            mask_bgr = mask_resized[:, :, :3]
-            mask_alpha = mask_resized[:, :, 3] / 255.0
-        else:
-            mask_bgr = mask_resized
-            mask_alpha = np.ones((h, w), dtype=np.float32)
-
-        # Учитываем силу фильтра
-        mask_alpha = mask_alpha * self.filter_strength
-
-        # Применяем маску через смешивание
-        result = frame.copy()
-
-        # Конвертируем в float для точных вычислений
-        result_f = result.astype(np.float32)
-        filtered_f = filtered.astype(np.float32)
-
-        # Расширяем маску альфа для 3 каналов
-        mask_alpha_3d = np.repeat(mask_alpha[:, :, np.newaxis], 3, axis=2)
+        box, alpha, inverse = self.get_alpha(h, w)
+        self.frame_number += 1
+
+        # Вне рамки альфа нулевая - там остается исходный кадр
+        result = output_buffer(dst, frame.shape, frame.dtype)
+        np.copyto(result, frame)
+        if box is None:
+            return result
+
+        # Базовый фильтр - только для рамки с полями, которые нужны его окну
+        x, y, bw, bh = box
+        halo = self.base_filter.halo()
+        halo = -(-halo // tiling.ROW_ALIGN) * tiling.ROW_ALIGN
+        y0 = max(0, (y - halo) // tiling.ROW_ALIGN * tiling.ROW_ALIGN)
+        x0 = max(0, (x - halo) // tiling.ROW_ALIGN * tiling.ROW_ALIGN)
+        region = frame[y0:min(h, y + bh + halo), x0:min(w, x + bw + halo)]
+        filtered = base_apply(region, dst=get_buffer("mask_filtered", region.shape))
+
+        self.blend(frame[y:y + bh, x:x + bw],
+                   filtered[y - y0:y - y0 + bh, x - x0:x - x0 + bw],
+                   alpha, inverse, result[y:y + bh, x:x + bw])
+        return result
 
-        # Смешивание с маской: result = (1 - alpha) * original + alpha * filtered
-        blended = cv2.addWeighted(result_f, 1.0 - mask_alpha_3d,
-                                  filtered_f, mask_alpha_3d, 0)
+    @staticmethod
+    def blend(frame, filtered, alpha, inverse, dst):
+        """
+        Смешивает исходный и отфильтрованный кадры по альфе маски
 
-        result = np.clip(blended, 0, 255).astype(np.uint8)
+        Целочисленно: (frame * (256 - alpha) + filtered * alpha + 128) >> 8;
+        максимум 255 * 256 + 128 помещается в uint16.
+        """
+        acc = np.multiply(frame, inverse, out=get_buffer("mask_blend", frame.shape, np.uint16))
+        acc += np.multiply(filtered, alpha, out=get_buffer("mask_blend_filtered", frame.shape, np.uint16))
+        acc += 128
+        acc >>= 8
+        np.copyto(dst, acc, casting="unsafe")
+        return dst
+
+
+def mask_alpha(mask):
+    """Альфа-канал кадра маски; у маски без альфы - яркость"""
+    channels = mask.shape[2]
+    if channels == 4:
+        return np.ascontiguousarray(mask[:, :, 3])
+    if channels == 3:
+        return cv2.cvtColor(np.ascontiguousarray(mask), cv2.COLOR_BGR2GRAY)
+    return np.ascontiguousarray(mask[:, :, 0])
+
+
+def save_mask_animation(paths, output_path):
+    """Собирает кадры анимированной маски (PNG одного размера) в .npy для MaskAnimeFilter"""
+    frames = []
+    for path in paths:
+        frame = cv2.imread(path, cv2.IMREAD_UNCHANGED)
+        if frame is None:
+            raise FileNotFoundError(f"Маска не найдена: {path}")
+        frames.append(frame)
+    np.save(output_path, np.stack(frames))
+    return output_path
+
+
+# Реестр фильтров: стиль -> класс
+FILTERS = {
+    1: KawaiiAnimeFilter,
+    2: CartoonAnimeFilter,
+}
+
+# Живые экземпляры фильтров: стиль -> (ключ параметров, фильтр)
+_filter_cache = {}
+
+def get_filter_params(config):
+    """Параметры конструктора фильтра текущего стиля из конфигурации"""
+    if config.anime_style == 1:
+        return {
+            "face_detect_interval": config.face_detect_interval,
+            "face_detect_scale": config.face_detect_scale,
+            "face_track_reset_interval": config.face_track_reset_interval,
+            "smoothing_mode": config.anime_smoothing,
+            "blur_radius": config.anime_blur_radius,
+        }
+    return {}
 
-        return result
\ No newline at end of file
+def get_filter(config):
+    """
+    Возвращает фильтр для текущего стиля
+
+    Экземпляр переиспользуется между кадрами (вместе с его состоянием)
+    и пересоздается только при изменении стиля или параметров.
+    """
+    filter_class = FILTERS.get(config.anime_style)
+    if filter_class is None:
+        return None
+
+    params = get_filter_params(config)
+    key = tuple(sorted(params.items()))
+
+    cached = _filter_cache.get(config.anime_style)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+
+    anime_filter = filter_class(**params)
+    _filter_cache[config.anime_style] = (key, anime_filter)
+    return anime_filter
@@ -1,6 +1,8 @@
 import sys
 import cv2
 import numpy as np
+import tiling
+from buffers import get_buffer, output_buffer
 
 def get_new_shape(config, shape):
     original_height, original_width = shape[:2]
@@ -11,51 +13,378 @@ def get_new_shape(config, shape):
     new_height = int(new_width * aspect_ratio)
     return new_height, new_width
 
-def resize(frame, new_height, new_width):
-    return cv2.resize(frame, (new_width, new_height), interpolation=cv2.INTER_AREA)
+def resize(frame, new_height, new_width, dst=None):
+    return cv2.resize(frame, (new_width, new_height), dst=dst, interpolation=cv2.INTER_AREA)
 
-def create_pixel_ascii_image(config, frame):
+ASCII_CHARS = " ..:-=+*oxp#%VMWXO08@"
+
+# Таблица "яркость -> индекс символа", совпадает с get_ascii
+ASCII_INDEX_LUT = ((np.arange(256) * (len(ASCII_CHARS) - 1)) // 255).astype(np.uint8)
+
+_glyph_atlases = {}
+
+def get_glyph_atlas(scale_factor):
+    """Возвращает (кэшированный) атлас символов для заданного размера клетки"""
+    atlas = _glyph_atlases.get(scale_factor)
+    if atlas is None:
+        atlas = build_glyph_atlas(scale_factor)
+        _glyph_atlases[scale_factor] = atlas
+    return atlas
+
+def build_glyph_atlas(scale_factor):
+    """
+    Растеризует символы ASCII_CHARS один раз тем же cv2.putText
+
+    Символ шире и выше своей клетки, поэтому атлас хранится слоями:
+    (dy, dx, masks), где masks[i] - часть символа i, попадающая в клетку,
+    сдвинутую на (dy, dx) клеток от исходной. Слои отсортированы в порядке,
+    в котором putText перекрывал бы соседние символы, а пиксели маски
+    слоя номер k равны k + 1. Последний символ атласа - пустой (для полей).
+    """
+    font_scale = 0.3 + scale_factor / 50
+    max_extent = 0
+    for char in ASCII_CHARS:
+        (text_w, text_h), baseline = cv2.getTextSize(char, cv2.FONT_HERSHEY_SIMPLEX, font_scale, 1)
+        max_extent = max(max_extent, text_w, text_h + baseline)
+
+    margin = -(-(max_extent + 2) // scale_factor)
+    cells = 2 * margin + 1
+    size = cells * scale_factor
+
+    canvases = np.zeros((len(ASCII_CHARS) + 1, size, size), dtype=np.uint8)
+    origin = (margin * scale_factor, margin * scale_factor + scale_factor)
+    for i, char in enumerate(ASCII_CHARS):
+        cv2.putText(canvases[i], char, origin,
+                    cv2.FONT_HERSHEY_SIMPLEX, font_scale, 255, 1)
+
+    canvases = canvases.reshape(len(ASCII_CHARS) + 1, cells, scale_factor, cells, scale_factor)
+    canvases = canvases.transpose(0, 1, 3, 2, 4)
+
+    offsets = [(int(cy) - margin, int(cx) - margin)
+               for cy, cx in np.argwhere(canvases.any(axis=(0, 3, 4)))]
+    # Позже нарисованный символ перекрывает раньше нарисованный
+    offsets.sort(key=lambda offset: (-offset[0], -offset[1]))
+
+    layers = []
+    for k, (dy, dx) in enumerate(offsets):
+        masks = np.where(canvases[:, dy + margin, dx + margin] > 0, k + 1, 0).astype(np.uint8)
+        layers.append((dy, dx, masks))
+    return layers
+
+def create_pixel_ascii_image(config, frame, dst=None):
+    """
+    Рисует кадр символами ASCII_CHARS, клетка на пиксель frame
+
+    Временные массивы берутся из пула буферов; результат размером
+    (height * ascii_size, width * ascii_size) пишется в dst, если он передан.
+    """
     height, width = frame.shape[:2]
-    gray = cv2.cvtColor(frame, cv2.COLOR_RGB2GRAY)
+    gray = cv2.cvtColor(frame, cv2.COLOR_RGB2GRAY, dst=get_buffer("ascii_gray", (height, width)))
     
     scale_factor = config.ascii_size
-    result_h = height * scale_factor
-    result_w = width * scale_factor
-    result = np.zeros((result_h, result_w, 3), dtype=np.uint8)
-    
-    for y in range(height):
-        for x in range(width):
-            pixel_brightness = gray[y, x]
-            char = get_ascii(pixel_brightness)
-            
-            y_pos = y * scale_factor
-            x_pos = x * scale_factor
-            
-            cv2.putText(result, char, (x_pos, y_pos + scale_factor), 
-                       cv2.FONT_HERSHEY_SIMPLEX, 0.3 + scale_factor/50, tuple(map(int, frame[y, x])), 1)
-    
+    layers = get_glyph_atlas(scale_factor)
+    pad = max(max(abs(dy), abs(dx)) for dy, dx, _ in layers)
+    padded = (height + 2 * pad, width + 2 * pad)
+    inner = (slice(pad, pad + height), slice(pad, pad + width))
+
+    # Поля из пустых символов, чтобы каждый слой покрывал всю сетку
+    # (цвет полей не используется: пустой символ ничего не рисует)
+    indices = get_buffer("ascii_indices", padded)
+    indices.fill(len(ASCII_CHARS))
+    indices[inner] = cv2.LUT(gray, ASCII_INDEX_LUT, dst=gray)
+    colors = get_buffer("ascii_colors", padded + (3,))
+    colors[inner] = frame
+
+    # Для каждого пикселя - номер слоя, чей символ нарисован последним;
+    # нулевой слой layer_colors никогда не пишется и остается черным
+    owner = get_buffer("ascii_owner", (height * width * scale_factor, scale_factor))
+    owner.fill(0)
+    layer_colors = get_buffer("ascii_layer_colors", (len(layers) + 1, height, width, 3))
+    glyphs = get_buffer("ascii_glyphs", (height, width, scale_factor, scale_factor))
+    # np.take переводит индексы в непрерывный intp, поэтому слой
+    # копируется в такой буфер сам (без временной копии на каждый слой)
+    layer_indices = get_buffer("ascii_layer_indices", (height, width), np.intp)
+    for k, (dy, dx, masks) in enumerate(layers):
+        src = (slice(pad - dy, pad - dy + height), slice(pad - dx, pad - dx + width))
+        np.copyto(layer_indices, indices[src])
+        np.take(masks, layer_indices, axis=0, out=glyphs, mode="clip")
+        cv2.max(owner, glyphs.reshape(owner.shape), dst=owner)
+        layer_colors[k + 1] = colors[src]
+
+    # Переходим от порядка "клетка, пиксель" к порядку строк изображения
+    owner = owner.reshape(height, width, scale_factor, scale_factor).transpose(0, 2, 1, 3)
+    lookup = get_buffer("ascii_lookup", (height, scale_factor, width, scale_factor), np.intp)
+    np.copyto(lookup, owner)  # приведение копированием - без буфера ufunc
+    lookup *= height * width
+    lookup += get_cell_numbers(height, width, scale_factor)
+
+    result = output_buffer(dst, (height * scale_factor, width * scale_factor, 3))
+    np.take(layer_colors.reshape(-1, 3), lookup, axis=0,
+            out=result.reshape(height, scale_factor, width, scale_factor, 3), mode="clip")
     return result
 
+_cell_numbers = {}
+
+def get_cell_numbers(height, width, scale_factor):
+    """Номер исходной клетки для каждого пикселя результата, форма (h, s, w, s)"""
+    key = (height, width, scale_factor)
+    numbers = _cell_numbers.get(key)
+    if numbers is None:
+        numbers = np.arange(height * width, dtype=np.intp).reshape(height, 1, width, 1)
+        numbers = np.ascontiguousarray(
+            np.broadcast_to(numbers, (height, scale_factor, width, scale_factor)))
+        _cell_numbers.clear()
+        _cell_numbers[key] = numbers
+    return numbers
+
+class IncrementalAsciiRenderer:
+    """
+    ASCII-изображение, перерисовываемое только в изменившихся клетках
+
+    Хранит сетку символов и цветов, которыми нарисован постоянный
+    выходной буфер. Клетка "грязная", если сменился символ или цвет
+    отклонился от нарисованного больше чем на tolerance по какому-либо
+    каналу. Символы залезают на соседние клетки, поэтому перерисовываются
+    все клетки в пределах размера символа от грязных. Если грязных
+    клеток больше full_redraw доли, кадр рисуется целиком.
+    """
+
+    def __init__(self, full_redraw=0.5):
+        self.full_redraw = full_redraw
+        self.reset()
+
+    def reset(self):
+        self._key = None
+        self._indices = None
+        self._colors = None
+        self._output = None
+        self._cell_ids = None
+        self._cell_numbers = None
+        self._pixel_index = None
+        self.redrawn_cells = 0
+        self.total_cells = 0
+
+    def render(self, config, frame, dst=None, copy=True):
+        """
+        Как create_pixel_ascii_image, но с перерисовкой только грязных клеток
+
+        Использует config.ascii_color_tolerance и config.ascii_dirty_debug
+        (подсветка перерисованных клеток красным). При copy результат
+        копируется в dst или в новый массив, иначе возвращается сам
+        постоянный буфер только для чтения - для следующей стадии, которая
+        его лишь читает (действительно до следующего вызова render).
+        """
+        height, width = frame.shape[:2]
+        scale_factor = config.ascii_size
+        layers = get_glyph_atlas(scale_factor)
+        pad = max(max(abs(dy), abs(dx)) for dy, dx, _ in layers)
+        inner = (slice(pad, pad + height), slice(pad, pad + width))
+
+        gray = cv2.cvtColor(frame, cv2.COLOR_RGB2GRAY, dst=get_buffer("ascii_gray", (height, width)))
+        indices = cv2.LUT(gray, ASCII_INDEX_LUT, dst=gray)
+
+        key = (height, width, scale_factor)
+        if key != self._key:
+            self._key = key
+            self._indices = np.full((height + 2 * pad, width + 2 * pad), len(ASCII_CHARS), dtype=np.uint8)
+            self._colors = np.zeros((height + 2 * pad, width + 2 * pad, 3), dtype=np.uint8)
+            self._output = np.empty((height * scale_factor, width * scale_factor, 3), dtype=np.uint8)
+            self._cell_ids = np.arange(height * width, dtype=np.intp)
+            # Номер клетки для каждого ее пикселя: сложение с непрерывным
+            # массивом той же формы, в отличие от транслируемого, не буферизуется
+            self._cell_numbers = np.ascontiguousarray(np.broadcast_to(
+                np.arange(height * width, dtype=np.intp)[:, None, None],
+                (height * width, scale_factor, scale_factor)))
+            # Номера пикселей результата по клеткам: запись клеток через np.put
+            self._pixel_index = np.arange(self._output.size // 3, dtype=np.intp).reshape(
+                height, scale_factor, width, scale_factor).transpose(0, 2, 1, 3).reshape(
+                height * width, scale_factor, scale_factor)
+            dirty = None
+        else:
+            # Все маски - в буферах пула: bool-операции и свертки по осям
+            # без out выделяли бы по массиву на сетку каждый кадр
+            dirty = np.not_equal(indices, self._indices[inner],
+                                 out=get_buffer("ascii_dirty", (height, width), np.bool_))
+            diff = cv2.absdiff(frame, self._colors[inner], dst=get_buffer("ascii_color_diff", frame.shape))
+            change = np.maximum(diff[..., 0], diff[..., 1], out=get_buffer("ascii_color_change", (height, width)))
+            np.maximum(change, diff[..., 2], out=change)
+            changed = np.greater(change, config.ascii_color_tolerance,
+                                 out=get_buffer("ascii_color_dirty", (height, width), np.bool_))
+            np.logical_or(dirty, changed, out=dirty)
+
+        if dirty is None or np.count_nonzero(dirty) / dirty.size > self.full_redraw:
+            self._indices[inner] = indices
+            self._colors[inner] = frame
+            create_pixel_ascii_image(config, frame, dst=self._output)
+            cells = None
+            self.redrawn_cells = height * width
+        else:
+            np.copyto(self._indices[inner], indices, where=dirty)
+            np.copyto(self._colors[inner], frame, where=dirty[..., None])
+
+            # Клетки, на которые попадают символы грязных клеток
+            kernel = get_buffer("ascii_dirty_kernel", (2 * pad + 1, 2 * pad + 1))
+            kernel.fill(1)
+            affected = cv2.dilate(dirty.view(np.uint8), kernel,
+                                  dst=get_buffer("ascii_affected", (height, width)))
+            cells = self._select_cells(affected)
+            if len(cells) > 0:
+                self._render_cells(layers, pad, scale_factor, cells)
+            self.redrawn_cells = len(cells)
+        self.total_cells = height * width
+
+        if not copy and not config.ascii_dirty_debug:
+            output = self._output.view()
+            output.flags.writeable = False
+            return output
+
+        if copy:
+            result = output_buffer(dst, self._output.shape)
+        else:
+            result = get_buffer("ascii_dirty_debug", self._output.shape)
+        np.copyto(result, self._output)
+        if config.ascii_dirty_debug and self.redrawn_cells > 0:
+            if cells is None:
+                result //= 2
+                result[..., 2] += 127
+            else:
+                rows, cols = np.divmod(cells, width)
+                cells = result.reshape(height, scale_factor, width, scale_factor, 3)
+                tinted = cells[rows, :, cols] // 2
+                tinted[..., 2] += 127
+                cells[rows, :, cols] = tinted
+        return result
+
+    def _select_cells(self, mask):
+        """Номера ненулевых клеток mask по порядку, как np.flatnonzero, но в буферах пула"""
+        size = mask.size
+        flat = mask.reshape(-1)
+        count = np.count_nonzero(flat)
+        # Место клетки в списке - накопленная сумма отметок до нее;
+        # неотмеченные клетки пишутся в лишний последний элемент
+        position = get_buffer("ascii_select_position", (size,), np.intp)
+        np.copyto(position, flat)
+        np.cumsum(position, out=position)
+        position -= 1
+        clean = np.logical_not(flat, out=get_buffer("ascii_select_clean", (size,), np.bool_))
+        np.copyto(position, size, where=clean)
+        cells = get_buffer("ascii_select_cells", (size + 1,), np.intp)
+        np.put(cells, position, self._cell_ids)
+        return cells[:count]
+
+    def _render_cells(self, layers, pad, scale_factor, cell_ids):
+        """Перерисовывает клетки cell_ids (номера в сетке кадра) постоянного буфера"""
+        height, width = self._key[:2]
+        count = len(cell_ids)
+        padded_width = width + 2 * pad
+
+        def cell_buffer(name, shape=(), dtype=np.uint8):
+            # Буфер пула на всю сетку, от которого берется начало на count клеток:
+            # форма буфера не зависит от числа грязных клеток
+            size = 1
+            for side in shape:
+                size *= side
+            buffer = get_buffer("ascii_cells_" + name, (height * width * size,), dtype)
+            return buffer[:count * size].reshape((count,) + shape)
+
+        # Номера клеток в сетке с полями и их сдвиги для каждого слоя
+        cell = np.floor_divide(cell_ids, width, out=cell_buffer("index", dtype=np.intp))
+        cell *= 2 * pad
+        cell += cell_ids
+        src = cell_buffer("src", dtype=np.intp)
+        symbols = cell_buffer("symbols")
+        symbol_index = cell_buffer("symbol_index", dtype=np.intp)
+        glyphs = cell_buffer("glyphs", (scale_factor, scale_factor))
+
+        # Тот же порядок слоев, что и в create_pixel_ascii_image
+        owner = cell_buffer("owner", (scale_factor, scale_factor))
+        owner.fill(0)
+        layer_colors = get_buffer("ascii_cells_colors", ((len(layers) + 1) * height * width * 3,))
+        layer_colors = layer_colors[:(len(layers) + 1) * count * 3].reshape(len(layers) + 1, count, 3)
+        layer_colors[0] = 0
+        indices, colors = self._indices.reshape(-1), self._colors.reshape(-1, 3)
+        for k, (dy, dx, masks) in enumerate(layers):
+            np.add(cell, (pad - dy) * padded_width + (pad - dx), out=src)
+            np.take(indices, src, out=symbols, mode="clip")
+            np.copyto(symbol_index, symbols)
+            np.take(masks, symbol_index, axis=0, out=glyphs, mode="clip")
+            np.maximum(owner, glyphs, out=owner)
+            np.take(colors, src, axis=0, out=layer_colors[k + 1], mode="clip")
+
+        lookup = cell_buffer("lookup", (scale_factor, scale_factor), np.intp)
+        np.copyto(lookup, owner)
+        lookup *= count
+        lookup += self._cell_numbers[:count]
+        pixels = cell_buffer("pixels", (scale_factor, scale_factor, 3))
+        np.take(layer_colors.reshape(-1, 3), lookup, axis=0, out=pixels, mode="clip")
+        # Пиксель RGB как один элемент из 3 байт: np.put без промежуточных массивов
+        target = cell_buffer("target", (scale_factor, scale_factor), np.intp)
+        np.take(self._pixel_index, cell_ids, axis=0, out=target, mode="clip")
+        rgb = np.dtype((np.void, 3))
+        np.put(self._output.reshape(-1, 3).view(rgb), target, pixels.reshape(-1, 3).view(rgb))
+
+    def dirty_fraction(self):
+        return self.redrawn_cells / self.total_cells if self.total_cells else 0.0
+
+_incremental_renderer = IncrementalAsciiRenderer()
+
+def get_incremental_renderer():
+    """Общий инкрементальный рендерер (состояние живет между кадрами)"""
+    return _incremental_renderer
+
+def get_ascii_grid(config, frame, workers=1, cell_aspect=1.0):
+    """
+    Символы и цвета клеток без растеризации
+
+    Args:
+        cell_aspect: Отношение высоты клетки к ширине (у терминала ~2)
+
+    Returns:
+        (indices, colors): индексы в ASCII_CHARS (h, w) и цвета клеток
+        (h, w, 3) в порядке каналов кадра; массивы из пула буферов
+    """
+    new_height, new_width = get_new_shape(config, frame.shape)
+    new_height = max(1, int(new_height / cell_aspect))
+    small = resize(frame, new_height, new_width, dst=get_buffer("grid_small", (new_height, new_width, 3)))
+    colors = enhance(small, workers, dst=get_buffer("grid_colors", small.shape))
+    gray = cv2.cvtColor(colors, cv2.COLOR_RGB2GRAY, dst=get_buffer("grid_gray", (new_height, new_width)))
+    return cv2.LUT(gray, ASCII_INDEX_LUT, dst=gray), colors
+
 def get_ascii(pixel):
     pixel = int(pixel)
-    chars = list(" ..:-=+*oxp#%VMWXO08@")
-    index = (pixel * (len(chars) - 1)) // 255
-    return chars[index]
+    return ASCII_CHARS[ASCII_INDEX_LUT[pixel]]
 
-def enhance(image):
-    hsv = cv2.cvtColor(image, cv2.COLOR_RGB2HSV)
-    h, s, v = cv2.split(hsv)
-    
-    v_mean = np.mean(v)
-    v_std = np.std(v)
+def enhance(image, workers=1, dst=None):
+    hsv = cv2.cvtColor(image, cv2.COLOR_RGB2HSV, dst=get_buffer("enhance_hsv", image.shape))
+
+    # Глобальная статистика яркости собирается по полосам и сводится
+    partial = tiling.map_striped(get_brightness_sums, hsv, workers)
+    count = sum(part[0] for part in partial)
+    v_mean = sum(part[1] for part in partial) / count
+    v_std = np.sqrt(max(0.0, sum(part[2] for part in partial) / count - v_mean ** 2))
     
     v_min = max(0, int(v_mean - 2*v_std))
     v_max = min(255, int(v_mean + 2.5*v_std))
     
     if v_max > v_min:
-        v = np.clip(v, v_min, v_max)
-        v = ((v - v_min) * (255.0 / (v_max - v_min))).astype(np.uint8)
-    
-    enhanced_hsv = cv2.merge([h, s, v])
+        # Растяжение яркости - попиксельное, поэтому через таблицу по полосам, на месте
+        lut = get_enhance_lut(v_min, v_max)
+        tiling.map_striped(lambda stripe: cv2.LUT(stripe, lut, dst=stripe), hsv, workers)
     
-    return cv2.cvtColor(enhanced_hsv, cv2.COLOR_HSV2RGB)
\ No newline at end of file
+    return cv2.cvtColor(hsv, cv2.COLOR_HSV2RGB, dst=output_buffer(dst, image.shape))
+
+BRIGHTNESS_LEVELS = np.arange(256, dtype=np.float64)
+
+def get_brightness_sums(hsv):
+    """Число пикселей, сумма и сумма квадратов яркости (канал V) - по гистограмме, без копии канала"""
+    hist = cv2.calcHist([hsv], [2], None, [256], [0, 256]).ravel().astype(np.float64)
+    return int(hist.sum()), int(hist @ BRIGHTNESS_LEVELS), int(hist @ BRIGHTNESS_LEVELS ** 2)
+
+def get_enhance_lut(v_min, v_max):
+    """Таблица для канала V: обрезка по [v_min, v_max] и растяжение на [0, 255]"""
+    v = np.clip(np.arange(256, dtype=np.uint8), v_min, v_max)
+    lut = np.empty((1, 256, 3), dtype=np.uint8)
+    lut[0, :, 0] = np.arange(256)
+    lut[0, :, 1] = np.arange(256)
+    lut[0, :, 2] = ((v - v_min) * (255.0 / (v_max - v_min))).astype(np.uint8)
+    return lut
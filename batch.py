@@ -0,0 +1,334 @@
+import argparse
+import hashlib
+import os
+import random
+import shutil
+import subprocess
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+
+import anime_filters
+from config import Config
+from emoji_draw import EmojiParticles, draw_emojis, get_emojis, update_emojis
+from processor import process_frame
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp", ".tif", ".tiff", ".webp")
+
+
+def list_images(directory):
+    return sorted(name for name in os.listdir(directory)
+                  if name.lower().endswith(IMAGE_EXTENSIONS))
+
+
+def count_frames(input_path):
+    """Число кадров и частота кадров входа (каталог изображений или видео)"""
+    if os.path.isdir(input_path):
+        return len(list_images(input_path)), None
+
+    cap = cv2.VideoCapture(input_path)
+    if not cap.isOpened():
+        raise FileNotFoundError(f"Не удалось открыть видео: {input_path}")
+    count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+    cap.release()
+    return count, fps
+
+
+def read_frames(input_path, start, end):
+    """Генератор (номер, имя, кадр) для кадров с номерами из [start, end)"""
+    if os.path.isdir(input_path):
+        names = list_images(input_path)
+        for index in range(start, min(end, len(names))):
+            frame = cv2.imread(os.path.join(input_path, names[index]))
+            if frame is not None:
+                yield index, names[index], frame
+        return
+
+    cap = cv2.VideoCapture(input_path)
+    cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+    for index in range(start, end):
+        ret, frame = cap.read()
+        if not ret:
+            break
+        yield index, None, frame
+    cap.release()
+
+
+class BatchRenderer:
+    """
+    Покадровая обработка с детерминированным состоянием
+
+    Эмодзи запускаются на кадрах с номером, кратным prediction_num, а их
+    случайные параметры зависят только от seed и номера кадра.
+    Сопровождение лиц сбрасывается на ключевых кадрах (каждые
+    face_track_reset_interval кадров по абсолютному номеру), так что его
+    состояние зависит только от кадров после последнего ключевого. Поэтому
+    результат не зависит от числа процессов: перед своим фрагментом каждый
+    процесс "прогревает" состояние на предшествующих кадрах - эмодзи
+    на всем времени их жизни, фильтр лиц с последнего ключевого кадра.
+    """
+
+    # Ключевой кадр сопровождения лиц - каждые столько детекций
+    FACE_RESET_DETECTIONS = 4
+
+    def __init__(self, config, seed=0):
+        self.config = config
+        self.seed = seed
+        self.emojis = get_emojis()
+        self.emojis_on_frame = EmojiParticles()
+
+        interval = max(1, int(config.face_detect_interval))
+        if config.face_track_reset_interval <= 0:
+            config.face_track_reset_interval = self.FACE_RESET_DETECTIONS * interval
+        # Как в FaceTracker: интервал сброса кратен интервалу детекции
+        self.face_reset_interval = -(-int(config.face_track_reset_interval) // interval) * interval
+
+    def emoji_warmup(self):
+        if not self.config.emoji_on:
+            return 0
+        # Самый медленный эмодзи пролетает 480 пикселей со скоростью 0.8 * speed
+        return int(480 / (0.8 * self.config.emoji_speed)) + 2
+
+    def filter_start(self, start):
+        """С какого кадра прогревать фильтры перед кадром start (ключевой кадр)"""
+        if not self.config.anime_on:
+            return start
+        return start - start % self.face_reset_interval
+
+    def start_filters(self, frame_number):
+        """Сбрасывает состояние фильтров перед кадром frame_number"""
+        if self.config.anime_on:
+            anime_filters.get_filter(self.config).reset(frame_number)
+
+    def step(self, index, frame, render=True):
+        """Обрабатывает кадр index; при render=False только продвигает эмодзи"""
+        if self.config.emoji_on and index % self.config.prediction_num == 0:
+            import emotion_classifier
+
+            emotion = emotion_classifier.predict_emotion(frame, self.config.emoji_threshold)
+            if emotion is not None:
+                rng = random.Random(self.seed * 1_000_003 + index)
+                self.emojis_on_frame.spawn(self.emojis[emotion], self.config.emoji_speed, rng)
+
+        if not render:
+            update_emojis(self.emojis_on_frame)
+            return None
+
+        result = process_frame(self.config, frame)
+        if self.config.emoji_on:
+            result = draw_emojis(result, self.emojis_on_frame)
+        return result
+
+
+def make_config(values):
+    config = Config()
+    for name, value in values.items():
+        setattr(config, name, value)
+    return config
+
+
+def render_chunk(input_path, start, end, config_values, seed=0):
+    """Генератор (номер, имя, результат) для кадров [start, end) с прогревом состояния"""
+    config = make_config(config_values)
+
+    if config.emoji_on:
+        import emotion_classifier
+        emotion_classifier.use_backend(config.emotion_backend, config.emotion_model_dir)
+
+    renderer = BatchRenderer(config, seed)
+    filter_start = renderer.filter_start(start)
+    first = min(filter_start, max(0, start - renderer.emoji_warmup()))
+    filters_started = False
+
+    for index, name, frame in read_frames(input_path, first, end):
+        if index < filter_start:
+            renderer.step(index, frame, render=False)
+            continue
+
+        if not filters_started:
+            renderer.start_filters(index)
+            filters_started = True
+
+        result = renderer.step(index, frame)
+        if index >= start:
+            yield index, name, result
+
+
+def process_chunk(task):
+    """
+    Обрабатывает фрагмент [start, end) в отдельном процессе
+
+    Видео пишется в файл фрагмента output, изображения - в каталог output
+    под исходными именами. Возвращает число записанных кадров.
+    """
+    input_path, start, end, config_values, output, fourcc, fps, seed = task
+
+    writer = None
+    written = 0
+    for index, name, result in render_chunk(input_path, start, end, config_values, seed):
+        if name is not None:
+            cv2.imwrite(os.path.join(output, name), result)
+        else:
+            if writer is None:
+                height, width = result.shape[:2]
+                writer = cv2.VideoWriter(output, cv2.VideoWriter_fourcc(*fourcc), fps, (width, height))
+            writer.write(result)
+        written += 1
+
+    if writer is not None:
+        writer.release()
+    return written
+
+
+def hash_chunk(task):
+    """Хэши результатов кадров фрагмента: [(номер, sha1)]"""
+    input_path, start, end, config_values, seed = task
+    return [(index, hashlib.sha1(result.tobytes()).hexdigest())
+            for index, _, result in render_chunk(input_path, start, end, config_values, seed)]
+
+
+def verify_chunks(input_path, config_values, chunk_size=300, workers=None, seed=0):
+    """
+    Сравнивает обработку фрагментами с обработкой одним фрагментом
+
+    Returns:
+        Номер первого различающегося кадра или None, если все совпали
+    """
+    total, _ = count_frames(input_path)
+    bounds = list(range(0, total, chunk_size)) + [total]
+    tasks = [(input_path, 0, total, config_values, seed)]
+    tasks += [(input_path, start, end, config_values, seed) for start, end in zip(bounds, bounds[1:])]
+
+    # Каждый прогон - в своем процессе, чтобы фильтры не делили состояние
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(hash_chunk, tasks))
+
+    sequential = results[0]
+    chunked = [item for result in results[1:] for item in result]
+    for expected, actual in zip(sequential, chunked):
+        if expected != actual:
+            return expected[0]
+    if len(sequential) != len(chunked):
+        return min(len(sequential), len(chunked))
+    return None
+
+
+def concat_videos(paths, output, fourcc, fps):
+    """Склеивает фрагменты по порядку (ffmpeg без перекодирования, если он есть)"""
+    paths = [path for path in paths if os.path.exists(path)]
+    if not paths:
+        return
+
+    ffmpeg = shutil.which("ffmpeg")
+    if ffmpeg is not None:
+        list_path = output + ".txt"
+        with open(list_path, "w", encoding="utf-8") as f:
+            for path in paths:
+                f.write(f"file '{os.path.abspath(path)}'\n")
+        completed = subprocess.run(
+            [ffmpeg, "-y", "-loglevel", "error", "-f", "concat", "-safe", "0",
+             "-i", list_path, "-c", "copy", output]
+        )
+        os.remove(list_path)
+        if completed.returncode == 0:
+            return
+
+    writer = None
+    for path in paths:
+        cap = cv2.VideoCapture(path)
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            if writer is None:
+                height, width = frame.shape[:2]
+                writer = cv2.VideoWriter(output, cv2.VideoWriter_fourcc(*fourcc), fps, (width, height))
+            writer.write(frame)
+        cap.release()
+    if writer is not None:
+        writer.release()
+
+
+def run_batch(input_path, output, config_values, workers=None, chunk_size=300,
+              fourcc="mp4v", seed=0):
+    """Обрабатывает видео или каталог изображений пулом процессов"""
+    total, fps = count_frames(input_path)
+    if total <= 0:
+        raise SystemExit(f"Во входе нет кадров: {input_path}")
+
+    is_images = fps is None
+    bounds = list(range(0, total, chunk_size)) + [total]
+
+    with tempfile.TemporaryDirectory(prefix="ascii_batch_") as tmp:
+        if is_images:
+            os.makedirs(output, exist_ok=True)
+            outputs = [output] * (len(bounds) - 1)
+        else:
+            extension = os.path.splitext(output)[1] or ".mp4"
+            outputs = [os.path.join(tmp, f"chunk_{i:05d}{extension}") for i in range(len(bounds) - 1)]
+
+        tasks = [(input_path, start, end, config_values, chunk_output, fourcc, fps, seed)
+                 for start, end, chunk_output in zip(bounds, bounds[1:], outputs)]
+
+        start_time = time.perf_counter()
+        written = 0
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for i, count in enumerate(executor.map(process_chunk, tasks)):
+                written += count
+                print(f"Фрагмент {i + 1}/{len(tasks)}: {count} кадров")
+
+        if not is_images:
+            concat_videos(outputs, output, fourcc, fps)
+
+    elapsed = time.perf_counter() - start_time
+    speed = written / elapsed if elapsed > 0 else 0.0
+    realtime = f", {speed / fps:.1f}x реального времени" if fps else ""
+    print(f"Готово: {written} кадров за {elapsed:.1f} с ({speed:.1f} кадр/с{realtime})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Пакетная обработка видео и каталогов изображений")
+    parser.add_argument("input", help="видеофайл или каталог изображений")
+    parser.add_argument("output", help="видеофайл (для видео) или каталог (для изображений)")
+    parser.add_argument("--anime", type=int, metavar="STYLE", help="аниме-фильтр со стилем STYLE")
+    parser.add_argument("--ascii", type=int, metavar="SIZE", help="ASCII-фильтр с размером клетки SIZE")
+    parser.add_argument("--median", type=int, metavar="KSIZE", help="медианный фильтр с окном KSIZE")
+    parser.add_argument("--emoji", action="store_true", help="эмодзи по распознанным эмоциям")
+    parser.add_argument("--emotion-backend", default=Config.emotion_backend)
+    parser.add_argument("--emotion-model-dir", default=Config.emotion_model_dir)
+    parser.add_argument("--workers", type=int, default=None, help="число процессов (по умолчанию - по числу ядер)")
+    parser.add_argument("--chunk-size", type=int, default=300, help="кадров во фрагменте")
+    parser.add_argument("--fourcc", default="mp4v")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--verify", action="store_true",
+                        help="не писать результат, а сверить фрагменты с обработкой одним фрагментом")
+    args = parser.parse_args()
+
+    config_values = {}
+    if args.anime is not None:
+        config_values.update(anime_on=True, anime_style=args.anime)
+    if args.ascii is not None:
+        config_values.update(ascii_on=True, ascii_size=args.ascii)
+    if args.median is not None:
+        config_values.update(median_blur_on=True, median_blur_size=args.median)
+    if args.emoji:
+        config_values.update(emoji_on=True,
+                             emotion_backend=args.emotion_backend,
+                             emotion_model_dir=args.emotion_model_dir)
+
+    if args.verify:
+        mismatch = verify_chunks(args.input, config_values, max(1, args.chunk_size), args.workers, args.seed)
+        if mismatch is not None:
+            raise SystemExit(f"Фрагменты расходятся с обработкой целиком, начиная с кадра {mismatch}")
+        print("Фрагменты совпадают с обработкой целиком")
+        return
+
+    run_batch(args.input, args.output, config_values, args.workers,
+              max(1, args.chunk_size), args.fourcc, args.seed)
+
+
+if __name__ == '__main__':
+    main()
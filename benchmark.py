@@ -0,0 +1,528 @@
+import argparse
+import itertools
+import json
+import os
+import platform
+import random
+import re
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+
+import anime_filters
+import ascii_filters
+import smoothing
+from config import Config
+from buffers import FrameRing
+from processor import process_frame
+
+# Случаи, которые требуют модели эмоций (пропускаются при --no-emotion)
+EMOTION_CASES = ("predict_emotion",)
+PLANNER_OVERSAMPLES = (2, 4)
+
+RESOLUTIONS = {
+    "480p": (480, 640),
+    "720p": (720, 1280),
+    "1080p": (1080, 1920),
+}
+
+# Метрики, по которым compare ищет регрессии, и направление "хуже"
+REGRESSION_METRICS = {
+    "p50_ms": 1,
+    "p95_ms": 1,
+    "p99_ms": 1,
+    "fps": -1,
+    "peak_mb": 1,
+}
+
+
+def synthetic_frame(height, width, seed=0):
+    """Детерминированный кадр: градиенты, фигуры и шум"""
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    frame = np.stack([x / width * 255, y / height * 255, (x + y) / (width + height) * 255], axis=-1)
+
+    for _ in range(30):
+        color = tuple(int(c) for c in rng.integers(0, 256, 3))
+        cx, cy = int(rng.integers(0, width)), int(rng.integers(0, height))
+        size = int(rng.integers(height // 40 + 1, height // 4 + 2))
+        cv2.circle(frame, (cx, cy), size, color, -1)
+        cv2.rectangle(frame, (cx, cy), (cx + size, cy + size // 2), color, -1)
+
+    frame += rng.normal(0, 10, frame.shape).astype(np.float32)
+    return np.clip(frame, 0, 255).astype(np.uint8)
+
+
+def recorded_frames(path, height, width, limit=30):
+    """Кадры из видео или каталога изображений, приведенные к разрешению"""
+    frames = []
+    if os.path.isdir(path):
+        for name in sorted(os.listdir(path)):
+            frame = cv2.imread(os.path.join(path, name))
+            if frame is not None:
+                frames.append(frame)
+            if len(frames) >= limit:
+                break
+    else:
+        cap = cv2.VideoCapture(path)
+        while len(frames) < limit:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            frames.append(frame)
+        cap.release()
+    return [cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA) for frame in frames]
+
+
+def make_config(**values):
+    config = Config()
+    for name, value in values.items():
+        setattr(config, name, value)
+    return config
+
+
+def make_mask(path, height=512, width=512):
+    """Синтетическая PNG-маска с альфа-каналом для MaskAnimeFilter"""
+    mask = np.zeros((height, width, 4), dtype=np.uint8)
+    cv2.circle(mask, (width // 2, height // 2), min(height, width) // 3, (200, 120, 255, 255), -1)
+    mask[:, :, 3] = cv2.GaussianBlur(mask[:, :, 3], (0, 0), 15)
+    cv2.imwrite(path, mask)
+    return path
+
+
+def make_emojis(count, height, width, seed=0):
+    """Неподвижные эмодзи, разбросанные по кадру"""
+    from emoji_draw import EmojiParticles, get_emojis
+
+    rng = random.Random(seed)
+    symbols = list(get_emojis().values())
+    emojis = EmojiParticles(count)
+    for i in range(count):
+        emojis.spawn(symbols[i % len(symbols)], 0, rng)
+        emojis.x[i] = rng.randint(0, max(0, width - 60))
+        emojis.y[i] = rng.randint(0, max(0, height - 60))
+    return emojis
+
+
+def build_cases(mask_path, ascii_sizes=(4, 5, 8, 12), emoji_counts=(10, 100), with_emotion=True):
+    """
+    Случаи бенчмарка: имя -> фабрика(height, width) -> функция(frame)
+
+    Фабрика готовит состояние (фильтры, эмодзи) вне замера.
+    """
+    cases = {}
+
+    def filter_case(factory):
+        def setup(height, width):
+            anime_filter = factory()
+            return anime_filter.apply
+        return setup
+
+    config = Config()
+    cases["anime_kawaii"] = filter_case(lambda: anime_filters.KawaiiAnimeFilter(
+        face_detect_interval=config.face_detect_interval,
+        face_detect_scale=config.face_detect_scale,
+        smoothing_mode=config.anime_smoothing))
+    cases["anime_cartoon"] = filter_case(anime_filters.CartoonAnimeFilter)
+    cases["anime_mask"] = filter_case(lambda: anime_filters.MaskAnimeFilter(mask_path))
+
+    for size in ascii_sizes:
+        def setup(height, width, size=size):
+            ascii_config = make_config(ascii_on=True, ascii_size=size)
+
+            def run(frame):
+                new_height, new_width = ascii_filters.get_new_shape(ascii_config, frame.shape)
+                small = ascii_filters.resize(frame, new_height, new_width)
+                small = ascii_filters.enhance(small)
+                return ascii_filters.create_pixel_ascii_image(ascii_config, small)
+            return run
+        cases[f"ascii_{size}"] = setup
+
+    cases["median_blur_9"] = lambda height, width: (lambda frame: cv2.medianBlur(frame, 9))
+
+    def face_effects_setup(height, width):
+        face_filter = anime_filters.KawaiiAnimeFilter()
+        faces = [(width // 8, height // 8, width // 4, height // 3),
+                 (width // 2, height // 3, width // 3, height // 2)]
+        canvas = np.empty((height, width, 3), dtype=np.uint8)
+
+        def run(frame):
+            np.copyto(canvas, frame)
+            return face_filter.apply_face_effects(canvas, faces, inplace=True)
+        # Стоимость на одно лицо добавляется к результату случая
+        run.stats = face_filter.face_effect_stats
+        return run
+    cases["face_effects_2"] = face_effects_setup
+
+    for count in emoji_counts:
+        def setup(height, width, count=count):
+            from emoji_draw import draw_emojis
+
+            emojis = make_emojis(count, height, width)
+            canvas = np.empty((height, width, 3), dtype=np.uint8)
+
+            # Эмодзи рисуются прямо на кадре, поэтому - на копии
+            def run(frame):
+                np.copyto(canvas, frame)
+                return draw_emojis(canvas, emojis)
+            return run
+        cases[f"emoji_{count}"] = setup
+
+    if with_emotion:
+        def setup(height, width):
+            import emotion_classifier
+
+            config = Config()
+            emotion_classifier.use_backend(config.emotion_backend, config.emotion_model_dir)
+            emotion_classifier.load_model()
+            return lambda frame: emotion_classifier.predict_emotion(frame, config.emoji_threshold)
+        cases[EMOTION_CASES[0]] = setup
+
+    # Полный process_frame для всех сочетаний фильтров
+    for flags in itertools.product((False, True), repeat=3):
+        if not any(flags):
+            continue
+        anime_on, ascii_on, median_blur_on = flags
+        name = "process_" + "+".join(
+            stage for stage, on in zip(("anime", "ascii", "median"), flags) if on)
+
+        def setup(height, width, flags=flags):
+            frame_config = make_config(anime_on=flags[0], ascii_on=flags[1], median_blur_on=flags[2])
+            return lambda frame: process_frame(frame_config, frame)
+        cases[name] = setup
+
+        # Необязательный режим планировщика: аниме на сетке клеток x N. Вид
+        # меняется, поэтому рядом со временем - PSNR относительно обычного плана
+        if anime_on and ascii_on:
+            for oversample in PLANNER_OVERSAMPLES:
+                def setup(height, width, flags=flags, oversample=oversample):
+                    reference_config = make_config(anime_on=True, ascii_on=True, median_blur_on=flags[2])
+                    frame_config = make_config(anime_on=True, ascii_on=True, median_blur_on=flags[2],
+                                               planner_ascii_oversample=oversample)
+                    last = {}
+
+                    def run(frame):
+                        last["frame"] = frame
+                        return process_frame(frame_config, frame)
+
+                    def stats():
+                        frame = last["frame"]
+                        reference = process_frame(reference_config, frame)
+                        return {"psnr_db": cv2.PSNR(reference, process_frame(frame_config, frame))}
+
+                    run.stats = stats
+                    return run
+                cases[f"{name}[oversample{oversample}]"] = setup
+
+    return cases
+
+
+def percentile(values, q):
+    return float(np.percentile(values, q)) if values else 0.0
+
+
+def measure(func, frames, iterations, warmup=3):
+    """Задержки (мс) и пиковая память (МБ) функции на циклически подаваемых кадрах"""
+    for i in range(warmup):
+        func(frames[i % len(frames)])
+
+    latencies = []
+    for i in range(iterations):
+        start = time.perf_counter()
+        func(frames[i % len(frames)])
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    # Память - отдельным коротким проходом: tracemalloc замедляет выполнение
+    tracemalloc.start()
+    for i in range(min(iterations, 5)):
+        func(frames[i % len(frames)])
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    mean = sum(latencies) / len(latencies)
+    return {
+        "iterations": iterations,
+        "p50_ms": percentile(latencies, 50),
+        "p95_ms": percentile(latencies, 95),
+        "p99_ms": percentile(latencies, 99),
+        "mean_ms": mean,
+        "fps": 1000 / mean if mean > 0 else 0.0,
+        "peak_mb": peak / 2 ** 20,
+    }
+
+
+def steady_state_allocations(func, frames, iterations=10, warmup=3):
+    """Наибольший объем памяти (байт), выделенный одним вызовом после прогрева"""
+    for i in range(warmup):
+        func(frames[i % len(frames)])
+
+    tracemalloc.start()
+    worst = 0
+    for i in range(iterations):
+        current, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        func(frames[i % len(frames)])
+        worst = max(worst, tracemalloc.get_traced_memory()[1] - current)
+    tracemalloc.stop()
+    return worst
+
+
+# Сколько байт за кадр после прогрева допустимо: служебные объекты
+# Python и NumPy (срезы, кортежи, фьючерсы потоков), но не массивы
+ALLOCATION_LIMIT = 16 * 1024
+
+
+def allocation_cases(height, width, tile_workers=(1, 3)):
+    """Случаи проверки выделений: имя -> функция(frame), состояние готовится заранее"""
+    cases = {}
+    for flags in itertools.product((False, True), repeat=3):
+        if not any(flags):
+            continue
+        name = "process_" + "+".join(
+            stage for stage, on in zip(("anime", "ascii", "median"), flags) if on)
+        for workers in tile_workers:
+            config = make_config(anime_on=flags[0], ascii_on=flags[1], median_blur_on=flags[2],
+                                 tile_workers=workers)
+            ring = FrameRing(4)
+            cases[f"{name}/tiles{workers}"] = (
+                lambda frame, config=config, ring=ring: process_frame(config, frame, ring))
+
+    # Режимы сглаживания аниме-фильтра, кроме bilateral (он выше)
+    for mode in smoothing.SMOOTHERS[1:]:
+        for workers in tile_workers:
+            config = make_config(anime_on=True, anime_smoothing=mode, tile_workers=workers)
+            ring = FrameRing(4)
+            cases[f"process_anime[{mode}]/tiles{workers}"] = (
+                lambda frame, config=config, ring=ring: process_frame(config, frame, ring))
+
+    # Инкрементальный ASCII: на разных кадрах - полная перерисовка, на кадре,
+    # где меняется только небольшая область, - перерисовка грязных клеток
+    incremental_config = make_config(ascii_on=True, ascii_incremental=True)
+    full_ring = FrameRing(4)
+    cases["process_ascii[incremental]/full"] = (
+        lambda frame: process_frame(incremental_config, frame, full_ring))
+
+    still = synthetic_frame(height, width, 1)
+    moving = np.empty_like(still)
+    partial_ring = FrameRing(4)
+    shifts = itertools.cycle(range(0, width // 10, 8))
+
+    def incremental_partial(frame):
+        np.copyto(moving, still)
+        x = width // 4 + next(shifts)
+        moving[height // 4:height // 4 + height // 10, x:x + width // 10] = 255
+        return process_frame(incremental_config, moving, partial_ring)
+    cases["process_ascii[incremental]/partial"] = incremental_partial
+
+    from emoji_draw import draw_emojis
+
+    emojis = make_emojis(100, height, width)
+    emoji_canvas = np.empty((height, width, 3), dtype=np.uint8)
+
+    def draw(frame):
+        np.copyto(emoji_canvas, frame)
+        return draw_emojis(emoji_canvas, emojis)
+    cases["emoji_100"] = draw
+
+    face_filter = anime_filters.KawaiiAnimeFilter()
+    faces = [(width // 8, height // 8, width // 4, height // 3),
+             (width // 2, height // 3, width // 3, height // 2)]
+    face_canvas = np.empty((height, width, 3), dtype=np.uint8)
+
+    def face_effects(frame):
+        np.copyto(face_canvas, frame)
+        return face_filter.apply_face_effects(face_canvas, faces, inplace=True)
+    cases["face_effects"] = face_effects
+    return cases
+
+
+def check_allocations(resolutions, seed=0, limit=ALLOCATION_LIMIT):
+    """
+    Проверяет, что после прогрева кадры обрабатываются без выделения
+    массивов: process_frame с кольцом выходных кадров (в один поток и
+    полосами), эмодзи и эффекты лиц выделяют за вызов меньше limit байт
+
+    Returns:
+        Список (случай, байт за вызов) для случаев, где это не так
+    """
+    failures = []
+    for resolution in resolutions:
+        height, width = RESOLUTIONS[resolution]
+        frames = [synthetic_frame(height, width, seed + i) for i in range(3)]
+
+        for name, func in allocation_cases(height, width).items():
+            key = f"{name}@{resolution}"
+            allocated = steady_state_allocations(func, frames, warmup=6)
+            status = "ok" if allocated < limit else "ВЫДЕЛЯЕТ ПАМЯТЬ"
+            print(f"{key:<45} {allocated / 1024:10.1f} КБ за кадр  {status}")
+            if allocated >= limit:
+                failures.append((key, allocated))
+    return failures
+
+
+def run_benchmarks(resolutions, iterations, case_filter=None, input_path=None,
+                   with_emotion=True, seed=0):
+    random.seed(seed)
+    np.random.seed(seed)
+
+    with tempfile.TemporaryDirectory(prefix="ascii_bench_") as tmp:
+        cases = build_cases(make_mask(os.path.join(tmp, "mask.png")), with_emotion=with_emotion)
+        pattern = re.compile(case_filter) if case_filter else None
+
+        results = {}
+        for resolution in resolutions:
+            height, width = RESOLUTIONS[resolution]
+            sources = {"synthetic": [synthetic_frame(height, width, seed + i) for i in range(3)]}
+            if input_path:
+                frames = recorded_frames(input_path, height, width)
+                if frames:
+                    sources["recorded"] = frames
+
+            for source, frames in sources.items():
+                for name, setup in cases.items():
+                    if pattern is not None and not pattern.search(name):
+                        continue
+
+                    key = f"{name}@{resolution}/{source}"
+                    try:
+                        func = setup(height, width)
+                        results[key] = measure(func, frames, iterations)
+                        if hasattr(func, "stats"):
+                            results[key].update(func.stats())
+                    except Exception as e:
+                        message = " ".join(str(e).split())[:200]
+                        results[key] = {"error": f"{type(e).__name__}: {message}"}
+                    print_result(key, results[key])
+
+    return {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "processor": platform.processor(),
+            "cpu_count": os.cpu_count(),
+            "opencv": cv2.__version__,
+            "opencv_threads": cv2.getNumThreads(),
+            "numpy": np.__version__,
+            "iterations": iterations,
+            "seed": seed,
+        },
+        "results": results,
+    }
+
+
+def print_result(key, result):
+    if "error" in result:
+        print(f"{key:<55} ошибка: {result['error']}")
+    else:
+        extra = f"  {result['ms_per_face']:.3f} мс/лицо" if "ms_per_face" in result else ""
+        if "psnr_db" in result:
+            extra += f"  PSNR {result['psnr_db']:.1f} дБ"
+        print(f"{key:<55} p50 {result['p50_ms']:8.2f} мс  p95 {result['p95_ms']:8.2f} мс  "
+              f"p99 {result['p99_ms']:8.2f} мс  {result['fps']:7.1f} fps  {result['peak_mb']:7.1f} МБ{extra}")
+
+
+def is_selected(key, resolutions, case_filter=None, input_path=None, with_emotion=True):
+    """Попадает ли случай с ключом "имя@разрешение/источник" в прогон с такими параметрами"""
+    name, _, rest = key.partition("@")
+    resolution, _, source = rest.partition("/")
+    if resolution not in resolutions:
+        return False
+    if source == "recorded" and not input_path:
+        return False
+    if name in EMOTION_CASES and not with_emotion:
+        return False
+    return case_filter is None or re.search(case_filter, name) is not None
+
+
+def compare(current, baseline, threshold, selected=None):
+    """
+    Сравнивает результаты с базовыми
+
+    Случай из базовых результатов, которого нет в текущем прогоне, тоже
+    считается регрессией (сломан или удален), если только он не был
+    отброшен фильтром прогона.
+
+    Args:
+        selected: Функция ключ -> bool: должен ли случай быть в текущем
+                  прогоне (None - должны быть все)
+
+    Returns:
+        Список регрессий (ключ, метрика, базовое, текущее, изменение)
+    """
+    regressions = []
+    for key, base in baseline["results"].items():
+        if "error" in base:
+            continue
+        result = current["results"].get(key)
+        if result is None:
+            if selected is None or selected(key):
+                regressions.append((key, "missing", None, None, "случай отсутствует в текущем прогоне"))
+            continue
+        if "error" in result:
+            regressions.append((key, "error", None, None, result["error"]))
+            continue
+
+        for metric, direction in REGRESSION_METRICS.items():
+            before, after = base.get(metric), result.get(metric)
+            if not before or after is None:
+                continue
+            change = (after - before) / before * direction
+            if change > threshold:
+                regressions.append((key, metric, before, after, change))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк фильтров и сочетаний process_frame")
+    parser.add_argument("--output", default="bench_results.json", help="куда записать JSON с результатами")
+    parser.add_argument("--resolutions", default=",".join(RESOLUTIONS))
+    parser.add_argument("--iterations", type=int, default=30)
+    parser.add_argument("--cases", help="регулярное выражение для отбора случаев")
+    parser.add_argument("--input", help="видео или каталог изображений в дополнение к синтетическим кадрам")
+    parser.add_argument("--no-emotion", action="store_true", help="не замерять predict_emotion")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--compare", metavar="BASELINE", help="JSON с базовыми результатами")
+    parser.add_argument("--threshold", type=float, default=0.15, help="допустимое ухудшение (доля)")
+    parser.add_argument("--allocations", action="store_true",
+                        help="только проверить отсутствие выделений памяти под кадры после прогрева")
+    args = parser.parse_args()
+
+    if args.allocations:
+        failures = check_allocations(args.resolutions.split(","), args.seed)
+        if failures:
+            sys.exit(1)
+        print("Выделений памяти после прогрева нет")
+        return
+
+    results = run_benchmarks(args.resolutions.split(","), args.iterations, args.cases,
+                             args.input, not args.no_emotion, args.seed)
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print(f"Результаты записаны в {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+
+        regressions = compare(results, baseline, args.threshold,
+                              lambda key: is_selected(key, args.resolutions.split(","), args.cases, args.input,
+                                                      not args.no_emotion))
+        for key, metric, before, after, change in regressions:
+            if metric in ("error", "missing"):
+                print(f"РЕГРЕССИЯ {key}: {change}")
+            else:
+                print(f"РЕГРЕССИЯ {key}: {metric} {before:.2f} -> {after:.2f} ({change:+.0%})")
+
+        if regressions:
+            sys.exit(1)
+        print(f"Регрессий нет (порог {args.threshold:.0%})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+import threading
+import numpy as np
+
+# Сколько буферов держит один поток; при переполнении пул очищается
+# (например, после многократной смены разрешения или размера ASCII)
+MAX_BUFFERS = 64
+
+
+class BufferPool:
+    """
+    Переиспользуемые временные массивы по ключу (имя, форма, тип)
+
+    У каждого потока свои буферы: полосы кадра и стадии конвейера
+    обрабатываются одновременно в разных потоках. Буфер действителен
+    только до следующего запроса с тем же ключом в том же потоке,
+    поэтому отдавать его за пределы функции нельзя - для кадров,
+    уходящих в очереди конвейера, есть FrameRing.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.allocations = 0
+        self.allocated_bytes = 0
+
+    def get(self, name, shape, dtype=np.uint8):
+        """Буфер с заданными формой и типом; новый буфер заполнен нулями"""
+        buffers = getattr(self._local, "buffers", None)
+        if buffers is None:
+            buffers = self._local.buffers = {}
+
+        key = (name, tuple(shape), np.dtype(dtype))
+        buffer = buffers.get(key)
+        if buffer is None:
+            if len(buffers) >= MAX_BUFFERS:
+                buffers.clear()
+            buffer = np.zeros(key[1], dtype=key[2])
+            buffers[key] = buffer
+            with self._lock:
+                self.allocations += 1
+                self.allocated_bytes += buffer.nbytes
+        return buffer
+
+    def stats(self):
+        return {"allocations": self.allocations, "allocated_mb": self.allocated_bytes / 2 ** 20}
+
+
+class FrameRing:
+    """
+    Кольцо выходных кадров для конвейера
+
+    Кадр, отданный следующей стадии, перезаписывается только через size
+    запросов, поэтому size должен быть больше числа кадров "в полете"
+    (очереди, стадии и показанный кадр). При смене формы кольцо
+    создается заново; старые кадры живут, пока на них есть ссылки.
+    """
+
+    def __init__(self, size):
+        self.size = max(1, size)
+        self._buffers = []
+        self._key = None
+        self._next = 0
+
+    def get(self, shape, dtype=np.uint8):
+        key = (tuple(shape), np.dtype(dtype))
+        if key != self._key:
+            self._buffers = [np.empty(key[0], dtype=key[1]) for _ in range(self.size)]
+            self._key = key
+            self._next = 0
+
+        buffer = self._buffers[self._next]
+        self._next = (self._next + 1) % self.size
+        return buffer
+
+
+# Общий пул временных буферов
+POOL = BufferPool()
+
+
+def get_buffer(name, shape, dtype=np.uint8):
+    return POOL.get(name, shape, dtype)
+
+
+def output_buffer(dst, shape, dtype=np.uint8):
+    """dst, если он передан (и подходит), иначе новый массив под результат"""
+    if dst is not None:
+        if dst.shape != tuple(shape) or dst.dtype != np.dtype(dtype):
+            raise ValueError(f"dst: ожидается {tuple(shape)} {np.dtype(dtype)}, "
+                             f"передан {dst.shape} {dst.dtype}")
+        return dst
+    return np.empty(shape, dtype=dtype)
@@ -1,88 +1,164 @@
+import copy
+import time
 import cv2
-import pyvirtualcam
+import emotion_classifier
 from processor import process_frame
-from emotion_classifier import predict_emotion
-from emoji_draw import RisingEmoji, draw_emojis, get_emojis
+from emoji_draw import EmojiParticles, draw_emojis, get_emojis
+from emotion_worker import EmotionWorker
+from pipeline import Pipeline
+from buffers import FrameRing
+from sinks import create_sinks
+from sources import create_source
+from quality import QualityController
+from profiler import PROFILER
 
 KEY_ESC = 27
 
+class EmojiOverlay:
+    """Стадии конвейера, отвечающие за эмодзи"""
+
+    def __init__(self, config, emotion_worker):
+        self.config = config
+        self.emotion_worker = emotion_worker
+        self.emojis = get_emojis()
+        self.emojis_on_frame = EmojiParticles()
+        self.frame_number = 0
+
+    def submit(self, packet):
+        """Отправляет каждый prediction_num-й исходный кадр на распознавание"""
+        self.frame_number += 1
+        if self.config.emoji_on and self.frame_number % self.config.prediction_num == 0:
+            self.emotion_worker.submit(packet.source, self.config.emoji_threshold)
+
+    def apply(self, packet):
+        """Запускает эмодзи по готовым эмоциям и рисует их на кадре"""
+        for result in self.emotion_worker.poll():
+            if not self.config.emoji_on:
+                continue
+            # Распознавание по лицам возвращает список (номер, рамка, эмоция)
+            if isinstance(result, list):
+                for _, (x, _, width, _), emotion in result:
+                    self.emojis_on_frame.spawn(self.emojis[emotion], self.config.emoji_speed,
+                                               center_x=x + width // 2)
+            else:
+                self.emojis_on_frame.spawn(self.emojis[result], self.config.emoji_speed)
+
+        if self.config.emoji_on:
+            with PROFILER.stage("emoji"):
+                packet.frame = draw_emojis(packet.frame, self.emojis_on_frame)
+        else:
+            self.emojis_on_frame.clear()
+        return packet
+
 def capture_camera(config):
-    cap = cv2.VideoCapture(0)
+    source = create_source(config)
 
-    if not cap.isOpened():
-        print("Ошибка: не удалось открыть камеру")
+    if not source.is_opened():
+        print(f"Ошибка: не удалось открыть источник кадров ({config.frame_source})")
         return
-    
-    print_navigation_info()
 
-    frame_number = 0
-    emojis = get_emojis()
-    emojis_on_frame = []
+    sinks = create_sinks(config)
+    # Если все приемники строят ASCII сами (терминал), растровый ASCII не нужен
+    raster_ascii = not all(sink.draws_ascii for sink in sinks)
+    read_keys = any(sink.reads_keys for sink in sinks)
 
-    if not config.use_virtual_camera:
-        while True:
-            frame_number += 1
-            ret, frame = cap.read()
+    print_navigation_info(read_keys)
 
-            if not ret:
-                print("Не удалось получить кадр (конец потока?)")
-                break
-            
-            if config.emoji_on and frame_number % config.prediction_num == 0:
-                emotion = predict_emotion(frame, config.emoji_threshold)
-                if emotion is not None:
-                    emojis_on_frame.append(RisingEmoji(emojis[emotion], config.emoji_speed))
+    emotion_classifier.use_backend(config.emotion_backend, config.emotion_model_dir)
+    predict = emotion_classifier.predict_emotion
+    if config.emotion_per_face:
+        from face_emotions import FaceEmotionRecognizer
+        predict = FaceEmotionRecognizer(ttl_calls=config.emotion_face_ttl).predict
+    emotion_worker = EmotionWorker(predict)
+    emotion_worker.start()
 
-            result_frame = process_frame(config, frame)
-
-            if config.emoji_on:
-                result_frame = draw_emojis(result_frame, emojis_on_frame)
-            else:
-                emojis_on_frame = []
+    if config.emoji_on:
+        emotion_classifier.prewarm()
 
-            cv2.imshow('Video Capture', result_frame)
+    overlay = EmojiOverlay(config, emotion_worker)
+    quality = QualityController(config)
 
-            need_exit = key_catch(config)
-            if need_exit:
-                break
+    def filter_stage(packet):
+        overlay.submit(packet)
+        # Клавиши и контроллер качества меняют config из главного потока;
+        # кадр обрабатывается по снимку, чтобы стадии видели одни значения
+        packet.frame = process_frame(copy.copy(config), packet.frame, ring, raster_ascii)
+        return packet
 
-    else:
-        ret, frame = cap.read()
+    stages = [("filter", filter_stage), ("overlay", overlay.apply)]
 
-        if not ret:
-            print("Не удалось получить кадр (конец потока?)")
-            return
+    # Выходные кадры фильтров переиспользуются по кругу; кольцо больше
+    # числа кадров, одновременно находящихся в очередях, стадиях и на экране
+    ring = FrameRing(config.pipeline_queue_size * (len(stages) + 1) + len(stages) + 2)
 
-        with pyvirtualcam.Camera(width=frame.shape[1], height=frame.shape[0], fps=20) as cam:
-            while True:
-                frame_number += 1
-                ret, frame = cap.read()
+    pipeline = Pipeline(source.read,
+                        stages,
+                        queue_size=config.pipeline_queue_size,
+                        drop_policy=config.pipeline_drop_policy)
 
-                if not ret:
-                    print("Не удалось получить кадр (конец потока?)")
-                    break
-                
-                if config.emoji_on and frame_number % config.prediction_num == 0:
-                    emotion = predict_emotion(frame, config.emoji_threshold)
-                    if emotion is not None:
-                        emojis_on_frame.append(RisingEmoji(emojis[emotion], config.emoji_speed))
+    run_output(config, pipeline, sinks, read_keys, quality)
 
-                result_frame = process_frame(config, frame)
+    emotion_worker.stop()
+    print(f"Распознавание эмоций: {emotion_worker.stats()}")
+    # Статистику камеры (разрешение, FOURCC) можно прочитать только до release
+    print(f"Источник: {source.stats()}")
+    source.release()
+    cv2.destroyAllWindows()
 
-                if config.emoji_on:
-                    result_frame = draw_emojis(result_frame, emojis_on_frame)
-                else:
-                    emojis_on_frame = []
+def run_output(config, pipeline, sinks, read_keys=True, quality=None):
+    """
+    Выводит кадры конвейера во все приемники в главном потоке
 
-                cam.send(result_frame)
-                cam.sleep_until_next_frame()
+    Клавиши читаются, только если read_keys (есть окно); выход в любом
+    режиме - также по Ctrl+C. Стадии работают параллельно, поэтому частоту
+    кадров ограничивает самая долгая из них: ее время (вывод - тоже
+    стадия) и передается контроллеру качества quality.
+    """
+    pace = any(sink.pace for sink in sinks)
+    PROFILER.set_allocation_tracking(config.profile_allocations)
+    pipeline.start()
 
-                need_exit = key_catch(config)
-                if need_exit:
-                    break
+    try:
+        while True:
+            PROFILER.enabled = config.profiling_on or config.hud_on or bool(config.profile_export_path)
+            packet = pipeline.get(pace=pace)
+
+            if packet is not None:
+                start = time.perf_counter()
+                if PROFILER.enabled:
+                    report_frame(config, pipeline, packet)
+                with PROFILER.stage("output"):
+                    for sink in sinks:
+                        sink.send(packet.frame)
+                if quality is not None:
+                    quality.update(max(packet.stage_time, time.perf_counter() - start))
+            elif pipeline.finished:
+                print("Не удалось получить кадр (конец потока?)")
+                break
 
-    cap.release()
-    cv2.destroyAllWindows()
+            if read_keys and key_catch(config):
+                break
+    except KeyboardInterrupt:
+        pass
+    finally:
+        pipeline.stop()
+        for sink in sinks:
+            sink.close()
+        PROFILER.set_allocation_tracking(False)
+
+    stats = pipeline.stats()
+    dropped = sum(queue["dropped"] for queue in stats["queues"].values())
+    print(f"Сквозная задержка: {stats['latency_ms']:.0f} мс (p95 {stats['latency_p95_ms']:.0f} мс), "
+          f"сброшено кадров: {dropped}")
+
+def report_frame(config, pipeline, packet):
+    """Учитывает выведенный кадр в профилировщике, рисует HUD и выгружает статистику"""
+    PROFILER.record("latency", time.perf_counter() - packet.timestamp)
+    PROFILER.frame_done()
+    PROFILER.set_gauge("dropped", sum(queue.dropped for queue in pipeline.queues))
+    if config.hud_on:
+        PROFILER.draw_hud(packet.frame)
+    PROFILER.maybe_export(config.profile_export_path, config.profile_export_interval)
 
 def key_catch(config):
     key = cv2.waitKey(1) & 0xFF
@@ -97,6 +173,10 @@ def key_catch(config):
         config.median_blur_on = not config.median_blur_on
     elif key == ord('4'):
         config.emoji_on = not config.emoji_on
+        if config.emoji_on:
+            emotion_classifier.prewarm()
+    elif key == ord('h'):
+        config.hud_on = not config.hud_on
     
     if config.anime_on:
         if key == ord('q') and config.anime_style < 2:
@@ -124,12 +204,17 @@ def key_catch(config):
 
     return False
 
-def print_navigation_info():
+def print_navigation_info(read_keys=True):
     print()
     print("Запущено приложение фильтрации видеопотока с веб-камеры")
     print()
+    if not read_keys:
+        # Без окна cv2.waitKey не получает нажатий
+        print("Окна нет, клавиши недоступны: выход - Ctrl+C")
+        return
     print("┌──────────────────────────────────────────────────┐")
     print("│ 'ESC' - выход                                    │")
+    print("│ 'H'   - панель производительности                │")
     print("├─────────┬────────┬───────┬───────────┬───────────┤")
     print("│ Фильтр  │ Аниме  │ ASCII │ Медианный │ Смайлики  │")
     print("├─────────┼────────┼───────┼───────────┼───────────┤")
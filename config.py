@@ -10,4 +10,49 @@ class Config:
     emoji_threshold = 0.4
     emoji_speed = 2
     prediction_num = 60
+    face_detect_interval = 5
+    face_detect_scale = 0.5
+    face_track_reset_interval = 0  # 0 - не сбрасывать; batch.py задает свой
+    anime_smoothing = "bilateral"
+    anime_blur_radius = 3
+    processing_scale = 1.0
+    planner_ascii_oversample = 0  # аниме при ASCII - на сетке клеток x N; вид меняется, только явно (0 - полный кадр)
+    pipeline_queue_size = 2
+    pipeline_drop_policy = "drop_oldest"
+    tile_workers = 1
+    emotion_backend = "eager"
+    emotion_model_dir = "models/emotion"
+    emotion_per_face = False  # эмоция для каждого лица (эмодзи - над лицом)
+    emotion_face_ttl = 3  # на сколько вызовов распознавания (каждые prediction_num кадров) кэшируется эмоция лица
+    ascii_incremental = False
+    ascii_color_tolerance = 6
+    ascii_dirty_debug = False
+    output_sinks = ()  # window, virtual_camera, terminal, shm; пусто - по флагам ниже
+    shm_name = "ascii_frames"
+    shm_slots = 4
+    shm_slot_bytes = 0  # 0 - по первому кадру; больший кадр пересоздает сегмент
+    terminal_output = False  # ASCII-символы ANSI в stdout вместо окна
+    terminal_color_step = 8
+    hud_on = False
+    profiling_on = False
+    profile_allocations = False
+    profile_export_path = ""  # *.json - снимок, *.csv - дописываемый журнал
+    profile_export_interval = 5.0
+    frame_source = "camera"  # camera, file, synthetic
+    source_path = ""  # видео или каталог изображений для file
+    source_loop = True
+    camera_index = 0
+    camera_width = 0  # 0 - по умолчанию драйвера
+    camera_height = 0
+    camera_fps = 0
+    camera_mjpeg = False
+    camera_buffer_size = 1
+    target_fps = 20
+    adaptive_quality = False
+    # Пределы, до которых контроллер качества может удешевлять обработку
+    quality_ascii_size_max = 12
+    quality_processing_scale_min = 0.5
+    quality_face_detect_interval_max = 15
+    quality_blur_radius_min = 1
+    quality_prediction_num_max = 240
     
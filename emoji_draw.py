@@ -1,54 +1,222 @@
+from collections import OrderedDict
 from PIL import Image, ImageDraw, ImageFont
 import numpy as np
 import random
-import emoji
 import cv2
 
-class RisingEmoji:
-    def __init__(self, emoji, speed):
-        self.emoji = emoji
-        self.x = random.randint(20, 600)
-        self.y = 480
-        self.speed = speed * random.uniform(0.8, 1.2) 
-        self.size = random.uniform(0.8, 1.5)
-        self.color = (random.randint(100, 255), 
-                     random.randint(100, 255), 
-                     random.randint(100, 255))
+FONT_PATH = "seguiemj-1.45-3d.ttf"
+
+# Размеры шрифта округляются до корзин, чтобы спрайты переиспользовались
+BASE_FONT_SIZE = 50
+SIZE_BUCKET = 2
+MAX_SPRITES = 256
+
+
+class EmojiParticles:
+    """
+    Всплывающие эмодзи как система частиц
+
+    Положение, скорость, размер и цвет всех эмодзи хранятся в массивах
+    NumPy и сдвигаются одной векторной операцией. Каждый эмодзи рисуется
+    готовой маской (см. get_sprite), окрашенной в его цвет, только в
+    пределах своей рамки.
+    """
+
+    # Поле частицы -> (тип, форма значения одной частицы)
+    FIELDS = {
+        "x": (np.int32, ()),
+        "y": (np.float32, ()),
+        "speed": (np.float32, ()),
+        "size": (np.float32, ()),
+        "color": (np.uint8, (3,)),
+        "symbol": (np.int32, ()),
+    }
+
+    def __init__(self, capacity=64):
+        self.count = 0
+        self.symbols = []
+        self._symbol_ids = {}
+        self._allocate(capacity)
+
+    def _allocate(self, capacity):
+        """Создает массивы полей на capacity частиц, сохраняя живые"""
+        for name, (dtype, shape) in self.FIELDS.items():
+            array = np.zeros((capacity,) + shape, dtype=dtype)
+            old = getattr(self, name, None)
+            if old is not None:
+                array[:self.count] = old[:self.count]
+            setattr(self, name, array)
+
+    def __len__(self):
+        return self.count
+
+    def spawn(self, symbol, speed, rng=random, center_x=None):
+        """
+        Запускает эмодзи снизу кадра
+
+        Случайные параметры берутся из rng в одном и том же порядке, так
+        что при одинаковом состоянии rng эмодзи совпадают.
+
+        Args:
+            symbol: Символ эмодзи
+            speed: Базовая скорость (пикселей за кадр)
+            rng: Генератор случайных чисел (random.Random)
+            center_x: Центр эмодзи по горизонтали (None - случайная позиция)
+
+        Returns:
+            Номер частицы
+        """
+        x = rng.randint(20, 600)
+        speed = speed * rng.uniform(0.8, 1.2)
+        size = rng.uniform(0.8, 1.5)
+        color = (rng.randint(100, 255), rng.randint(100, 255), rng.randint(100, 255))
+        if center_x is not None:
+            x = center_x - int(BASE_FONT_SIZE / 2 * size)
+
+        symbol_id = self._symbol_ids.get(symbol)
+        if symbol_id is None:
+            symbol_id = self._symbol_ids[symbol] = len(self.symbols)
+            self.symbols.append(symbol)
+
+        if self.count == len(self.x):
+            self._allocate(2 * len(self.x))
+        i = self.count
+        self.x[i] = x
+        self.y[i] = 480
+        self.speed[i] = speed
+        self.size[i] = size
+        self.color[i] = color
+        self.symbol[i] = symbol_id
+        self.count += 1
+        return i
+
+    def update(self):
+        """Сдвигает эмодзи вверх и удаляет улетевшие за кадр (порядок сохраняется)"""
+        n = self.count
+        self.y[:n] -= self.speed[:n]
+        alive = self.y[:n] >= -self.size[:n]
+        if not alive.all():
+            keep = np.flatnonzero(alive)
+            for name in self.FIELDS:
+                array = getattr(self, name)
+                array[:len(keep)] = array[keep]
+            self.count = len(keep)
+
+    def clear(self):
+        self.count = 0
 
     def draw(self, frame):
-        """Добавляет эмодзи используя PIL для лучшей поддержки Unicode"""
-        
-        pil_image = Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
-        draw = ImageDraw.Draw(pil_image)
-        
-        font_size = 50 * self.size
-        font_path = "seguiemj-1.45-3d.ttf"
-        try:
-            font = ImageFont.truetype(font_path, font_size, encoding="unic")
-        except IOError:
-            print(f"Font file not found: {font_path}. Using default font.")
-            font = ImageFont.load_default()
-
-        draw.text((self.x, self.y), self.emoji, font=font, fill=self.color)
-
-        cv2_image_result = cv2.cvtColor(np.array(pil_image), cv2.COLOR_RGB2BGR)
-        return cv2_image_result
+        """Рисует эмодзи прямо на кадре BGR (позже запущенные - поверх)"""
+        n = self.count
+        if n == 0:
+            return frame
 
-def draw_emojis(frame, emojis):
-    to_delete = []
+        font_sizes = get_font_sizes(self.size[:n])
+        ys = np.floor(self.y[:n]).astype(np.int32)
+        for i in range(n):
+            sprite = get_sprite(self.symbols[self.symbol[i]], int(font_sizes[i]))
+            blit_sprite(frame, sprite, int(self.x[i]), int(ys[i]), self.color[i, ::-1].tolist())
+        return frame
 
-    for i, emoji in enumerate(emojis):
-        emoji.y -= emoji.speed
-        if emoji.y < -emoji.size:
-            to_delete.append(i)
-            continue
 
-        frame = emoji.draw(frame)
-    
-    for i in to_delete[::-1]:
-        emojis.pop(i)
-    
-    return frame
+def get_font_sizes(sizes):
+    """Размеры шрифта для относительных размеров эмодзи, округленные до корзин"""
+    return (np.rint(BASE_FONT_SIZE * sizes / SIZE_BUCKET) * SIZE_BUCKET).astype(np.int32)
+
+
+# Загруженные шрифты по размеру (размеров - по числу корзин)
+_fonts = {}
+_font_missing = False
+
+def get_font(font_size):
+    """Шрифт эмодзи нужного размера (файл шрифта читается один раз на размер)"""
+    global _font_missing
+    font = _fonts.get(font_size)
+    if font is None:
+        if not _font_missing:
+            try:
+                font = ImageFont.truetype(FONT_PATH, font_size, encoding="unic")
+            except IOError:
+                print(f"Font file not found: {FONT_PATH}. Using default font.")
+                _font_missing = True
+        if font is None:
+            font = ImageFont.load_default(font_size)
+        _fonts[font_size] = font
+    return font
+
+
+# Спрайты: (символ, размер шрифта) -> маска, вытеснение по LRU. Цвет
+# в ключ не входит: маска окрашивается при наложении, поэтому спрайтов
+# не больше, чем символов на корзины размера
+_sprites = OrderedDict()
+
+def get_sprite(symbol, font_size):
+    """
+    Маска эмодзи, отрисованная PIL один раз
+
+    Returns:
+        (alpha, inverse, tinted, dx, dy): альфа и 255 - альфа по трем
+        каналам (uint8), обрезанные по непрозрачной части; tinted -
+        рабочий буфер того же размера для окрашенной маски; (dx, dy) -
+        сдвиг спрайта относительно точки, в которой PIL рисовал бы текст
+    """
+    key = (symbol, font_size)
+    sprite = _sprites.get(key)
+    if sprite is not None:
+        _sprites.move_to_end(key)
+        return sprite
+
+    sprite = render_sprite(symbol, font_size)
+    _sprites[key] = sprite
+    if len(_sprites) > MAX_SPRITES:
+        _sprites.popitem(last=False)
+    return sprite
+
+def render_sprite(symbol, font_size):
+    font = get_font(font_size)
+    left, top, right, bottom = font.getbbox(symbol)
+    image = Image.new("L", (max(1, right - left), max(1, bottom - top)), 0)
+    ImageDraw.Draw(image).text((-left, -top), symbol, font=font, fill=255)
+    alpha = np.asarray(image)
+
+    rows = np.flatnonzero(alpha.any(axis=1))
+    cols = np.flatnonzero(alpha.any(axis=0))
+    if len(rows) == 0:
+        return None
+    y0, y1, x0, x1 = rows[0], rows[-1] + 1, cols[0], cols[-1] + 1
+
+    alpha = np.repeat(alpha[y0:y1, x0:x1, None], 3, axis=2)
+    return alpha, 255 - alpha, np.empty_like(alpha), left + x0, top + y0
+
+def blit_sprite(frame, sprite, x, y, color):
+    """Накладывает маску цвета color (BGR) на кадр в точке (x, y), только в пределах рамки спрайта"""
+    if sprite is None:
+        return
+    alpha, inverse, tinted, dx, dy = sprite
+    height, width = frame.shape[:2]
+    sprite_h, sprite_w = inverse.shape[:2]
+
+    x0, y0 = x + dx, y + dy
+    fx0, fy0 = max(0, x0), max(0, y0)
+    fx1, fy1 = min(width, x0 + sprite_w), min(height, y0 + sprite_h)
+    if fx0 >= fx1 or fy0 >= fy1:
+        return
+
+    roi = frame[fy0:fy1, fx0:fx1]
+    part = (slice(fy0 - y0, fy1 - y0), slice(fx0 - x0, fx1 - x0))
+    # фон * (1 - альфа) + цвет * альфа, на месте
+    cv2.multiply(alpha[part], tuple(color) + (0,), dst=tinted[part], scale=1 / 255)
+    cv2.multiply(roi, inverse[part], dst=roi, scale=1 / 255)
+    cv2.add(roi, tinted[part], dst=roi)
+
+def update_emojis(emojis):
+    """Сдвигает эмодзи вверх и удаляет улетевшие за кадр"""
+    emojis.update()
+
+def draw_emojis(frame, emojis):
+    """Сдвигает эмодзи и рисует их прямо на кадре"""
+    emojis.update()
+    return emojis.draw(frame)
 
 def get_emojis():
     return {
@@ -59,4 +227,4 @@ def get_emojis():
         "fear": "😨",
         "surprise": "😲",
         "happy": "😀",
-    }
\ No newline at end of file
+    }
@@ -0,0 +1,302 @@
+import json
+import os
+import time
+
+import cv2
+import numpy as np
+
+MODEL_NAME = "dima806/facial_emotions_image_detection"
+
+# Имена файлов в локальном кэше модели
+PREPROCESS_FILE = "preprocess.json"
+EXPORTED_FILES = {
+    "torchscript": "model.ts",
+    "torchscript-int8": "model_int8.ts",
+    "onnx": "model.onnx",
+    "onnx-int8": "model_int8.onnx",
+}
+
+BACKENDS = ["eager"] + list(EXPORTED_FILES)
+
+
+class LeanPreprocessor:
+    """
+    Предобработка кадра OpenCV без AutoImageProcessor
+
+    Повторяет шаги процессора модели (resize, rescale, normalize) прямо на
+    массивах NumPy. Порядок каналов не меняется - как и в исходном пути,
+    куда кадр передается без конвертации.
+    """
+
+    def __init__(self, height, width, mean, std, rescale_factor=1 / 255):
+        self.size = (width, height)
+        # (x * rescale - mean) / std == x * scale + offset
+        std = np.asarray(std, dtype=np.float32)
+        self.scale = (rescale_factor / std).astype(np.float32)
+        self.offset = (-np.asarray(mean, dtype=np.float32) / std).astype(np.float32)
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path, encoding="utf-8") as f:
+            params = json.load(f)
+        return cls(params["height"], params["width"], params["mean"],
+                   params["std"], params["rescale_factor"])
+
+    def __call__(self, images):
+        """Список кадров HxWx3 uint8 -> тензор NCHW float32"""
+        batch = np.empty((len(images), 3, self.size[1], self.size[0]), dtype=np.float32)
+        for i, image in enumerate(images):
+            interpolation = cv2.INTER_AREA if image.shape[1] > self.size[0] else cv2.INTER_LINEAR
+            resized = cv2.resize(image, self.size, interpolation=interpolation)
+            normalized = resized.astype(np.float32) * self.scale + self.offset
+            batch[i] = normalized.transpose(2, 0, 1)
+        return batch
+
+
+def softmax(logits):
+    logits = logits - logits.max(axis=-1, keepdims=True)
+    exp = np.exp(logits)
+    return exp / exp.sum(axis=-1, keepdims=True)
+
+
+class EagerBackend:
+    """Исходный путь: AutoImageProcessor + PyTorch fp32"""
+
+    name = "eager"
+
+    def __init__(self):
+        import torch
+        from transformers import AutoImageProcessor, AutoModelForImageClassification
+
+        self.torch = torch
+        self.processor = AutoImageProcessor.from_pretrained(MODEL_NAME, use_fast=True)
+        self.model = AutoModelForImageClassification.from_pretrained(MODEL_NAME)
+        self.model.eval()
+        self.labels = self.model.config.id2label
+
+    def predict_batch(self, images):
+        inputs = self.processor(images=list(images), return_tensors="pt")
+        with self.torch.no_grad():
+            logits = self.model(**inputs).logits
+        return self.torch.nn.functional.softmax(logits, dim=-1).numpy()
+
+
+class TorchScriptBackend:
+    """Экспортированный TorchScript-граф (fp32 или динамический int8)"""
+
+    def __init__(self, name, model_dir):
+        import torch
+
+        self.name = name
+        self.torch = torch
+        self.preprocess, self.labels = load_preprocess(model_dir)
+        self.model = torch.jit.load(os.path.join(model_dir, EXPORTED_FILES[name]), map_location="cpu")
+        self.model.eval()
+
+    def predict_batch(self, images):
+        pixel_values = self.torch.from_numpy(self.preprocess(images))
+        with self.torch.inference_mode():
+            logits = self.model(pixel_values)
+        return softmax(logits.numpy())
+
+
+class OnnxBackend:
+    """Экспортированный ONNX-граф в ONNX Runtime (fp32 или динамический int8)"""
+
+    def __init__(self, name, model_dir):
+        import onnxruntime
+
+        self.name = name
+        self.preprocess, self.labels = load_preprocess(model_dir)
+        self.session = onnxruntime.InferenceSession(
+            os.path.join(model_dir, EXPORTED_FILES[name]),
+            providers=["CPUExecutionProvider"]
+        )
+        self.input_name = self.session.get_inputs()[0].name
+
+    def predict_batch(self, images):
+        logits = self.session.run(None, {self.input_name: self.preprocess(images)})[0]
+        return softmax(logits)
+
+
+def load_preprocess(model_dir):
+    """Читает параметры предобработки и метки классов из кэша модели"""
+    path = os.path.join(model_dir, PREPROCESS_FILE)
+    if not os.path.exists(path):
+        raise FileNotFoundError(
+            f"Модель не экспортирована: {path} (запустите python emotion_backends.py --export)")
+
+    with open(path, encoding="utf-8") as f:
+        labels = {int(k): v for k, v in json.load(f)["id2label"].items()}
+    return LeanPreprocessor.from_file(path), labels
+
+
+def load_backend(name, model_dir):
+    """Создает бэкенд по имени: eager, torchscript[-int8] или onnx[-int8]"""
+    if name == "eager":
+        return EagerBackend()
+    if name.startswith("torchscript"):
+        return TorchScriptBackend(name, model_dir)
+    if name.startswith("onnx"):
+        return OnnxBackend(name, model_dir)
+    raise ValueError(f"Неизвестный бэкенд: {name} (доступны: {', '.join(BACKENDS)})")
+
+
+def export_model(model_dir, formats=None):
+    """
+    Экспортирует модель в локальный кэш (нужен доступ к Hugging Face один раз)
+
+    После экспорта бэкенды torchscript/onnx работают полностью офлайн:
+    им нужны только файлы из model_dir.
+    """
+    import torch
+    from transformers import AutoImageProcessor, AutoModelForImageClassification
+
+    formats = formats or list(EXPORTED_FILES)
+    os.makedirs(model_dir, exist_ok=True)
+
+    processor = AutoImageProcessor.from_pretrained(MODEL_NAME, use_fast=True)
+    model = AutoModelForImageClassification.from_pretrained(MODEL_NAME)
+    model.eval()
+
+    height, width = processor.size["height"], processor.size["width"]
+    with open(os.path.join(model_dir, PREPROCESS_FILE), "w", encoding="utf-8") as f:
+        json.dump({
+            "height": height,
+            "width": width,
+            "mean": list(processor.image_mean),
+            "std": list(processor.image_std),
+            "rescale_factor": processor.rescale_factor,
+            "id2label": model.config.id2label,
+        }, f, ensure_ascii=False, indent=2)
+
+    class LogitsOnly(torch.nn.Module):
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, pixel_values):
+            return self.model(pixel_values=pixel_values).logits
+
+    wrapper = LogitsOnly(model).eval()
+    example = torch.zeros((1, 3, height, width), dtype=torch.float32)
+
+    with torch.no_grad():
+        if "torchscript" in formats:
+            traced = torch.jit.trace(wrapper, example)
+            traced.save(os.path.join(model_dir, EXPORTED_FILES["torchscript"]))
+
+        if "torchscript-int8" in formats:
+            quantized = torch.ao.quantization.quantize_dynamic(
+                wrapper, {torch.nn.Linear}, dtype=torch.qint8)
+            traced = torch.jit.trace(quantized, example)
+            traced.save(os.path.join(model_dir, EXPORTED_FILES["torchscript-int8"]))
+
+        if "onnx" in formats or "onnx-int8" in formats:
+            onnx_path = os.path.join(model_dir, EXPORTED_FILES["onnx"])
+            torch.onnx.export(
+                wrapper, (example,), onnx_path,
+                input_names=["pixel_values"], output_names=["logits"],
+                dynamic_axes={"pixel_values": {0: "batch"}, "logits": {0: "batch"}},
+                opset_version=17, dynamo=False
+            )
+
+    if "onnx-int8" in formats:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        quantize_dynamic(onnx_path, os.path.join(model_dir, EXPORTED_FILES["onnx-int8"]),
+                         weight_type=QuantType.QInt8)
+
+
+def compare_backends(images, names, model_dir, repeats=3):
+    """
+    Сравнивает бэкенды с исходным eager-путем по точности и задержке
+
+    Returns:
+        Список словарей: бэкенд, медиана и p95 задержки на кадр (мс),
+        совпадение top-1 с eager и средняя разница вероятностей
+    """
+    reference = None
+    if "eager" in names:
+        names = ["eager"] + [name for name in names if name != "eager"]
+
+    report = []
+    for name in names:
+        backend = load_backend(name, model_dir)
+        backend.predict_batch(images[:1])
+
+        latencies = []
+        probabilities = []
+        for _ in range(repeats):
+            probabilities = []
+            for image in images:
+                start = time.perf_counter()
+                probabilities.append(backend.predict_batch([image])[0])
+                latencies.append(time.perf_counter() - start)
+        probabilities = np.stack(probabilities)
+
+        row = {
+            "backend": name,
+            "p50_ms": float(np.percentile(latencies, 50) * 1000),
+            "p95_ms": float(np.percentile(latencies, 95) * 1000),
+        }
+        if reference is None and name == "eager":
+            reference = probabilities
+        if reference is not None:
+            row["top1_agreement"] = float(np.mean(probabilities.argmax(1) == reference.argmax(1)))
+            row["mean_abs_prob_diff"] = float(np.mean(np.abs(probabilities - reference)))
+        report.append(row)
+
+    return report
+
+
+def load_images(path, limit=50):
+    """Кадры для сравнения: каталог с изображениями или видеофайл"""
+    images = []
+    if os.path.isdir(path):
+        for name in sorted(os.listdir(path)):
+            image = cv2.imread(os.path.join(path, name))
+            if image is not None:
+                images.append(image)
+            if len(images) >= limit:
+                break
+    else:
+        cap = cv2.VideoCapture(path)
+        while len(images) < limit:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            images.append(frame)
+        cap.release()
+    return images
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Экспорт и сравнение бэкендов классификатора эмоций")
+    parser.add_argument("--model-dir", default=os.path.join("models", "emotion"))
+    parser.add_argument("--export", action="store_true", help="экспортировать модель в --model-dir")
+    parser.add_argument("--compare", metavar="PATH", help="каталог изображений или видео для сравнения")
+    parser.add_argument("--backends", default=",".join(BACKENDS))
+    parser.add_argument("--limit", type=int, default=50)
+    args = parser.parse_args()
+
+    backends = args.backends.split(",")
+
+    if args.export:
+        export_model(args.model_dir, [name for name in backends if name != "eager"])
+        print(f"Модель экспортирована в {args.model_dir}")
+
+    if args.compare:
+        images = load_images(args.compare, args.limit)
+        if not images:
+            raise SystemExit(f"Не найдено кадров: {args.compare}")
+
+        print(f"{'бэкенд':<18} {'p50, мс':>9} {'p95, мс':>9} {'top-1':>7} {'|dp|':>8}")
+        for row in compare_backends(images, backends, args.model_dir):
+            agreement = row.get("top1_agreement")
+            diff = row.get("mean_abs_prob_diff")
+            print(f"{row['backend']:<18} {row['p50_ms']:9.1f} {row['p95_ms']:9.1f} "
+                  f"{'' if agreement is None else f'{agreement:.1%}':>7} "
+                  f"{'' if diff is None else f'{diff:.4f}':>8}")
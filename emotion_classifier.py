@@ -1,27 +1,70 @@
-import torch
-from transformers import AutoImageProcessor, AutoModelForImageClassification
+import os
+import threading
+
+import numpy as np
 
 model_name = "dima806/facial_emotions_image_detection"
 
-processor = AutoImageProcessor.from_pretrained(model_name, use_fast=True)
-model = AutoModelForImageClassification.from_pretrained(model_name)
+# Бэкенд инференса (см. emotion_backends.BACKENDS) и каталог экспортированной модели
+backend_name = "eager"
+model_dir = os.path.join("models", "emotion")
+
+# Модель загружается лениво: torch/transformers/onnxruntime импортируются
+# только при первом распознавании или при фоновом прогреве (prewarm)
+backend = None
+
+_load_lock = threading.Lock()
+_prewarm_thread = None
+
+def use_backend(name, directory=None):
+    """Выбирает бэкенд инференса; модель будет загружена заново при первом вызове"""
+    global backend_name, model_dir, backend, _prewarm_thread
+
+    with _load_lock:
+        directory = directory or model_dir
+        if name == backend_name and directory == model_dir:
+            return
+        backend_name = name
+        model_dir = directory
+        backend = None
+        _prewarm_thread = None
+
+def load_model():
+    """Загружает выбранный бэкенд (один раз, потокобезопасно)"""
+    global backend
+
+    with _load_lock:
+        if backend is None:
+            import emotion_backends
+
+            backend = emotion_backends.load_backend(backend_name, model_dir)
+
+    return backend
+
+def is_loaded():
+    return backend is not None
+
+def prewarm():
+    """Начинает загрузку модели в фоновом потоке, не блокируя вызывающего"""
+    global _prewarm_thread
+
+    if backend is not None or _prewarm_thread is not None:
+        return
+
+    _prewarm_thread = threading.Thread(target=load_model, name="emotion-prewarm", daemon=True)
+    _prewarm_thread.start()
 
 def predict_emotion(image, threshold):
+    model = load_model()
 
-    inputs = processor(images=image, return_tensors="pt")
-    
-    with torch.no_grad():
-        outputs = model(**inputs)
-        logits = outputs.logits
-        probabilities = torch.nn.functional.softmax(logits, dim=-1)[0]
-    
-    confidence, predicted_class = torch.max(probabilities, dim=-1)
-    confidence = confidence.item()
-    predicted_class = predicted_class.item()
+    probabilities = model.predict_batch([image])[0]
+
+    predicted_class = int(np.argmax(probabilities))
+    confidence = float(probabilities[predicted_class])
     
-    emotion_label = model.config.id2label[predicted_class]
+    emotion_label = model.labels[predicted_class]
 
     if confidence >= threshold:
         return emotion_label
 
-    return None
\ No newline at end of file
+    return None
@@ -0,0 +1,123 @@
+import threading
+import time
+from collections import deque
+
+from profiler import PROFILER
+
+class EmotionWorker:
+    """
+    Фоновое распознавание эмоций
+
+    Кадры передаются через "почтовый ящик" на одно место: если модель еще
+    занята, новый кадр заменяет ожидающий (старый считается сброшенным).
+    Готовые эмоции забираются из цикла захвата через poll() без ожидания.
+    """
+
+    def __init__(self, predict):
+        """
+        Args:
+            predict: Функция predict(frame, threshold) -> эмоция, список
+                     эмоций по лицам или None (пустой список не передается)
+        """
+        self.predict = predict
+
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._request = None
+        self._results = deque()
+        self._running = False
+        self._busy = False
+        self._thread = None
+
+        # Статистика
+        self.submitted = 0
+        self.dropped = 0
+        self.completed = 0
+        self.last_latency = 0.0
+        self.total_latency = 0.0
+
+    def start(self):
+        """Запускает фоновый поток"""
+        with self._lock:
+            if self._running:
+                return
+            self._running = True
+        self._thread = threading.Thread(target=self._run, name="emotion-worker", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=1.0):
+        """Останавливает фоновый поток (текущий прогон модели не прерывается)"""
+        with self._lock:
+            self._running = False
+            self._request = None
+            self._wakeup.notify()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def submit(self, frame, threshold):
+        """Кладет кадр в почтовый ящик, вытесняя еще не обработанный"""
+        with self._lock:
+            if self._request is not None:
+                self.dropped += 1
+            self._request = (frame.copy(), threshold)
+            self.submitted += 1
+            self._publish()
+            self._wakeup.notify()
+
+    def poll(self):
+        """Возвращает список эмоций, распознанных с прошлого вызова"""
+        emotions = []
+        while self._results:
+            emotions.append(self._results.popleft())
+        return emotions
+
+    def stats(self):
+        """Глубина очереди, число сброшенных кадров и задержка инференса"""
+        with self._lock:
+            queue_depth = int(self._request is not None) + int(self._busy)
+            completed = self.completed
+            return {
+                "queue_depth": queue_depth,
+                "submitted": self.submitted,
+                "dropped": self.dropped,
+                "completed": completed,
+                "last_latency_ms": self.last_latency * 1000,
+                "avg_latency_ms": self.total_latency / completed * 1000 if completed else 0.0,
+            }
+
+    def _publish(self):
+        """Глубина очереди и сброшенные кадры - в счетчики профилировщика (под self._lock)"""
+        PROFILER.set_gauge("emotion_queue", int(self._request is not None) + int(self._busy))
+        PROFILER.set_gauge("emotion_dropped", self.dropped)
+
+    def _run(self):
+        while True:
+            with self._lock:
+                while self._running and self._request is None:
+                    self._wakeup.wait()
+                if not self._running:
+                    return
+                frame, threshold = self._request
+                self._request = None
+                self._busy = True
+                self._publish()
+
+            start = time.perf_counter()
+            try:
+                emotion = self.predict(frame, threshold)
+            except Exception as e:
+                print(f"Ошибка распознавания эмоции: {e}")
+                emotion = None
+            latency = time.perf_counter() - start
+            PROFILER.record("inference", latency)
+
+            with self._lock:
+                self._busy = False
+                self.completed += 1
+                self.last_latency = latency
+                self.total_latency += latency
+                self._publish()
+
+            if emotion:
+                self._results.append(emotion)
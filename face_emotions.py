@@ -0,0 +1,111 @@
+import itertools
+import cv2
+import numpy as np
+import emotion_classifier
+from anime_filters import FACE_CASCADE_FILE, box_iou
+
+
+class FaceEmotionRecognizer:
+    """
+    Эмоции для каждого лица в кадре
+
+    Лица находятся каскадом Хаара, вырезаются с запасом и классифицируются
+    одним пакетом (predict_batch). Лицо сопоставляется с лицами прошлого
+    вызова по пересечению рамок и получает постоянный номер; его эмоция
+    кэшируется на ttl_calls вызовов, так что неподвижные лица не
+    классифицируются повторно. Срок считается в вызовах, а не в секундах:
+    распознавание запускается раз в prediction_num кадров, и интервал
+    между вызовами меняется вместе с частотой кадров и prediction_num.
+    Лица, не найденные в очередном кадре, забываются.
+    """
+
+    def __init__(self, ttl_calls=3, detect_scale=0.5, margin=0.2, min_iou=0.3, face_cascade=None):
+        """
+        Args:
+            ttl_calls: Сколько вызовов predict эмоция лица считается актуальной
+            detect_scale: Масштаб кадра для детекции
+            margin: Запас вокруг рамки лица при вырезании (доля размера)
+            min_iou: Минимальное пересечение рамок для того же лица
+            face_cascade: Каскад Хаара; по умолчанию - собственный экземпляр,
+                          т.к. вызов идет из фонового потока параллельно с
+                          аниме-фильтром, а каскад не потокобезопасен
+        """
+        self.ttl_calls = max(1, ttl_calls)
+        self.detect_scale = detect_scale
+        self.margin = margin
+        self.min_iou = min_iou
+        self.face_cascade = face_cascade or cv2.CascadeClassifier(cv2.data.haarcascades + FACE_CASCADE_FILE)
+
+        # Номер лица -> {"box", "emotion", "expires"}; expires - номер вызова
+        self.tracks = {}
+        self._ids = itertools.count(1)
+
+        # Статистика
+        self.calls = 0
+        self.faces = 0
+        self.classified = 0
+
+    def detect(self, frame):
+        """Рамки лиц (x, y, w, h) в координатах кадра"""
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        small = cv2.resize(gray, None, fx=self.detect_scale, fy=self.detect_scale,
+                           interpolation=cv2.INTER_AREA)
+        min_size = max(8, int(round(30 * self.detect_scale)))
+        faces = self.face_cascade.detectMultiScale(small, scaleFactor=1.1, minNeighbors=5,
+                                                   minSize=(min_size, min_size))
+        return [tuple(int(round(v / self.detect_scale)) for v in face) for face in faces]
+
+    def crop(self, frame, box):
+        h, w = frame.shape[:2]
+        x, y, width, height = box
+        dx, dy = int(width * self.margin), int(height * self.margin)
+        return frame[max(0, y - dy):min(h, y + height + dy), max(0, x - dx):min(w, x + width + dx)]
+
+    def predict(self, frame, threshold):
+        """
+        Эмоции всех лиц кадра
+
+        Returns:
+            Список (номер лица, рамка, эмоция) для лиц, чья эмоция
+            распознана с уверенностью не ниже threshold
+        """
+        boxes = [box for box in self.detect(frame) if self.crop(frame, box).size > 0]
+
+        tracks = {}
+        pending = []
+        for box in boxes:
+            track_id = max(self.tracks, key=lambda i: box_iou(self.tracks[i]["box"], box), default=None)
+            if track_id is None or track_id in tracks or box_iou(self.tracks[track_id]["box"], box) < self.min_iou:
+                track_id = next(self._ids)
+                track = {"emotion": None, "expires": 0}
+            else:
+                track = self.tracks[track_id]
+            track["box"] = box
+            tracks[track_id] = track
+            if track["expires"] <= self.calls:
+                pending.append(track_id)
+        self.tracks = tracks
+
+        # Новые лица и лица с устаревшей эмоцией - одним пакетом
+        if pending:
+            model = emotion_classifier.load_model()
+            probabilities = model.predict_batch([self.crop(frame, tracks[i]["box"]) for i in pending])
+            for track_id, probs in zip(pending, probabilities):
+                predicted_class = int(np.argmax(probs))
+                confident = float(probs[predicted_class]) >= threshold
+                tracks[track_id]["emotion"] = model.labels[predicted_class] if confident else None
+                tracks[track_id]["expires"] = self.calls + self.ttl_calls
+
+        self.calls += 1
+        self.faces += len(tracks)
+        self.classified += len(pending)
+
+        return [(track_id, track["box"], track["emotion"])
+                for track_id, track in tracks.items() if track["emotion"] is not None]
+
+    def stats(self):
+        """Лиц за вызов и доля лиц, которые пришлось классифицировать"""
+        return {
+            "faces_per_call": self.faces / self.calls if self.calls else 0.0,
+            "classified_ratio": self.classified / self.faces if self.faces else 0.0,
+        }
@@ -0,0 +1,253 @@
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+
+DROP_POLICIES = ["drop_oldest", "drop_newest", "block"]
+
+
+class Packet:
+    """Кадр, проходящий по конвейеру"""
+
+    def __init__(self, seq, source):
+        self.seq = seq
+        self.timestamp = time.perf_counter()
+        self.source = source  # исходный кадр с камеры
+        self.frame = source   # результат последней стадии
+        self.stage_time = 0.0  # время самой долгой стадии над кадром, с
+
+
+class FrameQueue:
+    """
+    Ограниченная очередь кадров между стадиями
+
+    При переполнении поступает согласно политике:
+        drop_oldest - выбрасывает самый старый кадр (минимальная задержка);
+        drop_newest - выбрасывает новый кадр;
+        block - ждет, пока следующая стадия освободит место.
+    """
+
+    def __init__(self, maxsize=2, drop_policy="drop_oldest"):
+        if drop_policy not in DROP_POLICIES:
+            raise ValueError(f"Неизвестная политика: {drop_policy} (доступны: {', '.join(DROP_POLICIES)})")
+
+        self.maxsize = max(1, maxsize)
+        self.drop_policy = drop_policy
+        self.dropped = 0
+        self.closed = False
+
+        self._items = deque()
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+        self._not_full = threading.Condition(self._lock)
+
+    def __len__(self):
+        return len(self._items)
+
+    def put(self, item):
+        """Кладет элемент; False, если очередь закрыта или элемент сброшен"""
+        with self._lock:
+            if self.drop_policy == "block":
+                while not self.closed and len(self._items) >= self.maxsize:
+                    self._not_full.wait()
+            if self.closed:
+                return False
+
+            if len(self._items) >= self.maxsize:
+                self.dropped += 1
+                if self.drop_policy == "drop_newest":
+                    return False
+                self._items.popleft()
+
+            self._items.append(item)
+            self._not_empty.notify()
+            return True
+
+    def get(self, timeout=None):
+        """Берет самый старый элемент; None по таймауту или после закрытия"""
+        with self._lock:
+            if not self._items and not self.closed:
+                self._not_empty.wait(timeout)
+            if not self._items:
+                return None
+
+            item = self._items.popleft()
+            self._not_full.notify()
+            return item
+
+    def close(self):
+        with self._lock:
+            self.closed = True
+            self._not_empty.notify_all()
+            self._not_full.notify_all()
+
+
+class Pipeline:
+    """
+    Конвейер "захват -> стадии обработки -> вывод" на отдельных потоках
+
+    Захват и каждая стадия работают в своем потоке и связаны ограниченными
+    очередями, поэтому пропускная способность определяется самой медленной
+    стадией, а не суммой всех (OpenCV отпускает GIL). У каждой стадии
+    один поток, а очереди FIFO, так что порядок кадров сохраняется.
+    Вывод забирает кадры через get() в вызывающем (главном) потоке -
+    этого требует HighGUI.
+
+    Кадр, на котором стадия упала с исключением, сбрасывается (ошибка
+    пишется в stderr). После max_errors ошибок подряд стадия
+    останавливается и закрывает свою выходную очередь, так что вывод
+    видит конец потока (finished), а не ждет кадров вечно. Ошибка
+    захвата тоже завершает поток.
+    """
+
+    def __init__(self, read_frame, stages, queue_size=2, drop_policy="drop_oldest", max_errors=30):
+        """
+        Args:
+            read_frame: Функция без аргументов -> (ret, frame), как cap.read
+            stages: Список (имя, функция(packet) -> packet или None для сброса)
+            queue_size: Размер очереди перед каждой стадией и перед выводом
+            drop_policy: Политика переполнения очередей (см. FrameQueue)
+            max_errors: Сколько ошибок подряд стадия переживает
+        """
+        self.read_frame = read_frame
+        self.stages = stages
+        self.max_errors = max(1, max_errors)
+        self.queues = [FrameQueue(queue_size, drop_policy) for _ in range(len(stages) + 1)]
+
+        self._running = False
+        self._threads = []
+        self._stage_time = {name: 0.0 for name, _ in stages}
+        self._stage_count = {name: 0 for name, _ in stages}
+        self._stage_errors = {name: 0 for name, _ in stages}
+        self._latencies = deque(maxlen=120)
+        self._last_seq = -1
+        self._last_output = None
+
+    def start(self):
+        self._running = True
+        self._threads = [threading.Thread(target=self._capture, name="pipeline-capture", daemon=True)]
+        for i, (name, func) in enumerate(self.stages):
+            self._threads.append(threading.Thread(
+                target=self._stage, args=(name, func, self.queues[i], self.queues[i + 1]),
+                name=f"pipeline-{name}", daemon=True
+            ))
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self, timeout=1.0):
+        self._running = False
+        for queue in self.queues:
+            queue.close()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    @property
+    def finished(self):
+        """Захват завершился и все кадры уже выданы"""
+        output = self.queues[-1]
+        return output.closed and len(output) == 0
+
+    def get(self, timeout=0.05, pace=False):
+        """
+        Следующий готовый кадр или None
+
+        Args:
+            timeout: Сколько ждать кадр, с
+            pace: Выдерживать между кадрами те же интервалы, что были
+                  между ними при захвате
+        """
+        packet = self.queues[-1].get(timeout)
+        if packet is None:
+            return None
+
+        # Кадр, обогнанный более новым, уже не нужен
+        if packet.seq <= self._last_seq:
+            return None
+
+        if pace and self._last_output is not None:
+            last_timestamp, last_shown = self._last_output
+            delay = (packet.timestamp - last_timestamp) - (time.perf_counter() - last_shown)
+            if delay > 0:
+                time.sleep(delay)
+
+        self._last_seq = packet.seq
+        self._last_output = (packet.timestamp, time.perf_counter())
+        self._latencies.append(time.perf_counter() - packet.timestamp)
+        return packet
+
+    def stats(self):
+        """Глубина очередей, сброшенные кадры, время стадий и сквозная задержка"""
+        names = [name for name, _ in self.stages] + ["output"]
+        latencies = sorted(self._latencies)
+        return {
+            "queues": {
+                name: {"depth": len(queue), "dropped": queue.dropped}
+                for name, queue in zip(names, self.queues)
+            },
+            "stage_ms": {
+                name: self._stage_time[name] / count * 1000 if count else 0.0
+                for name, count in self._stage_count.items()
+            },
+            "errors": dict(self._stage_errors),
+            "latency_ms": sum(latencies) / len(latencies) * 1000 if latencies else 0.0,
+            "latency_p95_ms": latencies[int(len(latencies) * 0.95)] * 1000 if latencies else 0.0,
+        }
+
+    def _capture(self):
+        seq = 0
+        try:
+            while self._running:
+                ret, frame = self.read_frame()
+                if not ret:
+                    break
+                self.queues[0].put(Packet(seq, frame))
+                seq += 1
+        except Exception:
+            print("Ошибка захвата кадра, поток остановлен:", file=sys.stderr)
+            traceback.print_exc()
+        finally:
+            self.queues[0].close()
+
+    def _stage(self, name, func, source, target):
+        failures = 0
+        try:
+            while self._running:
+                packet = source.get(timeout=0.1)
+                if packet is None:
+                    if source.closed:
+                        break
+                    continue
+
+                start = time.perf_counter()
+                try:
+                    result = func(packet)
+                except Exception as e:
+                    failures += 1
+                    self._stage_errors[name] += 1
+                    self._report_error(name, packet, e, failures)
+                    if failures >= self.max_errors:
+                        break
+                    continue
+                failures = 0
+                elapsed = time.perf_counter() - start
+                packet.stage_time = max(packet.stage_time, elapsed)
+                packet = result
+                self._stage_time[name] += elapsed
+                self._stage_count[name] += 1
+
+                if packet is not None:
+                    target.put(packet)
+        finally:
+            target.close()
+
+    def _report_error(self, name, packet, error, failures):
+        if self._stage_errors[name] == 1:
+            # Полный стек - только для первой ошибки стадии
+            print(f"Ошибка в стадии {name} (кадр {packet.seq}):", file=sys.stderr)
+            traceback.print_exc()
+        else:
+            print(f"Ошибка в стадии {name} (кадр {packet.seq} сброшен): {error!r}", file=sys.stderr)
+        if failures >= self.max_errors:
+            print(f"Стадия {name} остановлена после {failures} ошибок подряд", file=sys.stderr)
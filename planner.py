@@ -0,0 +1,126 @@
+import ascii_filters
+
+
+class Plan:
+    """
+    Порядок стадий process_frame и разрешения, на которых они работают
+
+    Attributes:
+        input_size: (h, w) входного кадра
+        work_size: (h, w), до которого кадр уменьшается перед первой
+                   стадией (None - без уменьшения)
+        stages: Включенные стадии по порядку: anime, ascii, blur
+        grid: (h, w) сетки ASCII-клеток (None - ASCII выключен)
+        output_size: (h, w), до которого растягивается результат
+                     (None - без растяжения)
+        sizes: Стадия -> (h, w) ее входа
+    """
+
+    def __init__(self, input_size):
+        self.input_size = input_size
+        self.work_size = None
+        self.stages = []
+        self.grid = None
+        self.output_size = None
+        self.sizes = {}
+        self._description = None
+
+    @property
+    def last(self):
+        """Стадия, которая пишет итоговый кадр"""
+        if self.output_size is not None:
+            return "scale"
+        return self.stages[-1] if self.stages else None
+
+    def add(self, stage, size):
+        self.sizes[stage] = size
+        self._description = None
+
+    def describe(self):
+        """Стадии и их разрешения одной строкой (строится один раз на план)"""
+        if self._description is None:
+            self._description = " > ".join(f"{stage} {w}x{h}" for stage, (h, w) in self.sizes.items())
+        return self._description
+
+
+def build_plan(config, shape, raster_ascii=True):
+    """
+    Выбирает, где уменьшать кадр и на каком разрешении работает каждая стадия
+
+    Модели стоимости стадий нет: по умолчанию план выбирает только
+    преобразования, не меняющие результат, и дорогие сочетания (аниме
+    с ASCII) остаются такими же дорогими. Ускорение за счет вида -
+    только по явному planner_ascii_oversample (случаи [oversampleN]
+    в benchmark.py показывают время и PSNR относительно обычного плана).
+
+    Без planner_ascii_oversample результат совпадает с последовательным
+    применением стадий; план лишь убирает лишние проходы:
+    - ASCII без аниме и без processing_scale < 1 уменьшает кадр до сетки
+      клеток сразу (то же INTER_AREA, что и в самой стадии). Два подряд
+      уменьшения в одно не сводятся - это изменило бы результат.
+    - planner_ascii_oversample > 0 (по желанию, вид меняется): аниме-фильтр
+      работает не на полном кадре, а на сетке клеток, увеличенной в
+      столько раз, - дальше сетки кадр все равно усредняется.
+    - Медианный фильтр - последний, на том разрешении, которое к нему
+      пришло, но до растяжения при processing_scale < 1.
+    - При raster_ascii=False стадии ASCII нет, даже если он включен.
+    """
+    height, width = shape[:2]
+    ascii_on = config.ascii_on and raster_ascii
+    plan = Plan((height, width))
+    plan.stages = [name for name, on in (("anime", config.anime_on), ("ascii", ascii_on),
+                                         ("blur", config.median_blur_on)) if on]
+    if not plan.stages:
+        return plan
+
+    size = (height, width)
+    if config.processing_scale < 1.0:
+        size = (max(1, int(height * config.processing_scale)), max(1, int(width * config.processing_scale)))
+        plan.output_size = (height, width)
+
+    work_size = size
+    if ascii_on:
+        plan.grid = ascii_filters.get_new_shape(config, size)
+        if not config.anime_on:
+            if plan.output_size is None:
+                work_size = plan.grid
+        elif config.planner_ascii_oversample > 0:
+            oversample = config.planner_ascii_oversample
+            oversized = (plan.grid[0] * oversample, plan.grid[1] * oversample)
+            if oversized[0] < size[0] and oversized[1] < size[1]:
+                work_size = oversized
+
+    if work_size != (height, width):
+        plan.work_size = work_size
+        plan.add("resize", (height, width))
+
+    size = work_size
+    if config.anime_on:
+        plan.add("anime", size)
+    if ascii_on:
+        if size != plan.grid:
+            plan.add("ascii_resize", size)
+        size = (plan.grid[0] * config.ascii_size, plan.grid[1] * config.ascii_size)
+        plan.add("ascii", size)
+    if config.median_blur_on:
+        plan.add("blur", size)
+    if plan.output_size is not None:
+        plan.add("scale", plan.output_size)
+    return plan
+
+
+# План пересчитывается, только когда меняются влияющие на него параметры
+_plans = {}
+MAX_PLANS = 32
+
+def get_plan(config, shape, raster_ascii=True):
+    key = (shape[:2], config.anime_on, config.ascii_on and raster_ascii, config.median_blur_on,
+           config.anime_style, config.ascii_size, config.median_blur_size,
+           config.processing_scale, config.planner_ascii_oversample)
+    plan = _plans.get(key)
+    if plan is None:
+        if len(_plans) >= MAX_PLANS:
+            _plans.clear()
+        plan = build_plan(config, shape, raster_ascii)
+        _plans[key] = plan
+    return plan
@@ -3,20 +3,73 @@ import cv2
 import numpy as np
 import ascii_filters
 import anime_filters
+import tiling
+import planner
+from buffers import get_buffer
+from profiler import PROFILER
  
-def process_frame(config, frame):
+def process_frame(config, frame, ring=None, raster_ascii=True):
+    """
+    Применяет включенные фильтры к кадру
+
+    Порядок стадий и их разрешения выбирает planner.get_plan.
+    Промежуточные результаты стадий пишутся в буферы пула, а итог
+    последней стадии - в новый массив или в очередной кадр кольца ring
+    (buffers.FrameRing), если кадр уходит дальше по конвейеру.
+    При raster_ascii=False стадия ASCII пропускается, даже если включена:
+    символы строит сам приемник (вывод в терминал).
+    """
+    plan = planner.get_plan(config, frame.shape, raster_ascii)
+    if not plan.stages:
+        return frame
+    PROFILER.set_gauge("plan", plan.describe())
+
+    def target(stage, shape):
+        if stage != plan.last:
+            return get_buffer("process_" + stage, shape)
+        return ring.get(shape) if ring is not None else None
+
+    if plan.work_size is not None:
+        small_height, small_width = plan.work_size
+        frame = cv2.resize(frame, (small_width, small_height),
+                           dst=get_buffer("process_small", (small_height, small_width, 3)),
+                           interpolation=cv2.INTER_AREA)
+
     if config.anime_on:
-        anime_filter = anime_filters.get_filter(config)
-        frame = anime_filter.apply(frame)
+        with PROFILER.stage("anime"):
+            anime_filter = anime_filters.get_filter(config)
+            frame = anime_filter.apply_tiled(frame, config.tile_workers,
+                                             dst=target("anime", frame.shape))
 
-    if config.ascii_on:
-        new_height, new_width = ascii_filters.get_new_shape(config, frame.shape)
-        result_frame = ascii_filters.resize(frame, new_height, new_width)
-        result_frame = ascii_filters.enhance(result_frame)
-        result_frame = ascii_filters.create_pixel_ascii_image(config, result_frame)
-        frame = result_frame
+    if plan.grid is not None:
+        with PROFILER.stage("ascii"):
+            new_height, new_width = plan.grid
+            result_frame = frame
+            if frame.shape[:2] != plan.grid:
+                result_frame = ascii_filters.resize(frame, new_height, new_width,
+                                                    dst=get_buffer("ascii_small", (new_height, new_width, 3)))
+            result_frame = ascii_filters.enhance(result_frame, config.tile_workers,
+                                                 dst=get_buffer("ascii_enhanced", result_frame.shape))
+            size = config.ascii_size
+            dst = target("ascii", (new_height * size, new_width * size, 3))
+            if config.ascii_incremental:
+                renderer = ascii_filters.get_incremental_renderer()
+                # Дальше по конвейеру кадр дорисовывают на месте, поэтому
+                # постоянный буфер рендерера копируется, только если ASCII - последняя стадия
+                result_frame = renderer.render(config, result_frame, dst=dst, copy=plan.last == "ascii")
+                PROFILER.set_gauge("ascii_dirty", f"{renderer.dirty_fraction():.0%}")
+            else:
+                result_frame = ascii_filters.create_pixel_ascii_image(config, result_frame, dst=dst)
+            frame = result_frame
         
     if config.median_blur_on:
-        frame = cv2.medianBlur(frame, config.median_blur_size)
+        with PROFILER.stage("blur"):
+            frame = tiling.median_blur(frame, config.median_blur_size, config.tile_workers,
+                                       dst=target("blur", frame.shape))
+
+    if plan.output_size is not None:
+        height, width = plan.output_size
+        frame = cv2.resize(frame, (width, height), dst=target("scale", (height, width, 3)),
+                           interpolation=cv2.INTER_LINEAR)
 
-    return frame
\ No newline at end of file
+    return frame
@@ -0,0 +1,221 @@
+import csv
+import json
+import os
+import threading
+import time
+import tracemalloc
+from collections import deque
+
+import cv2
+import numpy as np
+
+# Границы корзин гистограммы задержек, мс
+HISTOGRAM_BINS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+
+class _NullTimer:
+    """Таймер выключенного профилировщика: ничего не делает"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NULL_TIMER = _NullTimer()
+
+
+class _StageTimer:
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        if self.profiler.track_allocations and tracemalloc.is_tracing():
+            self.memory = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+        else:
+            self.memory = None
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.start
+        allocated = None
+        if self.memory is not None:
+            allocated = max(0, tracemalloc.get_traced_memory()[1] - self.memory)
+        self.profiler.record(self.name, elapsed, allocated)
+        return False
+
+
+class StageStats:
+    """Скользящая статистика одной стадии"""
+
+    def __init__(self, window):
+        self.samples = deque(maxlen=window)
+        self.histogram = [0] * (len(HISTOGRAM_BINS_MS) + 1)
+        self.count = 0
+        self.allocations = 0
+        self.allocated_bytes = 0
+
+    def add(self, seconds, allocated=None):
+        ms = seconds * 1000
+        self.samples.append(ms)
+        self.count += 1
+        self.histogram[int(np.searchsorted(HISTOGRAM_BINS_MS, ms, side="right"))] += 1
+        if allocated:
+            self.allocations += 1
+            self.allocated_bytes += allocated
+
+    def summary(self):
+        samples = sorted(self.samples)
+        return {
+            "count": self.count,
+            "last_ms": self.samples[-1] if self.samples else 0.0,
+            "avg_ms": sum(samples) / len(samples) if samples else 0.0,
+            "p95_ms": samples[int(len(samples) * 0.95)] if samples else 0.0,
+            "histogram": dict(zip([f"<{b}" for b in HISTOGRAM_BINS_MS] + [f">={HISTOGRAM_BINS_MS[-1]}"],
+                                  self.histogram)),
+            "allocations": self.allocations,
+            "allocated_mb": self.allocated_bytes / 2 ** 20,
+        }
+
+
+class Profiler:
+    """
+    Именованные таймеры стадий, скользящий FPS и гистограммы задержек
+
+    Пока профилировщик выключен, stage() возвращает общий пустой таймер,
+    так что замеры почти ничего не стоят. Учет выделений памяти
+    (track_allocations) идет через tracemalloc; он общий для процесса,
+    поэтому при конвейере из нескольких потоков выделения соседних
+    стадий могут попадать в чужой счетчик.
+    """
+
+    def __init__(self, window=120):
+        self.enabled = False
+        self.track_allocations = False
+        self.window = window
+
+        self._stages = {}
+        self._gauges = {}
+        self._frames = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self._last_export = 0.0
+        self._started_tracing = False
+
+    def stage(self, name):
+        """Контекстный менеджер, замеряющий стадию name"""
+        if not self.enabled:
+            return NULL_TIMER
+        return _StageTimer(self, name)
+
+    def record(self, name, seconds, allocated=None):
+        if not self.enabled:
+            return
+        stats = self._stages.get(name)
+        if stats is None:
+            with self._lock:
+                stats = self._stages.setdefault(name, StageStats(self.window))
+        stats.add(seconds, allocated)
+
+    def set_gauge(self, name, value):
+        """Текущее значение счетчика (глубина очереди, сброшенные кадры)"""
+        if self.enabled:
+            self._gauges[name] = value
+
+    def frame_done(self):
+        """Отмечает выведенный кадр (для скользящего FPS)"""
+        if self.enabled:
+            self._frames.append(time.perf_counter())
+
+    def fps(self):
+        frames = list(self._frames)
+        if len(frames) < 2 or frames[-1] == frames[0]:
+            return 0.0
+        return (len(frames) - 1) / (frames[-1] - frames[0])
+
+    def set_allocation_tracking(self, enabled):
+        self.track_allocations = enabled
+        if enabled and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+        elif not enabled and self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    def reset(self):
+        with self._lock:
+            self._stages = {}
+            self._gauges = {}
+            self._frames.clear()
+
+    def summary(self):
+        with self._lock:
+            stages = dict(self._stages)
+        return {
+            "timestamp": time.time(),
+            "fps": self.fps(),
+            "stages": {name: stats.summary() for name, stats in stages.items()},
+            "gauges": dict(self._gauges),
+        }
+
+    def draw_hud(self, frame):
+        """Рисует панель с FPS и временем стадий в левом верхнем углу кадра"""
+        summary = self.summary()
+        lines = [f"FPS {summary['fps']:.1f}"]
+        for name, stats in summary["stages"].items():
+            lines.append(f"{name:<9} {stats['avg_ms']:6.1f} ms  p95 {stats['p95_ms']:6.1f}")
+        for name, value in summary["gauges"].items():
+            lines.append(f"{name:<9} {value}")
+
+        line_height = 16
+        h = min(frame.shape[0], line_height * len(lines) + 8)
+        w = min(frame.shape[1], 260)
+
+        # Полупрозрачная подложка только под панелью
+        roi = frame[:h, :w]
+        cv2.convertScaleAbs(roi, dst=roi, alpha=0.4)
+
+        for i, line in enumerate(lines):
+            cv2.putText(frame, line, (6, line_height * (i + 1)), cv2.FONT_HERSHEY_SIMPLEX,
+                        0.42, (0, 255, 0), 1, cv2.LINE_AA)
+        return frame
+
+    def maybe_export(self, path, interval):
+        """
+        Раз в interval секунд выгружает статистику
+
+        *.csv - дописывает строки (время, стадия, метрики),
+        иначе перезаписывает JSON со снимком статистики.
+        """
+        now = time.monotonic()
+        if not path or now - self._last_export < interval:
+            return
+        self._last_export = now
+
+        summary = self.summary()
+        if path.endswith(".csv"):
+            new_file = not os.path.exists(path)
+            with open(path, "a", newline="", encoding="utf-8") as f:
+                writer = csv.writer(f)
+                if new_file:
+                    writer.writerow(["timestamp", "fps", "stage", "count", "last_ms",
+                                     "avg_ms", "p95_ms", "allocations", "allocated_mb"])
+                # Счетчики пишутся строками со значением в столбце count
+                for name, stats in summary["stages"].items():
+                    writer.writerow([f"{summary['timestamp']:.3f}", f"{summary['fps']:.2f}", name,
+                                     stats["count"], f"{stats['last_ms']:.3f}", f"{stats['avg_ms']:.3f}",
+                                     f"{stats['p95_ms']:.3f}", stats["allocations"],
+                                     f"{stats['allocated_mb']:.3f}"])
+                for name, value in summary["gauges"].items():
+                    writer.writerow([f"{summary['timestamp']:.3f}", f"{summary['fps']:.2f}", name, value,
+                                     "", "", "", "", ""])
+        else:
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(summary, f, ensure_ascii=False, indent=2)
+
+
+# Общий профилировщик приложения
+PROFILER = Profiler()
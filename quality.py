@@ -0,0 +1,150 @@
+import sys
+from collections import deque
+
+from profiler import PROFILER
+
+
+class Knob:
+    """
+    Параметр качества, который контроллер может менять
+
+    Args:
+        name: Атрибут конфигурации
+        step: Шаг в сторону удешевления (знак задает направление)
+        limit: Атрибут конфигурации с пределом удешевления
+        active: Функция config -> bool: влияет ли параметр сейчас
+    """
+
+    def __init__(self, name, step, limit, active):
+        self.name = name
+        self.step = step
+        self.limit = limit
+        self.active = active
+
+    def cheaper(self, config):
+        """Следующее, более дешевое значение или None, если предел достигнут"""
+        value = getattr(config, self.name)
+        limit = getattr(config, self.limit)
+        new_value = round(value + self.step, 2)
+        if (new_value - limit) * self.step > 0:
+            return None
+        return new_value
+
+    def better(self, config, original):
+        """Следующее, более качественное значение или None, если оно уже исходное"""
+        value = getattr(config, self.name)
+        new_value = round(value - self.step, 2)
+        if (original - new_value) * self.step > 0:
+            return None
+        return new_value
+
+
+# Параметры в порядке удешевления: сначала незаметные, в конце - разрешение
+KNOBS = [
+    Knob("face_detect_interval", 2, "quality_face_detect_interval_max",
+         lambda config: config.anime_on and config.anime_style == 1),
+    Knob("prediction_num", 30, "quality_prediction_num_max", lambda config: config.emoji_on),
+    Knob("anime_blur_radius", -1, "quality_blur_radius_min",
+         lambda config: config.anime_on and config.anime_style == 1),
+    Knob("ascii_size", 1, "quality_ascii_size_max", lambda config: config.ascii_on),
+    Knob("processing_scale", -0.1, "quality_processing_scale_min",
+         lambda config: config.anime_on or config.ascii_on or config.median_blur_on),
+]
+
+
+class QualityController:
+    """
+    Обратная связь по времени обработки кадра
+
+    Сглаженное время кадра сравнивается с бюджетом 1 / target_fps. Если оно
+    дольше degrade_frames кадров подряд выше бюджета на high_margin, один
+    параметр из KNOBS сдвигается в сторону удешевления; если дольше
+    upgrade_frames кадров ниже low_margin бюджета - качество возвращается
+    в обратном порядке, но не выше исходных значений. После каждого
+    решения контроллер ждет cooldown_frames кадров, пока время не устоится.
+    Разные пороги и выдержки и дают гистерезис без колебаний.
+
+    Если пользователь сам меняет параметр (клавишами), новое значение
+    становится исходным: контроллер не вернет параметр к старому.
+    Решения пишутся в stderr (stdout может быть занят выводом кадров в
+    терминал), а также видны в профилировщике (счетчик quality, HUD)
+    и в decisions.
+    """
+
+    def __init__(self, config, smoothing=0.1, high_margin=1.1, low_margin=0.7,
+                 degrade_frames=15, upgrade_frames=90, cooldown_frames=30, max_decisions=100):
+        self.config = config
+        self.smoothing = smoothing
+        self.high_margin = high_margin
+        self.low_margin = low_margin
+        self.degrade_frames = degrade_frames
+        self.upgrade_frames = upgrade_frames
+        self.cooldown_frames = cooldown_frames
+
+        self.original = {knob.name: getattr(config, knob.name) for knob in KNOBS}
+        # Значения, которые контроллер видел или выставил последними
+        self._values = dict(self.original)
+        self.frame_time = None
+        self._over = 0
+        self._under = 0
+        self._cooldown = 0
+        self.decisions = deque(maxlen=max_decisions)
+
+    def budget(self):
+        return 1.0 / self.config.target_fps
+
+    def update(self, seconds):
+        """
+        Учитывает время очередного кадра и при необходимости меняет параметры
+
+        Для конвейера это время самой медленной стадии: стадии работают
+        параллельно, и частоту кадров ограничивает она, а не их сумма.
+        """
+        self._rebase_user_changes()
+        if self.frame_time is None:
+            self.frame_time = seconds
+        else:
+            self.frame_time += self.smoothing * (seconds - self.frame_time)
+
+        if not self.config.adaptive_quality:
+            return
+        if self._cooldown > 0:
+            self._cooldown -= 1
+            return
+
+        budget = self.budget()
+        self._over = self._over + 1 if self.frame_time > budget * self.high_margin else 0
+        self._under = self._under + 1 if self.frame_time < budget * self.low_margin else 0
+
+        if self._over >= self.degrade_frames:
+            self._adjust(KNOBS, lambda knob: knob.cheaper(self.config), "хуже")
+        elif self._under >= self.upgrade_frames:
+            self._adjust(reversed(KNOBS),
+                         lambda knob: knob.better(self.config, self.original[knob.name]), "лучше")
+
+    def _rebase_user_changes(self):
+        for knob in KNOBS:
+            value = getattr(self.config, knob.name)
+            if value != self._values[knob.name]:
+                self.original[knob.name] = self._values[knob.name] = value
+
+    def _adjust(self, knobs, propose, direction):
+        self._over = self._under = 0
+        for knob in knobs:
+            if not knob.active(self.config):
+                continue
+            value = propose(knob)
+            if value is None:
+                continue
+
+            old_value = getattr(self.config, knob.name)
+            setattr(self.config, knob.name, value)
+            self._values[knob.name] = value
+            self._cooldown = self.cooldown_frames
+            self.decisions.append((knob.name, old_value, value))
+            message = f"{direction}: {knob.name} {old_value}->{value}"
+            # Не stdout: при выводе в терминал он испортил бы кадр
+            print(f"Качество {message} (время кадра {self.frame_time * 1000:.1f} мс, "
+                  f"бюджет {self.budget() * 1000:.1f} мс)", file=sys.stderr)
+            PROFILER.set_gauge("quality", message)
+            return
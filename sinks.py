@@ -0,0 +1,392 @@
+import sys
+import time
+import cv2
+import numpy as np
+from abc import ABC, abstractmethod
+from multiprocessing import shared_memory
+
+# Разметка общей памяти (все поля - int64):
+#   заголовок: MAGIC, число слотов, байт данных в слоте, номер последнего кадра,
+#              поколение сегмента, признак замены сегмента новым
+#   слот: номер кадра, высота, ширина, каналы, время (нс), байт данных; затем данные
+SHM_MAGIC = 0x41534349_4931  # "ASCII1"
+HEADER_FIELDS = 8
+SLOT_FIELDS = 8
+SLOT_ALIGN = 64
+HEADER_GENERATION = 4
+HEADER_RETIRED = 5
+
+
+class FrameSink(ABC):
+    """Абстрактный приемник обработанных кадров"""
+
+    # Выдерживать ли между кадрами интервалы захвата (для показа на экране)
+    pace = False
+    # Строит ли приемник ASCII из кадра сам (растровый ASCII ему не нужен)
+    draws_ascii = False
+    # Читаются ли клавиши (cv2.waitKey работает только при открытом окне)
+    reads_keys = False
+
+    @abstractmethod
+    def send(self, frame):
+        """Выводит кадр (вызывается в главном потоке)"""
+        pass
+
+    def close(self):
+        """Освобождает ресурсы приемника"""
+        pass
+
+
+class WindowSink(FrameSink):
+    """Окно HighGUI"""
+
+    pace = True
+    reads_keys = True
+
+    def __init__(self, title='Video Capture'):
+        self.title = title
+
+    def send(self, frame):
+        cv2.imshow(self.title, frame)
+
+    def close(self):
+        cv2.destroyWindow(self.title)
+
+
+class VirtualCameraSink(FrameSink):
+    """
+    Виртуальная камера pyvirtualcam
+
+    Камера открывается по размеру первого кадра; кадры другого размера
+    (например, после смены размера ASCII) приводятся к нему.
+    """
+
+    def __init__(self, fps=20):
+        self.fps = fps
+        self.cam = None
+        self._resized = None
+
+    def send(self, frame):
+        if self.cam is None:
+            import pyvirtualcam
+            self.cam = pyvirtualcam.Camera(width=frame.shape[1], height=frame.shape[0], fps=self.fps)
+
+        if frame.shape[:2] != (self.cam.height, self.cam.width):
+            if self._resized is None or self._resized.shape[:2] != (self.cam.height, self.cam.width):
+                self._resized = np.empty((self.cam.height, self.cam.width, 3), dtype=np.uint8)
+            frame = cv2.resize(frame, (self.cam.width, self.cam.height), dst=self._resized)
+
+        self.cam.send(frame)
+        self.cam.sleep_until_next_frame()
+
+    def close(self):
+        if self.cam is not None:
+            self.cam.close()
+            self.cam = None
+
+
+class TerminalSink(FrameSink):
+    """ASCII-символы ANSI в терминал или двоичный поток (см. terminal.AnsiRenderer)"""
+
+    pace = True
+    draws_ascii = True
+
+    def __init__(self, config, stream=None):
+        from terminal import AnsiRenderer
+
+        self.config = config
+        self.renderer = AnsiRenderer(stream, config.terminal_color_step)
+
+    def send(self, frame):
+        self.renderer.write_frame(self.config, frame)
+
+    def close(self):
+        self.renderer.close()
+
+
+class SharedMemorySink(FrameSink):
+    """
+    Кольцо кадров в общей памяти для локальных процессов-потребителей
+
+    Каждый кадр получает номер и пишется в слот номер % slots. Перед
+    записью номер слота обнуляется, после - выставляется, поэтому читатель
+    (SharedMemoryReader) отличает целый кадр от перезаписываемого.
+    Читателей может быть сколько угодно: каждый сам помнит, какой кадр
+    прочитал последним, и по разрыву номеров считает пропущенные.
+
+    Если кадр не помещается в слот (выключили ASCII, увеличили клетку),
+    сегмент создается заново под тем же именем с большими слотами и
+    следующим поколением, а в старом выставляется признак замены: увидев
+    его, читатели переподключаются. Номера кадров продолжаются.
+    """
+
+    def __init__(self, name="ascii_frames", slots=4, slot_bytes=None):
+        """
+        Args:
+            name: Имя сегмента общей памяти
+            slots: Число слотов кольца
+            slot_bytes: Начальный размер слота (None - по первому кадру)
+        """
+        self.name = name
+        self.slots = max(2, slots)
+        self.slot_bytes = slot_bytes
+        self.shm = None
+        self.header = None
+        self.seq = 0
+        self.generation = 0
+
+    def send(self, frame):
+        if self.shm is None:
+            self._create(self.slot_bytes or frame.nbytes)
+        elif frame.nbytes > self.slot_bytes:
+            print(f"Общая память {self.name}: кадр {frame.nbytes} байт больше слота "
+                  f"{self.slot_bytes} байт, сегмент пересоздается")
+            self._create(frame.nbytes)
+
+        self.seq += 1
+        meta, data = self._slot(self.seq % self.slots)
+        meta[0] = 0
+        data[:frame.nbytes] = frame.reshape(-1)
+        height, width = frame.shape[:2]
+        channels = frame.shape[2] if frame.ndim == 3 else 1
+        meta[1:6] = (height, width, channels, time.time_ns(), frame.nbytes)
+        meta[0] = self.seq
+        self.header[3] = self.seq
+
+    def close(self):
+        if self.shm is not None:
+            self.header = None
+            self.shm.close()
+            self.shm.unlink()
+            self.shm = None
+
+    def _create(self, slot_bytes):
+        """Создает сегмент (или заменяет текущий новым поколением)"""
+        old_shm, old_header = self.shm, self.header
+        if old_shm is not None:
+            # Имя освобождается сразу, но память старого сегмента живет,
+            # пока ее не отпустят подключенные читатели
+            old_shm.unlink()
+
+        self.slot_bytes = -(-slot_bytes // SLOT_ALIGN) * SLOT_ALIGN
+        size = shm_size(self.slots, self.slot_bytes)
+        try:
+            self.shm = shared_memory.SharedMemory(self.name, create=True, size=size)
+        except FileExistsError:
+            # Сегмент остался от упавшего процесса
+            stale = shared_memory.SharedMemory(self.name)
+            stale.close()
+            stale.unlink()
+            self.shm = shared_memory.SharedMemory(self.name, create=True, size=size)
+
+        self.generation += 1
+        self.header = np.ndarray((HEADER_FIELDS,), dtype=np.int64, buffer=self.shm.buf)
+        self.header[:] = 0
+        self.header[1:5] = (self.slots, self.slot_bytes, self.seq, self.generation)
+        # MAGIC - последним: по нему читатель понимает, что заголовок готов
+        self.header[0] = SHM_MAGIC
+
+        if old_shm is not None:
+            # Новый сегмент готов - читатели старого могут переподключаться
+            old_header[HEADER_RETIRED] = 1
+            old_shm.close()
+
+    def _slot(self, index):
+        return slot_views(self.shm.buf, index, self.slot_bytes)
+
+
+def shm_size(slots, slot_bytes):
+    return HEADER_FIELDS * 8 + slots * (SLOT_FIELDS * 8 + slot_bytes)
+
+
+def slot_views(buffer, index, slot_bytes):
+    """Метаданные и данные слота index (представления без копирования)"""
+    offset = HEADER_FIELDS * 8 + index * (SLOT_FIELDS * 8 + slot_bytes)
+    meta = np.ndarray((SLOT_FIELDS,), dtype=np.int64, buffer=buffer, offset=offset)
+    data = np.ndarray((slot_bytes,), dtype=np.uint8, buffer=buffer, offset=offset + SLOT_FIELDS * 8)
+    return meta, data
+
+
+def attach_shared_memory(name):
+    """
+    Подключается к чужому сегменту общей памяти
+
+    До Python 3.13 resource_tracker удалял бы сегмент при выходе читателя,
+    поэтому сегмент снимается с его учета.
+    """
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name, track=False)
+
+    from multiprocessing import resource_tracker
+    shm = shared_memory.SharedMemory(name)
+    resource_tracker.unregister(shm._name, "shared_memory")
+    return shm
+
+
+class SharedMemoryReader:
+    """
+    Читатель кольца SharedMemorySink в другом процессе
+
+    read() возвращает представление кадра прямо в общей памяти, без копии.
+    Писатель может перезаписать слот, пока читатель с ним работает, поэтому
+    после обработки стоит проверить is_valid(seq) (или читать с copy=True).
+    """
+
+    def __init__(self, name="ascii_frames"):
+        self.name = name
+        self.shm = None
+        self.header = None
+        self._attach()
+
+        self.last_seq = 0
+        self.dropped = 0
+        self.torn = 0
+        self.reattached = 0
+
+    def _attach(self):
+        shm = attach_shared_memory(self.name)
+        header = np.ndarray((HEADER_FIELDS,), dtype=np.int64, buffer=shm.buf)
+        if header[0] != SHM_MAGIC:
+            header = None
+            shm.close()
+            raise ValueError(f"Сегмент {self.name} не является кольцом кадров")
+
+        old_shm = self.shm
+        self.shm = shm
+        self.header = header
+        self.slots = int(header[1])
+        self.slot_bytes = int(header[2])
+        self.generation = int(header[HEADER_GENERATION])
+        if old_shm is not None:
+            try:
+                old_shm.close()
+            except BufferError:
+                # Кадры старого сегмента еще используются - память
+                # освободится вместе с ними
+                pass
+
+    def _check_retired(self):
+        """Переподключается, если писатель заменил сегмент новым поколением"""
+        if not self.header[HEADER_RETIRED]:
+            return
+        try:
+            self._attach()
+        except (FileNotFoundError, ValueError):
+            return  # новый сегмент еще не готов - попробуем при следующем чтении
+        self.reattached += 1
+
+    def latest_seq(self):
+        return int(self.header[3])
+
+    def read(self, timeout=None, copy=False):
+        """
+        Следующий кадр после прочитанного
+
+        Если читатель отстал больше чем на кольцо, пропущенные кадры
+        учитываются в dropped, а читается самый старый из доступных.
+
+        Returns:
+            (номер, кадр) или (None, None) по таймауту
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            self._check_retired()
+            latest = self.latest_seq()
+            if latest > self.last_seq:
+                wanted = max(self.last_seq + 1, latest - self.slots + 1)
+                self.dropped += wanted - self.last_seq - 1
+                frame = self._read_slot(wanted, copy)
+                if frame is not None:
+                    self.last_seq = wanted
+                    return wanted, frame
+                # Слот уже перезаписан - пробуем догнать писателя
+                self.torn += 1
+                self.dropped += 1
+                self.last_seq = wanted
+                continue
+
+            if deadline is not None and time.monotonic() >= deadline:
+                return None, None
+            time.sleep(0.001)
+
+    def is_valid(self, seq):
+        """Кадр seq все еще лежит в своем слоте (не перезаписан)"""
+        meta, _ = slot_views(self.shm.buf, seq % self.slots, self.slot_bytes)
+        return int(meta[0]) == seq
+
+    def _read_slot(self, seq, copy):
+        meta, data = slot_views(self.shm.buf, seq % self.slots, self.slot_bytes)
+        if int(meta[0]) != seq:
+            return None
+        height, width, channels, _, nbytes = (int(value) for value in meta[1:6])
+        frame = data[:nbytes].reshape((height, width, channels) if channels > 1 else (height, width))
+        if copy:
+            frame = frame.copy()
+            if int(meta[0]) != seq:
+                return None
+        return frame
+
+    def stats(self):
+        return {"last_seq": self.last_seq, "dropped": self.dropped, "torn": self.torn,
+                "generation": self.generation, "reattached": self.reattached}
+
+    def close(self):
+        self.header = None
+        self.shm.close()
+
+
+# Реестр приемников: имя -> фабрика(config)
+SINKS = {
+    "window": lambda config: WindowSink(),
+    "virtual_camera": lambda config: VirtualCameraSink(config.target_fps),
+    "terminal": lambda config: TerminalSink(config),
+    "shm": lambda config: SharedMemorySink(config.shm_name, config.shm_slots, config.shm_slot_bytes or None),
+}
+
+
+def get_sink_names(config):
+    """Имена приемников из config.output_sinks или, если он пуст, из старых флагов"""
+    if config.output_sinks:
+        return list(config.output_sinks)
+    if config.terminal_output:
+        return ["terminal"]
+    if config.use_virtual_camera:
+        return ["virtual_camera"]
+    return ["window"]
+
+
+def create_sinks(config):
+    sinks = []
+    for name in get_sink_names(config):
+        factory = SINKS.get(name)
+        if factory is None:
+            raise ValueError(f"Неизвестный приемник: {name} (доступны: {', '.join(SINKS)})")
+        sinks.append(factory(config))
+    return sinks
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Просмотр кадров из общей памяти (SharedMemorySink)")
+    parser.add_argument("name", nargs="?", default="ascii_frames")
+    parser.add_argument("--no-window", action="store_true", help="только считать кадры и пропуски")
+    args = parser.parse_args()
+
+    reader = SharedMemoryReader(args.name)
+    try:
+        while True:
+            seq, frame = reader.read(timeout=1.0)
+            if seq is None:
+                continue
+            if not args.no_window:
+                cv2.imshow(f"shm: {args.name}", frame)
+                if cv2.waitKey(1) & 0xFF == 27:
+                    break
+            if seq % 100 == 0:
+                print(f"кадр {seq}: {reader.stats()}")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(reader.stats())
+        reader.close()
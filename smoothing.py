@@ -0,0 +1,222 @@
+import time
+import cv2
+import numpy as np
+from buffers import get_buffer
+
+# Параметры исходного двустороннего фильтра
+SIGMA_COLOR = 75
+SIGMA_SPACE = 75
+
+SMOOTHERS = ["bilateral", "guided", "domain", "proxy"]
+
+
+def smooth(frame, mode, radius, dst=None):
+    """
+    Сглаживание с сохранением краев
+
+    Args:
+        frame: Кадр BGR uint8
+        mode: bilateral - исходный двусторонний фильтр;
+              guided - управляемый фильтр (guided filter);
+              domain - рекурсивный фильтр доменного преобразования;
+              proxy - двусторонний фильтр на кадре половинного размера
+                      с восстановлением краев управляемым апсемплингом
+        radius: Радиус сглаживания (как blur_radius у аниме-фильтров)
+        dst: Массив для результата (None - создать новый)
+    """
+    if mode == "bilateral":
+        return bilateral_smooth(frame, radius, dst)
+    if mode == "guided":
+        return guided_smooth(frame, radius, dst=dst)
+    if mode == "domain":
+        return domain_smooth(frame, radius, dst)
+    if mode == "proxy":
+        return proxy_smooth(frame, radius, dst=dst)
+    raise ValueError(f"Неизвестный режим сглаживания: {mode} (доступны: {', '.join(SMOOTHERS)})")
+
+
+def footprint(mode, radius, factor=2):
+    """Радиус (в строках полного кадра), от которого зависит результат сглаживания"""
+    if mode == "bilateral":
+        return radius
+    small_radius = max(1, radius // factor)
+    if mode == "guided":
+        # Два прохода box-фильтра на уменьшенном кадре + интерполяция
+        return factor * (2 * small_radius + 2)
+    if mode == "proxy":
+        # Двусторонний фильтр и два box-фильтра на уменьшенном кадре
+        return factor * (3 * small_radius + 2)
+    if mode == "domain":
+        # Рекурсивный фильтр влияет бесконечно далеко; вклад за 3 sigma пренебрежимо мал
+        return 3 * max(1, radius * 2)
+    raise ValueError(f"Неизвестный режим сглаживания: {mode} (доступны: {', '.join(SMOOTHERS)})")
+
+
+def bilateral_smooth(frame, radius, dst=None):
+    return cv2.bilateralFilter(frame, d=radius * 2 + 1,
+                               sigmaColor=SIGMA_COLOR, sigmaSpace=SIGMA_SPACE, dst=dst)
+
+
+def guided_smooth(frame, radius, eps=(SIGMA_COLOR / 3) ** 2, factor=2, dst=None):
+    """
+    Быстрый самоуправляемый guided filter (He, Sun) по каждому каналу
+
+    Коэффициенты считаются на кадре, уменьшенном в factor раз;
+    стоимость не зависит от радиуса.
+    """
+    small = downscale(frame, factor)
+    small_f = to_float32(small, "guided_small_f")
+    small_radius = max(1, radius // factor)
+    return upsample_guided(frame, small_f, small_f, small_radius, eps, dst)
+
+
+def domain_smooth(frame, radius, dst=None):
+    """Рекурсивный фильтр доменного преобразования (Gastal, Oliveira)"""
+    sigma_spatial = max(1, radius * 2)
+    if hasattr(cv2, "ximgproc"):
+        return cv2.ximgproc.dtFilter(frame, frame, sigma_spatial, SIGMA_COLOR, dst=dst,
+                                     mode=cv2.ximgproc.DTF_RF, numIters=3)
+    # Без opencv-contrib - та же идея в модуле photo (заметно медленнее)
+    return cv2.edgePreservingFilter(frame, dst=dst, flags=cv2.RECURS_FILTER,
+                                    sigma_s=sigma_spatial,
+                                    sigma_r=SIGMA_COLOR / 255)
+
+
+def proxy_smooth(frame, radius, eps=(SIGMA_COLOR / 8) ** 2, factor=2, dst=None):
+    """
+    Двусторонний фильтр на уменьшенной копии кадра
+
+    Коэффициенты локальной линейной модели "вход -> сглаженный" считаются
+    на малом кадре, интерполируются до полного размера и применяются
+    к исходному кадру, поэтому края остаются резкими.
+    """
+    small = downscale(frame, factor)
+    small_radius = max(1, radius // factor)
+    smoothed = bilateral_smooth(small, small_radius, dst=get_buffer("proxy_smoothed", small.shape))
+    return upsample_guided(frame, to_float32(small, "proxy_guide"), to_float32(smoothed, "proxy_target"),
+                           small_radius, eps, dst)
+
+
+def downscale(frame, factor):
+    h, w = frame.shape[:2]
+    small_h, small_w = max(1, h // factor), max(1, w // factor)
+    return cv2.resize(frame, (small_w, small_h), dst=get_buffer("smooth_small", (small_h, small_w) + frame.shape[2:]),
+                      interpolation=cv2.INTER_AREA)
+
+
+def to_float32(image, name):
+    """Копия image во float32 в буфере пула name"""
+    result = get_buffer(name, image.shape, np.float32)
+    np.copyto(result, image)
+    return result
+
+
+def upsample_guided(frame, small_guide, small_target, radius, eps, dst=None):
+    """
+    Переносит преобразование small_guide -> small_target на полный кадр
+
+    Полноразмерные промежуточные массивы берутся из пула буферов.
+    """
+    h, w = frame.shape[:2]
+    shape = frame.shape
+    a, b = guided_coefficients(small_guide, small_target, radius, eps)
+    a = cv2.resize(a, (w, h), dst=get_buffer("guided_a", shape, np.float32),
+                   interpolation=cv2.INTER_LINEAR)
+    b = cv2.resize(b, (w, h), dst=get_buffer("guided_b", shape, np.float32),
+                   interpolation=cv2.INTER_LINEAR)
+    result = cv2.multiply(a, frame, dst=get_buffer("guided_result", shape, np.float32),
+                          dtype=cv2.CV_32F)
+    result += b
+    return to_uint8(result, dst)
+
+
+def guided_coefficients(guide, src, radius, eps):
+    """
+    Коэффициенты (a, b) guided filter: src ~ a * guide + b в окне радиуса radius
+
+    Все промежуточные массивы - буферы пула (операции OpenCV с dst).
+    """
+    size = (2 * radius + 1, 2 * radius + 1)
+
+    def buffer(name):
+        return get_buffer("guided_" + name, guide.shape, np.float32)
+
+    mean_i = cv2.boxFilter(guide, -1, size, dst=buffer("mean_i"))
+    mean_p = cv2.boxFilter(src, -1, size, dst=buffer("mean_p"))
+    product = cv2.multiply(guide, src, dst=buffer("product"))
+    corr_ip = cv2.boxFilter(product, -1, size, dst=buffer("corr_ip"))
+    product = cv2.multiply(guide, guide, dst=product)
+    corr_ii = cv2.boxFilter(product, -1, size, dst=buffer("corr_ii"))
+
+    # a = (corr_ip - mean_i * mean_p) / (corr_ii - mean_i * mean_i + eps)
+    covariance = cv2.multiply(mean_i, mean_p, dst=buffer("covariance"))
+    cv2.subtract(corr_ip, covariance, dst=covariance)
+    variance = cv2.multiply(mean_i, mean_i, dst=buffer("variance"))
+    cv2.subtract(corr_ii, variance, dst=variance)
+    variance += eps
+    a = cv2.divide(covariance, variance, dst=buffer("a_small"))
+    # b = mean_p - a * mean_i
+    b = cv2.multiply(a, mean_i, dst=buffer("b_small"))
+    cv2.subtract(mean_p, b, dst=b)
+    return (cv2.boxFilter(a, -1, size, dst=buffer("a_mean")),
+            cv2.boxFilter(b, -1, size, dst=buffer("b_mean")))
+
+
+def to_uint8(image, dst=None):
+    """float32 -> uint8 с округлением и насыщением (отрицательные - в ноль)"""
+    cv2.max(image, 0, dst=image)
+    return cv2.convertScaleAbs(image, dst=dst)
+
+
+def psnr(reference, image):
+    mse = np.mean((reference.astype(np.float32) - image.astype(np.float32)) ** 2)
+    return float("inf") if mse == 0 else float(10 * np.log10(255 ** 2 / mse))
+
+
+def compare_smoothers(frame, radius, repeats=10):
+    """
+    Сравнивает режимы сглаживания с исходным двусторонним фильтром
+
+    Returns:
+        Список словарей: режим, медиана времени (мс), PSNR относительно
+        результата bilateral (дБ)
+    """
+    reference = bilateral_smooth(frame, radius)
+    report = []
+    for mode in SMOOTHERS:
+        result = smooth(frame, mode, radius)
+        times = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            smooth(frame, mode, radius)
+            times.append(time.perf_counter() - start)
+        report.append({
+            "mode": mode,
+            "ms": float(np.median(times) * 1000),
+            "psnr_db": psnr(reference, result),
+        })
+    return report
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Сравнение режимов сглаживания аниме-фильтра")
+    parser.add_argument("image", nargs="?", help="изображение (по умолчанию - кадр с камеры)")
+    parser.add_argument("--radius", type=int, default=3)
+    parser.add_argument("--repeats", type=int, default=10)
+    args = parser.parse_args()
+
+    if args.image:
+        frame = cv2.imread(args.image)
+    else:
+        cap = cv2.VideoCapture(0)
+        _, frame = cap.read()
+        cap.release()
+    if frame is None:
+        raise SystemExit("Не удалось получить изображение")
+
+    print(f"{frame.shape[1]}x{frame.shape[0]}, радиус {args.radius}")
+    print(f"{'режим':<10} {'мс':>8} {'PSNR, дБ':>9}")
+    for row in compare_smoothers(frame, args.radius, args.repeats):
+        print(f"{row['mode']:<10} {row['ms']:8.1f} {row['psnr_db']:9.1f}")
@@ -0,0 +1,333 @@
+import os
+import threading
+import time
+import cv2
+import numpy as np
+from abc import ABC, abstractmethod
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp")
+
+
+class FrameSource(ABC):
+    """
+    Абстрактный источник кадров
+
+    read() возвращает (ret, frame), как cv2.VideoCapture.read, поэтому
+    источник подставляется в Pipeline вместо cap.read. Кадр принадлежит
+    получателю: источник его больше не трогает.
+    """
+
+    def __init__(self):
+        self.frames = 0
+        self.dropped = 0
+        self._started = None
+        self._next_time = None
+
+    @abstractmethod
+    def read(self):
+        """Следующий кадр: (True, frame) или (False, None), если кадров больше нет"""
+        pass
+
+    def is_opened(self):
+        return True
+
+    def release(self):
+        """Освобождает устройство или файл"""
+        pass
+
+    def stats(self):
+        """Выдано кадров, сброшено кадров и фактическая частота выдачи"""
+        elapsed = time.perf_counter() - self._started if self._started is not None else 0.0
+        return {
+            "frames": self.frames,
+            "dropped": self.dropped,
+            "fps": self.frames / elapsed if elapsed > 0 else 0.0,
+        }
+
+    def _delivered(self):
+        if self._started is None:
+            self._started = time.perf_counter()
+        self.frames += 1
+
+    def _pace(self, fps):
+        """Ждет времени следующего кадра при частоте fps (0 - без ожидания)"""
+        if fps <= 0:
+            return
+        interval = 1.0 / fps
+        now = time.perf_counter()
+        # Отставший получатель не получает пачку кадров подряд
+        if self._next_time is None or now - self._next_time > interval:
+            self._next_time = now
+        elif self._next_time > now:
+            time.sleep(self._next_time - now)
+        self._next_time += interval
+
+
+class CameraSource(FrameSource):
+    """
+    Камера с захватом в фоновом потоке
+
+    Поток непрерывно читает камеру и хранит только последний кадр, а
+    read() отдает его (или ждет следующий). Так драйвер не копит кадры
+    в своем буфере, и обработка всегда получает самый свежий кадр; кадры,
+    которые никто не успел забрать, учитываются в dropped.
+    """
+
+    def __init__(self, index=0, width=0, height=0, fps=0, mjpeg=False, buffer_size=1):
+        """
+        Args:
+            index: Номер камеры
+            width, height: Запрашиваемое разрешение (0 - по умолчанию драйвера)
+            fps: Запрашиваемая частота кадров (0 - по умолчанию)
+            mjpeg: Запросить сжатие MJPEG (на USB-камерах дает больше
+                   кадров в секунду при высоком разрешении)
+            buffer_size: Размер буфера драйвера (0 - не менять)
+        """
+        super().__init__()
+        self.cap = cv2.VideoCapture(index)
+        if self.cap.isOpened():
+            # FOURCC выставляется до разрешения, иначе драйвер может его не принять
+            if mjpeg:
+                self.cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*"MJPG"))
+            if width:
+                self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+            if height:
+                self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+            if fps:
+                self.cap.set(cv2.CAP_PROP_FPS, fps)
+            if buffer_size:
+                self.cap.set(cv2.CAP_PROP_BUFFERSIZE, buffer_size)
+
+        self.grabbed = 0
+        self._latest = None
+        self._read_seq = 0
+        self._cond = threading.Condition()
+        self._running = self.cap.isOpened()
+        self._thread = None
+        if self._running:
+            self._thread = threading.Thread(target=self._grab, name="camera-grabber", daemon=True)
+            self._thread.start()
+
+    def _grab(self):
+        while self._running:
+            ret, frame = self.cap.read()
+            with self._cond:
+                if not ret:
+                    self._running = False
+                    self._cond.notify_all()
+                    break
+                # Прошлый кадр так никто и не забрал
+                if self.grabbed > self._read_seq:
+                    self.dropped += 1
+                self.grabbed += 1
+                self._latest = frame
+                self._cond.notify_all()
+
+    def read(self):
+        with self._cond:
+            while self._running and self.grabbed == self._read_seq:
+                self._cond.wait(0.1)
+            if self.grabbed == self._read_seq:
+                return False, None
+
+            frame = self._latest
+            self._latest = None
+            self._read_seq = self.grabbed
+        self._delivered()
+        return True, frame
+
+    def is_opened(self):
+        return self.cap.isOpened()
+
+    def release(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(1.0)
+            self._thread = None
+        self.cap.release()
+
+    def stats(self):
+        stats = super().stats()
+        fourcc = int(self.cap.get(cv2.CAP_PROP_FOURCC)) if self.cap.isOpened() else 0
+        stats.update({
+            "grabbed": self.grabbed,
+            "width": int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+            "height": int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+            "camera_fps": self.cap.get(cv2.CAP_PROP_FPS),
+            "fourcc": fourcc.to_bytes(4, "little").decode("ascii", "replace"),
+        })
+        return stats
+
+
+class FileSource(FrameSource):
+    """
+    Повтор видеофайла или каталога изображений
+
+    При realtime кадры выдаются с частотой записи, как с камеры, что
+    позволяет мерить задержку и пропускную способность без камеры;
+    иначе - так быстро, как их забирают.
+    """
+
+    def __init__(self, path, loop=False, realtime=True, fps=0):
+        """
+        Args:
+            path: Видеофайл или каталог изображений (в порядке имен)
+            loop: Начинать сначала после последнего кадра
+            realtime: Выдерживать частоту кадров
+            fps: Частота (0 - из видео, для изображений - 30)
+        """
+        super().__init__()
+        self.path = path
+        self.loop = loop
+        self.realtime = realtime
+
+        self.cap = None
+        self.images = None
+        self._index = 0
+        if os.path.isdir(path):
+            self.images = [os.path.join(path, name) for name in sorted(os.listdir(path))
+                           if name.lower().endswith(IMAGE_EXTENSIONS)]
+            self.fps = fps or 30
+        else:
+            self.cap = cv2.VideoCapture(path)
+            self.fps = fps or self.cap.get(cv2.CAP_PROP_FPS) or 30
+
+    def _next(self):
+        if self.cap is not None:
+            ret, frame = self.cap.read()
+            return frame if ret else None
+
+        while self._index < len(self.images):
+            frame = cv2.imread(self.images[self._index])
+            self._index += 1
+            if frame is not None:
+                return frame
+        return None
+
+    def _rewind(self):
+        if self.cap is not None:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+        self._index = 0
+
+    def read(self):
+        frame = self._next()
+        if frame is None and self.loop and self.frames > 0:
+            self._rewind()
+            frame = self._next()
+        if frame is None:
+            return False, None
+
+        if self.realtime:
+            self._pace(self.fps)
+        self._delivered()
+        return True, frame
+
+    def is_opened(self):
+        if self.cap is not None:
+            return self.cap.isOpened()
+        return len(self.images) > 0
+
+    def release(self):
+        if self.cap is not None:
+            self.cap.release()
+
+
+class SyntheticSource(FrameSource):
+    """
+    Синтетическая сцена: движущийся градиент с шахматной доской и кругом
+
+    Кадр определяется только своим номером, поэтому прогоны повторяемы.
+    """
+
+    def __init__(self, width=640, height=480, fps=30, frames=0):
+        """
+        Args:
+            width, height: Размер кадра
+            fps: Частота кадров (0 - без ожидания)
+            frames: Сколько кадров выдать (0 - бесконечно)
+        """
+        super().__init__()
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.limit = frames
+
+        # Фон вдвое шире кадра: движение - это сдвиг окна по нему
+        y, x = np.mgrid[0:height, 0:2 * width]
+        background = np.empty((height, 2 * width, 3), dtype=np.uint8)
+        background[:, :, 0] = (x * 255 // (2 * width - 1)).astype(np.uint8)
+        background[:, :, 1] = (y * 255 // max(1, height - 1)).astype(np.uint8)
+        background[:, :, 2] = np.where((x // 40 + y // 40) % 2 == 0, 200, 60).astype(np.uint8)
+        self.background = background
+
+    def read(self):
+        if self.limit and self.frames >= self.limit:
+            return False, None
+
+        n = self.frames
+        offset = (n * 4) % self.width
+        frame = self.background[:, offset:offset + self.width].copy()
+
+        center = (int(self.width / 2 + self.width / 3 * np.cos(n / 20)),
+                  int(self.height / 2 + self.height / 3 * np.sin(n / 15)))
+        cv2.circle(frame, center, max(4, min(self.width, self.height) // 8), (255, 255, 255), -1, cv2.LINE_AA)
+
+        self._pace(self.fps)
+        self._delivered()
+        return True, frame
+
+
+# Реестр источников: имя -> фабрика(config)
+SOURCES = {
+    "camera": lambda config: CameraSource(config.camera_index, config.camera_width, config.camera_height,
+                                          config.camera_fps, config.camera_mjpeg, config.camera_buffer_size),
+    "file": lambda config: FileSource(config.source_path, loop=config.source_loop),
+    "synthetic": lambda config: SyntheticSource(config.camera_width or 640, config.camera_height or 480,
+                                                config.camera_fps or 30),
+}
+
+
+def create_source(config):
+    factory = SOURCES.get(config.frame_source)
+    if factory is None:
+        raise ValueError(f"Неизвестный источник: {config.frame_source} (доступны: {', '.join(SOURCES)})")
+    return factory(config)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Частота и пропуски кадров источника")
+    parser.add_argument("source", nargs="?", default="0",
+                        help="номер камеры, видео, каталог изображений или synthetic")
+    parser.add_argument("--width", type=int, default=0)
+    parser.add_argument("--height", type=int, default=0)
+    parser.add_argument("--fps", type=int, default=0)
+    parser.add_argument("--mjpeg", action="store_true")
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--work-ms", type=float, default=0.0, help="имитация обработки кадра")
+    args = parser.parse_args()
+
+    if args.source == "synthetic":
+        source = SyntheticSource(args.width or 640, args.height or 480, args.fps or 30)
+    elif args.source.isdigit():
+        source = CameraSource(int(args.source), args.width, args.height, args.fps, args.mjpeg)
+    else:
+        source = FileSource(args.source, loop=True, fps=args.fps)
+
+    if not source.is_opened():
+        raise SystemExit(f"Не удалось открыть источник: {args.source}")
+
+    deadline = time.perf_counter() + args.seconds
+    try:
+        while time.perf_counter() < deadline:
+            ret, frame = source.read()
+            if not ret:
+                break
+            if args.work_ms:
+                time.sleep(args.work_ms / 1000)
+    finally:
+        print(source.stats())
+        source.release()
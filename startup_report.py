@@ -0,0 +1,70 @@
+import re
+import subprocess
+import sys
+import time
+
+IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|\s*(\S+)")
+
+def measure_imports(module="main"):
+    """
+    Импортирует модуль в отдельном интерпретаторе с -X importtime
+
+    Returns:
+        Словарь "пакет верхнего уровня -> суммарное собственное время
+        импорта его модулей в мс"
+    """
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True
+    )
+    if completed.returncode != 0:
+        print(completed.stderr)
+        raise RuntimeError(f"Не удалось импортировать {module}")
+
+    packages = {}
+    for line in completed.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match is None:
+            continue
+        package = match.group(3).split(".")[0]
+        packages[package] = packages.get(package, 0.0) + int(match.group(1)) / 1000
+    return packages
+
+def measure_first_frame(camera_index=0):
+    """Время открытия камеры и получения первого кадра в секундах"""
+    import cv2
+
+    start = time.perf_counter()
+    cap = cv2.VideoCapture(camera_index)
+    opened = time.perf_counter()
+    ret, _ = cap.read() if cap.isOpened() else (False, None)
+    first_frame = time.perf_counter()
+    cap.release()
+
+    if not ret:
+        return None
+    return opened - start, first_frame - opened
+
+def print_report(module="main", top=15, with_camera=False):
+    packages = measure_imports(module)
+    total = sum(packages.values())
+
+    print(f"Импорт {module}: {total:.0f} мс")
+    for package, own in sorted(packages.items(), key=lambda item: -item[1])[:top]:
+        print(f"{own:10.1f} мс  {package}")
+
+    heavy = packages.keys() & {"torch", "transformers"}
+    if heavy:
+        print(f"Внимание: при старте импортируются {', '.join(sorted(heavy))}")
+
+    if with_camera:
+        timing = measure_first_frame()
+        if timing is None:
+            print("Камера недоступна")
+        else:
+            open_time, read_time = timing
+            print(f"Открытие камеры: {open_time * 1000:.0f} мс, первый кадр: {read_time * 1000:.0f} мс")
+            print(f"До первого кадра: {total + (open_time + read_time) * 1000:.0f} мс")
+
+if __name__ == '__main__':
+    print_report(with_camera="--camera" in sys.argv)
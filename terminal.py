@@ -0,0 +1,161 @@
+import sys
+import cv2
+import numpy as np
+import ascii_filters
+
+ESC = b"\x1b["
+CLEAR_SCREEN = b"\x1b[2J"
+HIDE_CURSOR = b"\x1b[?25l"
+SHOW_CURSOR = b"\x1b[?25h"
+RESET_STYLE = b"\x1b[0m"
+
+# Высота символа терминала примерно вдвое больше ширины
+TERMINAL_CELL_ASPECT = 2.0
+
+_CHAR_BYTES = [char.encode("ascii") for char in ascii_filters.ASCII_CHARS]
+
+
+class AnsiRenderer:
+    """
+    Текстовый ASCII-вывод с цветом ANSI truecolor
+
+    Помнит предыдущую сетку символов и цветов и отправляет только
+    изменившиеся клетки: курсор переводится к началу каждой серии
+    подряд идущих изменений, а код цвета пишется, только когда цвет
+    отличается от последнего выведенного. Цвета квантуются с шагом
+    color_step, чтобы шум камеры не вызывал перерисовку.
+    """
+
+    def __init__(self, stream=None, color_step=8):
+        """
+        Args:
+            stream: Двоичный поток вывода (по умолчанию sys.stdout.buffer)
+            color_step: Шаг квантования цвета (1 - без квантования)
+        """
+        self.stream = stream if stream is not None else sys.stdout.buffer
+        self.color_step = max(1, color_step)
+        # Середина каждого интервала квантования
+        self._color_lut = np.minimum(np.arange(256) // self.color_step * self.color_step
+                                     + self.color_step // 2, 255).astype(np.uint8)
+
+        self._indices = None
+        self._colors = None
+
+        # Статистика
+        self.frames = 0
+        self.cells_sent = 0
+        self.bytes_sent = 0
+
+    def reset(self):
+        """Следующий кадр будет выведен целиком"""
+        self._indices = None
+        self._colors = None
+
+    def encode(self, indices, colors):
+        """
+        Байты ANSI, переводящие терминал от предыдущего кадра к текущему
+
+        Args:
+            indices: Индексы символов ASCII_CHARS, (h, w)
+            colors: Цвета клеток BGR, (h, w, 3)
+        """
+        quantized = cv2.LUT(colors, self._color_lut)
+
+        if self._indices is None or self._indices.shape != indices.shape:
+            changed = np.ones(indices.shape, dtype=bool)
+            prefix = HIDE_CURSOR + CLEAR_SCREEN
+        else:
+            changed = indices != self._indices
+            changed |= (quantized != self._colors).any(axis=2)
+            prefix = b""
+
+        self._indices = indices.copy()
+        self._colors = quantized
+
+        rows, cols = np.nonzero(changed)
+        if len(rows) == 0:
+            return prefix
+
+        # Серия продолжается, если клетка стоит сразу за предыдущей измененной
+        jump = np.ones(len(rows), dtype=bool)
+        jump[1:] = (rows[1:] != rows[:-1]) | (cols[1:] != cols[:-1] + 1)
+
+        cell_colors = quantized[rows, cols]
+        new_color = np.ones(len(rows), dtype=bool)
+        new_color[1:] = (cell_colors[1:] != cell_colors[:-1]).any(axis=1)
+
+        parts = [prefix]
+        for row, col, char, (b, g, r), is_jump, is_new_color in zip(
+                rows.tolist(), cols.tolist(), indices[rows, cols].tolist(),
+                cell_colors.tolist(), jump.tolist(), new_color.tolist()):
+            if is_jump:
+                parts.append(b"%s%d;%dH" % (ESC, row + 1, col + 1))
+            if is_new_color:
+                parts.append(b"%s38;2;%d;%d;%dm" % (ESC, r, g, b))
+            parts.append(_CHAR_BYTES[char])
+
+        self.cells_sent += len(rows)
+        return b"".join(parts)
+
+    def write(self, indices, colors):
+        """Выводит кадр в поток; возвращает число отправленных байт"""
+        data = self.encode(indices, colors)
+        self.stream.write(data)
+        self.stream.flush()
+        self.frames += 1
+        self.bytes_sent += len(data)
+        return len(data)
+
+    def write_frame(self, config, frame, workers=1):
+        """Строит сетку символов для кадра BGR и выводит ее"""
+        indices, colors = ascii_filters.get_ascii_grid(config, frame, workers, TERMINAL_CELL_ASPECT)
+        return self.write(indices, colors)
+
+    def close(self):
+        """Возвращает терминалу обычный стиль и курсор"""
+        self.stream.write(RESET_STYLE + SHOW_CURSOR + b"\n")
+        self.stream.flush()
+
+    def stats(self):
+        frames = self.frames
+        return {
+            "frames": frames,
+            "cells_per_frame": self.cells_sent / frames if frames else 0.0,
+            "bytes_per_frame": self.bytes_sent / frames if frames else 0.0,
+        }
+
+
+if __name__ == '__main__':
+    import argparse
+    from config import Config
+
+    parser = argparse.ArgumentParser(description="ASCII-видео в терминал или поток байт (ANSI truecolor)")
+    parser.add_argument("input", nargs="?", default="0", help="видеофайл или номер камеры")
+    parser.add_argument("--output", help="файл для вывода вместо stdout")
+    parser.add_argument("--size", type=int, default=8, help="ширина клетки в пикселях кадра")
+    parser.add_argument("--color-step", type=int, default=8)
+    args = parser.parse_args()
+
+    config = Config()
+    config.ascii_size = args.size
+    cap = cv2.VideoCapture(int(args.input) if args.input.isdigit() else args.input)
+    stream = open(args.output, "wb") if args.output else None
+    renderer = AnsiRenderer(stream, args.color_step)
+
+    try:
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            renderer.write_frame(config, frame)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        renderer.close()
+        cap.release()
+        if stream is not None:
+            stream.close()
+
+    stats = renderer.stats()
+    print(f"Кадров: {stats['frames']}, клеток на кадр: {stats['cells_per_frame']:.0f}, "
+          f"байт на кадр: {stats['bytes_per_frame']:.0f}", file=sys.stderr)
@@ -0,0 +1,17 @@
+import pytest
+
+import benchmark
+
+HEIGHT, WIDTH = 240, 320
+CASES = benchmark.allocation_cases(HEIGHT, WIDTH)
+
+
+@pytest.fixture(scope="module")
+def frames():
+    return [benchmark.synthetic_frame(HEIGHT, WIDTH, i) for i in range(3)]
+
+
+@pytest.mark.parametrize("name", list(CASES))
+def test_no_steady_state_allocations(name, frames):
+    allocated = benchmark.steady_state_allocations(CASES[name], frames, iterations=5, warmup=6)
+    assert allocated < benchmark.ALLOCATION_LIMIT
@@ -0,0 +1,57 @@
+import cv2
+import numpy as np
+import pytest
+
+import anime_filters
+import batch
+
+
+class BrightSquareCascade:
+    """Вместо каскада Хаара: "лицо" - рамка светлого квадрата в кадре"""
+
+    def detectMultiScale(self, image, **kwargs):
+        x, y, w, h = cv2.boundingRect((image > 200).view(np.uint8))
+        return np.array([[x, y, w, h]]) if w > 0 else np.empty((0, 4), dtype=int)
+
+
+@pytest.fixture
+def footage(tmp_path):
+    """Кадры с "лицом", которое движется рывками, чтобы сглаживание рамок влияло на результат"""
+    rng = np.random.default_rng(0)
+    background = rng.integers(0, 160, (120, 160, 3), dtype=np.uint8)
+    face = np.full((30, 30, 3), 250, dtype=np.uint8)
+    face[8:12, 6:12] = face[8:12, 18:24] = 210
+    face[20:23, 8:22] = 215
+    for i in range(40):
+        frame = background.copy()
+        x = 20 + (i * 7) % 90 + int(rng.integers(0, 5))
+        y = 30 + int(10 * np.sin(i / 3))
+        frame[y:y + 30, x:x + 30] = face
+        cv2.imwrite(str(tmp_path / f"{i:04d}.png"), frame)
+    return str(tmp_path)
+
+
+@pytest.fixture
+def fake_cascade(monkeypatch):
+    monkeypatch.setattr(anime_filters, "load_face_cascade", BrightSquareCascade)
+    anime_filters._filter_cache.clear()
+    yield
+    anime_filters._filter_cache.clear()
+
+
+@pytest.mark.parametrize("chunk_size", [7, 13])
+def test_chunks_match_sequential_with_faces(footage, fake_cascade, chunk_size):
+    values = {"anime_on": True, "anime_style": 1, "face_detect_interval": 3, "face_detect_scale": 1.0}
+    total, _ = batch.count_frames(footage)
+
+    sequential = [result.copy() for _, _, result in batch.render_chunk(footage, 0, total, values)]
+    chunked = []
+    for start in range(0, total, chunk_size):
+        chunked += [result.copy() for _, _, result in
+                    batch.render_chunk(footage, start, min(total, start + chunk_size), values)]
+
+    faces = sum(f.face_effect_faces for _, f in anime_filters._filter_cache.values())
+    assert faces > 0, "лица не найдены - проверка ничего не проверяет"
+    assert len(chunked) == len(sequential)
+    for index, (expected, actual) in enumerate(zip(sequential, chunked)):
+        assert np.array_equal(expected, actual), f"кадр {index}"
@@ -0,0 +1,74 @@
+import time
+
+import numpy as np
+
+from pipeline import Pipeline
+
+
+def read_frame():
+    time.sleep(0.002)
+    return True, np.zeros((4, 4, 3), dtype=np.uint8)
+
+
+def drain(pipeline, seconds):
+    """Забирает кадры, пока поток не кончится или не выйдет время; число кадров"""
+    frames = 0
+    deadline = time.monotonic() + seconds
+    while not pipeline.finished and time.monotonic() < deadline:
+        frames += pipeline.get() is not None
+    return frames
+
+
+def test_failing_stage_finishes_pipeline():
+    """Стадия, падающая на каждом кадре, закрывает поток, и вывод не ждет вечно"""
+    def fail(packet):
+        raise ValueError("stage failed")
+
+    pipeline = Pipeline(read_frame, [("filter", fail), ("overlay", lambda packet: packet)], max_errors=3)
+    pipeline.start()
+    try:
+        drain(pipeline, 2.0)
+        assert pipeline.finished
+        assert pipeline.stats()["errors"] == {"filter": 3, "overlay": 0}
+    finally:
+        pipeline.stop()
+
+
+def test_stage_error_drops_only_that_frame():
+    calls = []
+
+    def flaky(packet):
+        calls.append(packet.seq)
+        if len(calls) % 2 == 0:
+            raise RuntimeError("flaky")
+        return packet
+
+    pipeline = Pipeline(read_frame, [("filter", flaky)], max_errors=3)
+    pipeline.start()
+    try:
+        frames = drain(pipeline, 0.3)
+        assert not pipeline.finished
+        assert frames > 0 and pipeline.stats()["errors"]["filter"] > 0
+    finally:
+        pipeline.stop()
+
+
+def test_packet_reports_slowest_stage_time():
+    """Стадии идут параллельно: кадр несет время самой долгой стадии, а не сумму"""
+    def sleeper(seconds):
+        def stage(packet):
+            time.sleep(seconds)
+            return packet
+        return stage
+
+    pipeline = Pipeline(read_frame, [("fast", sleeper(0.01)), ("slow", sleeper(0.05))])
+    pipeline.start()
+    try:
+        packet = None
+        deadline = time.monotonic() + 2.0
+        while packet is None and time.monotonic() < deadline:
+            packet = pipeline.get()
+        assert packet is not None
+        assert 0.05 <= packet.stage_time < 0.06
+    finally:
+        pipeline.stop()
@@ -0,0 +1,44 @@
+import multiprocessing
+import uuid
+
+import numpy as np
+
+from sinks import SharedMemoryReader, SharedMemorySink
+
+SHAPES = [(10, 10, 3), (10, 10, 3), (40, 30, 3), (40, 30), (80, 60, 3)]
+
+
+def write_frames(name, commands, done):
+    """Писатель в отдельном процессе: кадр формы SHAPES[i] с байтами i + 1 по команде i"""
+    sink = SharedMemorySink(name, slots=4)
+    for i in iter(commands.get, None):
+        sink.send(np.full(SHAPES[i], i + 1, dtype=np.uint8))
+        done.put(sink.generation)
+    sink.close()
+
+
+def test_shared_memory_grows_for_larger_frames():
+    """Кадр больше слота пересоздает сегмент, а читатель переподключается и не теряет кадры"""
+    name = f"test_{uuid.uuid4().hex[:8]}"
+    context = multiprocessing.get_context("spawn")
+    commands, done = context.Queue(), context.Queue()
+    writer = context.Process(target=write_frames, args=(name, commands, done))
+    writer.start()
+    reader = None
+    try:
+        for i, shape in enumerate(SHAPES):
+            commands.put(i)
+            generation = done.get(timeout=10)
+            if reader is None:
+                reader = SharedMemoryReader(name)
+            seq, frame = reader.read(timeout=1.0, copy=True)
+            assert seq == i + 1
+            assert frame.shape == shape and (frame == i + 1).all()
+        assert generation == 3
+        assert reader.stats()["dropped"] == 0
+        assert reader.stats()["reattached"] == 2
+    finally:
+        if reader is not None:
+            reader.close()
+        commands.put(None)
+        writer.join(timeout=10)
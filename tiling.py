@@ -0,0 +1,161 @@
+from concurrent.futures import ThreadPoolExecutor
+import time
+import cv2
+import numpy as np
+from buffers import get_buffer, output_buffer
+
+# Границы полос и поля выравниваются по строкам, кратным ROW_ALIGN, чтобы
+# фильтры, уменьшающие кадр (guided/proxy-сглаживание), видели ту же сетку
+ROW_ALIGN = 8
+
+_executors = []
+
+
+def get_executors(workers):
+    """
+    Общие потоки для полос: по однопоточному исполнителю на номер полосы
+
+    Полоса i всегда обрабатывается в потоке i, поэтому ее временные
+    буферы (у пула буферов они свои у каждого потока) после первого
+    кадра переиспользуются, а не создаются заново, когда полоса
+    достается другому потоку.
+    """
+    while len(_executors) < workers:
+        _executors.append(ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"tile{len(_executors)}"))
+    return _executors[:workers]
+
+
+def run_on_stripes(func, count):
+    """Вызывает func(i) для полос 0..count-1, полосу i - в потоке i; список результатов"""
+    futures = [executor.submit(func, i) for i, executor in enumerate(get_executors(count))]
+    return [future.result() for future in futures]
+
+
+def stripe_bounds(height, stripes):
+    """Границы горизонтальных полос, выровненные по ROW_ALIGN"""
+    bounds = [0]
+    for i in range(1, stripes):
+        y = int(round(height * i / stripes / ROW_ALIGN)) * ROW_ALIGN
+        if bounds[-1] < y < height:
+            bounds.append(y)
+    bounds.append(height)
+    return bounds
+
+
+def run_striped(func, frame, halo, workers, dst=None):
+    """
+    Применяет покадровый фильтр по горизонтальным полосам в пуле потоков
+
+    Каждая полоса обрабатывается вместе с halo строками соседей сверху
+    и снизу, которые затем отбрасываются. Если halo не меньше радиуса
+    окна фильтра, результат совпадает с обработкой всего кадра (швов нет).
+
+    Args:
+        func: Фильтр func(frame, dst=None) -> кадр той же формы и типа
+        frame: Кадр
+        halo: Число строк перекрытия
+        workers: Число потоков (<= 1 - без деления на полосы)
+        dst: Массив для результата (None - создать новый)
+    """
+    height = frame.shape[0]
+    halo = -(-halo // ROW_ALIGN) * ROW_ALIGN
+    bounds = stripe_bounds(height, workers) if workers > 1 else [0, height]
+    if len(bounds) <= 2:
+        return func(frame, dst=dst)
+
+    result = output_buffer(dst, frame.shape, frame.dtype)
+
+    def run(i):
+        y0, y1 = bounds[i], bounds[i + 1]
+        top = max(0, y0 - halo)
+        bottom = min(height, y1 + halo)
+        # Полоса с полями - во временный буфер потока, в результат - без полей
+        stripe = get_buffer("stripe", (bottom - top,) + frame.shape[1:], frame.dtype)
+        part = func(frame[top:bottom], dst=stripe)
+        result[y0:y1] = part[y0 - top:y1 - top]
+
+    run_on_stripes(run, len(bounds) - 1)
+    return result
+
+
+def map_striped(func, frame, workers):
+    """Применяет func к полосам без перекрытия и возвращает список результатов (шаг reduce)"""
+    bounds = stripe_bounds(frame.shape[0], workers) if workers > 1 else [0, frame.shape[0]]
+    if len(bounds) <= 2:
+        return [func(frame)]
+    return run_on_stripes(lambda i: func(frame[bounds[i]:bounds[i + 1]]), len(bounds) - 1)
+
+
+def median_blur(frame, ksize, workers=1, dst=None):
+    return run_striped(lambda stripe, dst=None: cv2.medianBlur(stripe, ksize, dst=dst),
+                       frame, ksize // 2, workers, dst)
+
+
+def benchmark(frame, cases, worker_counts=(1, 2, 4, 8), repeats=5):
+    """
+    Замеряет ускорение полосной обработки от числа потоков
+
+    Args:
+        cases: Список (имя, функция(frame, workers) -> кадр)
+
+    Returns:
+        Список словарей: случай, потоки, медиана времени (мс), ускорение
+        относительно одного потока и максимальное отличие от результата
+        без деления на полосы
+    """
+    report = []
+    for name, func in cases:
+        reference = func(frame, 1)
+        base_ms = None
+        for workers in worker_counts:
+            result = func(frame, workers)
+            times = []
+            for _ in range(repeats):
+                start = time.perf_counter()
+                func(frame, workers)
+                times.append(time.perf_counter() - start)
+            ms = float(np.median(times) * 1000)
+            base_ms = base_ms or ms
+            report.append({
+                "case": name,
+                "workers": workers,
+                "ms": ms,
+                "speedup": base_ms / ms,
+                "max_diff": int(np.abs(result.astype(np.int16) - reference).max()),
+            })
+    return report
+
+
+if __name__ == '__main__':
+    import argparse
+    import anime_filters
+    import ascii_filters
+
+    parser = argparse.ArgumentParser(description="Масштабирование полосной обработки по числу ядер")
+    parser.add_argument("image", nargs="?", help="изображение (по умолчанию - синтетический кадр 1080p)")
+    parser.add_argument("--workers", default="1,2,4,8")
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    if args.image:
+        frame = cv2.imread(args.image)
+    else:
+        rng = np.random.default_rng(0)
+        frame = cv2.GaussianBlur(rng.integers(0, 256, (1080, 1920, 3), dtype=np.uint8), (9, 9), 0)
+
+    simple = anime_filters.SimpleAnimeFilter()
+    kawaii = anime_filters.KawaiiAnimeFilter()
+    cartoon = anime_filters.CartoonAnimeFilter()
+    cases = [
+        ("simple", simple.apply_tiled),
+        ("kawaii", kawaii.apply_tiled),
+        ("cartoon", cartoon.apply_tiled),
+        ("enhance", lambda f, workers: ascii_filters.enhance(f, workers)),
+        ("median_9", lambda f, workers: median_blur(f, 9, workers)),
+    ]
+
+    worker_counts = [int(w) for w in args.workers.split(",")]
+    print(f"{'случай':<10} {'потоки':>6} {'мс':>8} {'ускорение':>10} {'разница':>8}")
+    for row in benchmark(frame, cases, worker_counts, args.repeats):
+        print(f"{row['case']:<10} {row['workers']:6d} {row['ms']:8.1f} "
+              f"{row['speedup']:9.2f}x {row['max_diff']:8d}")